@@ -0,0 +1,297 @@
+"""GUI-free analysis core: model loading, inference and class counting.
+
+Nothing here imports PyQt6, and numpy, cv2 and ultralytics are only imported
+when first needed, so the module is cheap to import from the desktop app,
+the batch CLI or any other headless tool.
+"""
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_MODEL_PATH = "best(1).pt"
+
+# Thresholds the counts are reported at unless the user changes them
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.7
+# The model itself runs with a low confidence floor and without NMS (IoU 1.0
+# suppresses nothing) so the thresholds above can be moved afterwards without
+# re-inference. Greedy NMS only looks at higher-confidence boxes, so keeping
+# the best RAW_MAX_DET candidates is exact while MAX_DET boxes survive in them
+RAW_CONF = 0.05
+RAW_IOU = 1.0
+RAW_MAX_DET = 3000
+# Detections kept per image, as ultralytics' default max_det
+MAX_DET = 300
+
+# Class ids produced by the trained model
+CLASS_LIVE = 0        # Trik
+CLASS_DEAD = 1        # O'lik
+CLASS_IMMATURE = 2    # Yetilmagan
+CLASS_NAMES = {
+    CLASS_LIVE: "Trik",
+    CLASS_DEAD: "O'lik",
+    CLASS_IMMATURE: "Yetilmagan",
+}
+
+
+def count_classes(classes):
+    """Return ``(live, dead, immature)`` counts for an array of class ids."""
+    import numpy as np
+
+    classes = np.asarray(classes, dtype=np.int64)
+    counts = np.bincount(classes, minlength=3)
+    return int(counts[CLASS_LIVE]), int(counts[CLASS_DEAD]), int(counts[CLASS_IMMATURE])
+
+
+def percentage(count, total):
+    return round(count / total * 100) if total else 0
+
+
+def read_image(path):
+    """Decode an image file into a BGR ndarray (see ``image_buffer``)."""
+    from image_buffer import decode_image
+
+    return decode_image(path)
+
+
+class AnalysisResult:
+    """Raw detections for one image and the counts at the current thresholds.
+
+    ``detections`` is a ``detections.DETECTION_DTYPE`` structured array with
+    everything the model returned; ``apply_thresholds`` recomputes the counts
+    for another confidence/IoU pair without running the model again.
+    ``boxes``, ``classes`` and ``confidences`` are the detections that pass
+    the current thresholds. ``exact`` is false when they come from the Fast
+    NMS approximation used while a threshold slider is being dragged.
+    """
+
+    def __init__(self, boxes, classes, confidences, image_shape=None,
+                 conf=DEFAULT_CONF, iou=DEFAULT_IOU):
+        from detections import pack
+
+        self.detections = pack(boxes, classes, confidences)
+        self.image_shape = image_shape
+        self.apply_thresholds(conf, iou)
+
+    @classmethod
+    def from_detections(cls, detections, image_shape=None, conf=DEFAULT_CONF, iou=DEFAULT_IOU):
+        """Wrap an already packed detection array (a worker process, the cache, the
+        archive). Unlike the constructor this does not recompute ``suppress_iou``."""
+        result = cls.__new__(cls)
+        result.detections = detections
+        result.image_shape = image_shape
+        result.apply_thresholds(conf, iou)
+        return result
+
+    @classmethod
+    def from_yolo(cls, result, conf=DEFAULT_CONF, iou=DEFAULT_IOU):
+        boxes = result.boxes.cpu()
+        return cls(
+            boxes.xyxy.numpy(),
+            boxes.cls.numpy().astype("int64"),
+            boxes.conf.numpy(),
+            tuple(result.orig_shape),
+            conf,
+            iou,
+        )
+
+    def apply_thresholds(self, conf, iou, exact=True):
+        from detections import class_counts, nms_mask, threshold_mask
+
+        self.conf_threshold = conf
+        self.iou_threshold = iou
+        self.exact = exact
+        if exact:
+            self.mask = nms_mask(self.detections, conf, iou, MAX_DET)
+        else:
+            self.mask = threshold_mask(self.detections, conf, iou)
+        counts = class_counts(self.detections, self.mask)
+        self.live_count = int(counts[CLASS_LIVE])
+        self.dead_count = int(counts[CLASS_DEAD])
+        self.immature_count = int(counts[CLASS_IMMATURE])
+        return self.counts
+
+    @property
+    def boxes(self):
+        return self.detections["box"][self.mask]
+
+    @property
+    def classes(self):
+        return self.detections["cls"][self.mask].astype("int64")
+
+    @property
+    def confidences(self):
+        return self.detections["conf"][self.mask]
+
+    @property
+    def total_count(self):
+        return self.live_count + self.dead_count + self.immature_count
+
+    @property
+    def counts(self):
+        return self.live_count, self.dead_count, self.immature_count
+
+    @property
+    def percentages(self):
+        total = self.total_count
+        return tuple(percentage(count, total) for count in self.counts)
+
+
+class SpermAnalyzer:
+    """Loads the YOLO model on demand and turns images into AnalysisResults.
+
+    ``backend`` selects one of ``backends.BACKENDS``; ``self.backend`` holds
+    the backend actually in use once loaded (PyTorch if an export failed).
+
+    With a ``detection_cache.DetectionCache`` as ``cache``, image files that
+    were analyzed before with the same weights and settings skip inference.
+
+    ``conf`` and ``iou`` are the thresholds new results are counted at; the
+    model always runs at ``RAW_CONF``/``RAW_IOU`` or looser.
+
+    Calls into the model are serialized with a lock because a YOLO predictor
+    is not safe to use from several threads at once.
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, backend="pytorch", cache=None,
+                 conf=DEFAULT_CONF, iou=DEFAULT_IOU, **predict_kwargs):
+        self.model_path = model_path
+        self.requested_backend = backend
+        self.backend = None
+        self.cache = cache
+        self.conf = conf
+        self.iou = iou
+        self.predict_kwargs = {
+            "verbose": False,
+            "conf": min(conf, RAW_CONF),
+            "iou": max(iou, RAW_IOU),
+            "max_det": RAW_MAX_DET,
+            **predict_kwargs,
+        }
+        self.model = None
+        self._model_hash = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self.model is not None
+
+    def load(self):
+        with self._lock:
+            if self.model is None:
+                from backends import DEFAULT_IMGSZ, load_model
+                imgsz = self.predict_kwargs.get("imgsz") or DEFAULT_IMGSZ
+                self.model, self.backend = load_model(
+                    self.model_path, self.requested_backend, imgsz
+                )
+        return self
+
+    def infer(self, sources, **kwargs):
+        """Run the model on one source or a list of sources (paths or arrays)."""
+        if self.model is None:
+            self.load()
+        options = {**self.predict_kwargs, **kwargs}
+        with self._lock:
+            return self.model.predict(sources, **options)
+
+    def postprocess(self, raw_results):
+        return [AnalysisResult.from_yolo(result, self.conf, self.iou) for result in raw_results]
+
+    def _cache_key(self, path, options):
+        from backends import file_hash
+        from detection_cache import image_hash, make_key
+
+        if self._model_hash is None:
+            self._model_hash = file_hash(self.model_path)
+        options = {k: v for k, v in {**self.predict_kwargs, **options}.items() if k != "verbose"}
+        return make_key(image_hash(path), self._model_hash,
+                        self.backend or self.requested_backend, options)
+
+    def cached(self, path, **options):
+        """Return the cached AnalysisResult for an image file, or ``None``.
+
+        ``options`` must match what was passed to ``remember``; tiled results
+        include ``tile_size`` so they never mix with single-pass ones.
+        """
+        if self.cache is None:
+            return None
+        entry = self.cache.get(self._cache_key(path, options))
+        return AnalysisResult.from_detections(*entry, self.conf, self.iou) if entry else None
+
+    def remember(self, path, result, seconds, **options):
+        if self.cache is None:
+            return
+        self.cache.put(self._cache_key(path, options), result.detections, result.image_shape,
+                       seconds)
+
+    def analyze(self, source, **kwargs):
+        is_file = isinstance(source, (str, Path))
+        if is_file:
+            result = self.cached(source, **kwargs)
+            if result is not None:
+                return result
+        start = time.perf_counter()
+        result = self.postprocess(self.infer(source, **kwargs))[0]
+        if is_file:
+            self.remember(source, result, time.perf_counter() - start, **kwargs)
+        return result
+
+    def analyze_batch(self, sources, **kwargs):
+        sources = list(sources)
+        results = [None] * len(sources)
+        if self.cache is not None:
+            for i, source in enumerate(sources):
+                if isinstance(source, (str, Path)):
+                    results[i] = self.cached(source, **kwargs)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            start = time.perf_counter()
+            fresh = self.postprocess(self.infer([sources[i] for i in missing], **kwargs))
+            seconds = (time.perf_counter() - start) / len(missing)
+            for i, result in zip(missing, fresh):
+                results[i] = result
+                if isinstance(sources[i], (str, Path)):
+                    self.remember(sources[i], result, seconds, **kwargs)
+        return results
+
+    def analyze_tiled(self, image, tile_size=None, overlap=None, batch_size=16, path=None,
+                      **kwargs):
+        """Analyze a large frame tile by tile (see ``tiling``).
+
+        ``image`` is a path or a decoded BGR array; frames that fit in one
+        tile take a single pass. Results are cached when the image is a path
+        or ``path`` names the file an already decoded array came from.
+        """
+        from image_buffer import contiguous
+        from tiling import DEFAULT_OVERLAP, DEFAULT_TILE_SIZE, tiled_detections
+
+        tile_size = tile_size or DEFAULT_TILE_SIZE
+        overlap = DEFAULT_OVERLAP if overlap is None else overlap
+        # Tiles are suppressed at the analyzer's thresholds, so those are part of the key
+        cache_options = {**kwargs, "tile_size": tile_size, "tile_overlap": overlap,
+                         "tile_thresholds": [self.conf, self.iou]}
+        if not hasattr(image, "shape"):
+            path = image
+            image = None
+        if path is not None:
+            result = self.cached(path, **cache_options)
+            if result is not None:
+                return result
+        if image is None:
+            image = read_image(path)
+
+        start = time.perf_counter()
+        height, width = image.shape[:2]
+        if height <= tile_size and width <= tile_size:
+            result = self.postprocess(self.infer(contiguous(image), **kwargs))[0]
+        else:
+            boxes, classes, confidences = tiled_detections(
+                lambda tiles: self.infer(tiles, **kwargs),
+                image, tile_size, overlap, batch_size,
+                conf=self.conf, iou=self.iou, max_det=MAX_DET,
+            )
+            result = AnalysisResult(boxes, classes, confidences, (height, width),
+                                    self.conf, self.iou)
+        if path is not None:
+            self.remember(path, result, time.perf_counter() - start, **cache_options)
+        return result
@@ -0,0 +1,61 @@
+"""Recommended inference settings, written by ``sweep.py`` and read at startup.
+
+The file is plain JSON, e.g.::
+
+    {"backend": "onnx", "imgsz": 640, "threads": 4, "batch_size": 8}
+
+Environment variables (``SPERMAI_BACKEND``, ``SPERMAI_TILE_SIZE``, ...) and
+command-line flags still win; the file only replaces the built-in defaults.
+A missing or unreadable file means no recommendation.
+"""
+import json
+import os
+import tempfile
+from pathlib import Path
+
+CONFIG_PATH = Path(os.environ.get("SPERMAI_CONFIG", "spermai_config.json"))
+# Keys the app and the CLIs understand, with their types
+KEYS = {"backend": str, "imgsz": int, "threads": int, "batch_size": int, "tile_size": int}
+
+
+def load_config(path=None):
+    """The recommended settings as a dict; unknown keys are dropped."""
+    try:
+        data = json.loads(Path(path or CONFIG_PATH).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    config = {}
+    for key, cast in KEYS.items():
+        if data.get(key) is not None:
+            try:
+                config[key] = cast(data[key])
+            except (TypeError, ValueError):
+                pass
+    return config
+
+
+def save_config(config, path=None, **extra):
+    """Write ``config`` (plus ``extra`` provenance fields) atomically."""
+    path = Path(path or CONFIG_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {key: config[key] for key in KEYS if config.get(key) is not None}
+    data.update(extra)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return path
+
+
+def setting(config, key, env=None, default=None):
+    """``env`` variable if set, else the config value, else ``default``."""
+    value = os.environ.get(env) if env else None
+    if value:
+        return KEYS[key](value)
+    return config.get(key, default)
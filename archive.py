@@ -0,0 +1,315 @@
+"""Content-addressed, crash-safe storage of saved analyses.
+
+Layout under ``results/``::
+
+    objects/ab/<sha256>.jpg     every distinct image, stored once
+    analysis_<ts>.jpg           hard link to its object (<ts>_2... for saves
+                                within the same second)
+    analysis_<ts>.npz           every raw detection, one array per column
+    data_<ts>.txt               the summary text, as before
+
+Saving the same image twice adds a link, not a copy; on filesystems without
+hard links (FAT/exFAT drives) the object is copied instead. Objects are
+copied from the source rather than linked to it, so editing or deleting the
+original later never changes the archive.
+
+Every file is written to a temporary name, fsynced and renamed into place,
+and the summary text is written last, so an interrupted save leaves either
+no ``data_<ts>.txt`` or a complete set. ``prune`` removes objects no saved
+analysis links to any more.
+
+Usage:
+    python archive.py                    # disk use of results/
+    python archive.py --prune            # delete unreferenced objects
+    python archive.py --bench 40         # save latency and disk use, old vs new
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+RESULTS_DIR = Path("results")
+OBJECTS_DIR_NAME = "objects"
+# Columns of detections.DETECTION_DTYPE, stored side by side in the .npz
+COLUMNS = ("box", "cls", "conf", "suppress_iou")
+# mkstemp creates files readable by the owner only; archived files get the
+# usual permissions. Read once: os.umask can only be queried by setting it
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+
+def _fsync_dir(directory):
+    # Makes the rename itself durable; not possible on Windows
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, write, mode="wb"):
+    """Call ``write(f)`` on a temporary file and rename it to ``path``."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.stem}.", suffix=".tmp", dir=path.parent)
+    try:
+        os.chmod(tmp_path, FILE_MODE)
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    _fsync_dir(path.parent)
+    return path
+
+
+def _copy_hashing(source, directory, chunk_size=1 << 20):
+    """Copy ``source`` into ``directory``; return the temp path and its SHA-256."""
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        os.chmod(tmp_path, FILE_MODE)
+        with open(source, "rb") as src, os.fdopen(fd, "wb") as dst:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return Path(tmp_path), digest.hexdigest()
+
+
+def object_path(results_dir, digest, suffix):
+    return Path(results_dir) / OBJECTS_DIR_NAME / digest[:2] / f"{digest}{suffix.lower()}"
+
+
+def store_object(source, results_dir=RESULTS_DIR):
+    """Path of the archived copy of ``source``, adding it if it is new.
+
+    The returned flag is ``True`` when an identical image was already stored.
+    """
+    from detection_cache import image_hash
+
+    suffix = Path(source).suffix or ".jpg"
+    # Memoized on path/mtime/size, so a re-saved image is not read again
+    existing = object_path(results_dir, image_hash(source), suffix)
+    if existing.exists():
+        return existing, True
+
+    objects_dir = Path(results_dir) / OBJECTS_DIR_NAME
+    objects_dir.mkdir(parents=True, exist_ok=True)
+    # Named by the bytes actually copied, in case the source changed meanwhile
+    tmp_path, digest = _copy_hashing(source, objects_dir)
+    path = object_path(results_dir, digest, suffix)
+    try:
+        path.parent.mkdir(exist_ok=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    _fsync_dir(path.parent)
+    return path, False
+
+
+def link_object(obj, path):
+    """Atomically make ``path`` a hard link to ``obj`` (a copy if links fail)."""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.link")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(obj, tmp_path)
+    except OSError:
+        shutil.copyfile(obj, tmp_path)
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+    return path
+
+
+def save_detections(path, detections, image_shape=None, conf=None, iou=None):
+    """Write a ``detections.DETECTION_DTYPE`` array column by column."""
+    import numpy as np
+
+    columns = {name: np.ascontiguousarray(detections[name]) for name in COLUMNS}
+    meta = {
+        "image_shape": np.asarray(image_shape or (), dtype=np.int64),
+        "thresholds": np.asarray([np.nan if conf is None else conf,
+                                  np.nan if iou is None else iou], dtype=np.float32),
+    }
+    return atomic_write(path, lambda f: np.savez(f, **columns, **meta))
+
+
+def load_detections(path):
+    """``(detections, image_shape, conf, iou)`` from a file ``save_detections`` wrote."""
+    import numpy as np
+
+    from detections import DETECTION_DTYPE
+
+    with np.load(path) as data:
+        detections = np.empty(len(data["cls"]), dtype=DETECTION_DTYPE)
+        for name in COLUMNS:
+            detections[name] = data[name]
+        image_shape = tuple(int(v) for v in data["image_shape"]) or None
+        conf, iou = (None if np.isnan(v) else float(v) for v in data["thresholds"])
+    return detections, image_shape, conf, iou
+
+
+def archive_paths(source, stem, results_dir=RESULTS_DIR):
+    """Where ``save_analysis`` puts the files of one analysis."""
+    results_dir = Path(results_dir)
+    return {
+        "image": results_dir / f"analysis_{stem}{(Path(source).suffix or '.jpg').lower()}",
+        "detections": results_dir / f"analysis_{stem}.npz",
+        "annotated": results_dir / f"analysis_{stem}_annotated.jpg",
+        "data": results_dir / f"data_{stem}.txt",
+    }
+
+
+def new_stem(source, results_dir=RESULTS_DIR, taken=(), when=None):
+    """A ``<YYYYmmdd_HHMMSS>`` stem no saved analysis uses yet.
+
+    Saves within the same second get ``_2``, ``_3``... appended. ``taken``
+    holds stems handed out but not yet on disk (saves still queued).
+    """
+    stem = base = (when or datetime.now()).strftime("%Y%m%d_%H%M%S")
+    suffix = 1
+    while stem in taken or any(p.exists() for p in archive_paths(source, stem, results_dir).values()):
+        suffix += 1
+        stem = f"{base}_{suffix}"
+    return stem
+
+
+def save_analysis(source, stem, summary, result=None, results_dir=RESULTS_DIR):
+    """Archive one analysis; return whether the image was already stored.
+
+    ``stem`` is the timestamp part of the file names (see ``archive_paths``)
+    and ``summary`` the text of ``data_<stem>.txt``.
+    """
+    paths = archive_paths(source, stem, results_dir)
+    Path(results_dir).mkdir(parents=True, exist_ok=True)
+    obj, duplicate = store_object(source, results_dir)
+    link_object(obj, paths["image"])
+    if result is not None:
+        save_detections(paths["detections"], result.detections, result.image_shape,
+                        result.conf_threshold, result.iou_threshold)
+    # Last: a complete data file means the whole analysis is on disk
+    atomic_write(paths["data"], lambda f: f.write(summary), mode="w")
+    return duplicate
+
+
+def prune(results_dir=RESULTS_DIR):
+    """Delete objects nothing links to; return ``(files, bytes)`` removed."""
+    removed = freed = 0
+    objects = Path(results_dir) / OBJECTS_DIR_NAME
+    # Temporary files are leftovers of an interrupted copy
+    for path in [*objects.glob("*.tmp"), *objects.glob("*/*")]:
+        try:
+            stat = path.stat()
+            if path.suffix == ".tmp" or stat.st_nlink <= 1:
+                path.unlink()
+                removed += 1
+                freed += stat.st_size
+        except OSError:
+            pass
+    return removed, freed
+
+
+def disk_usage(directory):
+    """``(apparent, physical)`` bytes: hard links are counted once in the latter."""
+    apparent = physical = 0
+    seen = set()
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            apparent += stat.st_size
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                physical += stat.st_size
+    # Object files themselves are the same bytes as their links
+    objects = Path(directory) / OBJECTS_DIR_NAME
+    if objects.exists():
+        apparent -= sum(p.stat().st_size for p in objects.glob("*/*"))
+    return apparent, physical
+
+
+def _legacy_save(source, stem, summary, results_dir, link=False):
+    # What save_results did before: a plain text write, then a copy of the
+    # image or a hard link to the user's original
+    results_dir.mkdir(parents=True, exist_ok=True)
+    (results_dir / f"data_{stem}.txt").write_text(summary, encoding="utf-8")
+    image_path = results_dir / f"analysis_{stem}.jpg"
+    if link:
+        os.link(source, image_path)
+    else:
+        shutil.copy2(source, image_path)
+
+
+def bench(saves, directory="images/train"):
+    """Save latency and disk use of ``saves`` saves, old layout vs archive."""
+    from batch_analyze import find_images
+
+    sources = [str(p) for p in find_images(directory)]
+    if not sources:
+        print(f"Papkada rasm topilmadi: {directory}", file=sys.stderr)
+        return 1
+    summary = "=== TAHLIL NATIJALARI ===\n"
+    with tempfile.TemporaryDirectory(prefix="spermai_archive_") as scratch:
+        modes = (
+            ("nusxa", _legacy_save),
+            ("havola", lambda s, stem, text, d: _legacy_save(s, stem, text, d, link=True)),
+            ("arxiv", lambda s, stem, text, d: save_analysis(s, stem, text, None, d)),
+        )
+        for name, save in modes:
+            target = Path(scratch) / name
+            timings = []
+            for i in range(saves):
+                t = time.perf_counter()
+                save(sources[i % len(sources)], f"{i:05d}", summary, target)
+                timings.append((time.perf_counter() - t) * 1000)
+            timings.sort()
+            _, physical = disk_usage(target)
+            print(f"{name:<7} {saves} saqlash ({len(sources)} xil rasm): "
+                  f"p50 {timings[len(timings) // 2]:.1f} ms, max {timings[-1]:.1f} ms, "
+                  f"disk {physical / 1e6:.1f} MB")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Saqlangan tahlillar arxivi")
+    parser.add_argument("--results", default=str(RESULTS_DIR))
+    parser.add_argument("--prune", action="store_true", help="Bog'lanmagan rasmlarni o'chirish")
+    parser.add_argument("--bench", type=int, default=0, metavar="N",
+                        help="N ta saqlash bilan eski va yangi usulni solishtirish")
+    parser.add_argument("--images", default="images/train", help="--bench uchun rasmlar papkasi")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        return bench(args.bench, args.images)
+    if args.prune:
+        removed, freed = prune(args.results)
+        print(f"O'chirildi: {removed} ta fayl, {freed / 1e6:.1f} MB")
+    apparent, physical = disk_usage(args.results)
+    print(f"{args.results}: fayllar {apparent / 1e6:.1f} MB, diskda {physical / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
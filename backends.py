@@ -0,0 +1,124 @@
+"""CPU inference backends with export-on-first-use and an on-disk cache.
+
+The PyTorch weights are exported once per backend and cached under
+``CACHE_DIR/<weights sha256>/<backend>_<imgsz>/``, so changing the weights
+file invalidates the cache automatically and later launches reuse the
+export. Any failure while exporting or loading an export falls back to the
+PyTorch path.
+
+Quantized backends (``QUANTIZED``) are built from another backend's export
+by ``quantize.py`` and are only used once a validation against FP32 has
+been recorded next to the artifact.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.environ.get("SPERMAI_CACHE_DIR", ".cache")) / "models"
+DEFAULT_BACKEND = "pytorch"
+DEFAULT_IMGSZ = 640
+
+# Backend name -> ultralytics export format and extra export options
+BACKENDS = {
+    "pytorch": None,
+    "onnx": ("onnx", {"dynamic": True, "simplify": True}),
+    "openvino": ("openvino", {"dynamic": True}),
+    "torchscript": ("torchscript", {}),
+    "onnx-int8": ("onnx", {"dynamic": True, "simplify": True}),
+}
+# Quantized backend -> the backend whose export it is calibrated from
+QUANTIZED = {"onnx-int8": "onnx"}
+
+_WEIGHTS_NAME = "weights.pt"
+# Name of the artifact ultralytics writes next to ``weights.pt``
+_ARTIFACT_NAMES = {
+    "onnx": "weights.onnx",
+    "openvino": "weights_openvino_model",
+    "torchscript": "weights.torchscript",
+    "onnx-int8": "weights_int8.onnx",
+}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_dir(weights_path, backend, imgsz=DEFAULT_IMGSZ, cache_dir=None):
+    cache_dir = Path(cache_dir) if cache_dir else CACHE_DIR
+    return cache_dir / file_hash(weights_path)[:16] / f"{backend}_{imgsz}"
+
+
+def artifact_path(weights_path, backend, imgsz=DEFAULT_IMGSZ, cache_dir=None):
+    return export_dir(weights_path, backend, imgsz, cache_dir) / _ARTIFACT_NAMES[backend]
+
+
+def cached_export(weights_path, backend, imgsz=DEFAULT_IMGSZ, cache_dir=None):
+    """Return the path of the cached export, exporting it first if needed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Noma'lum backend: {backend} (mavjud: {', '.join(BACKENDS)})")
+    if BACKENDS[backend] is None:
+        return Path(weights_path)
+    if backend in QUANTIZED:
+        from quantize import quantized_export
+        return quantized_export(weights_path, backend, imgsz, cache_dir)
+
+    target = export_dir(weights_path, backend, imgsz, cache_dir)
+    artifact = target / _ARTIFACT_NAMES[backend]
+    if artifact.exists():
+        return artifact
+
+    from ultralytics import YOLO
+
+    export_format, options = BACKENDS[backend]
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Export into a scratch directory and rename it into place, so a crash or
+    # a concurrent launch never sees a half-written export
+    scratch = Path(tempfile.mkdtemp(prefix=f".{backend}_", dir=target.parent))
+    try:
+        shutil.copy2(weights_path, scratch / _WEIGHTS_NAME)
+        YOLO(str(scratch / _WEIGHTS_NAME)).export(
+            format=export_format, imgsz=imgsz, device="cpu", **options
+        )
+        if not (scratch / _ARTIFACT_NAMES[backend]).exists():
+            raise RuntimeError(f"{backend} eksporti natija fayl yaratmadi")
+        try:
+            os.replace(scratch, target)
+        except OSError:
+            # Another process finished the same export first
+            if not artifact.exists():
+                raise
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return artifact
+
+
+def load_model(weights_path, backend=DEFAULT_BACKEND, imgsz=DEFAULT_IMGSZ, cache_dir=None):
+    """Load ``weights_path`` with ``backend``; return ``(model, backend_used)``."""
+    from ultralytics import YOLO
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Noma'lum backend: {backend} (mavjud: {', '.join(BACKENDS)})")
+    if backend != DEFAULT_BACKEND:
+        try:
+            if backend in QUANTIZED:
+                # Calibration is quantize.py's job; never start one from here
+                from quantize import is_accepted
+                artifact = artifact_path(weights_path, backend, imgsz, cache_dir)
+                if not is_accepted(artifact):
+                    raise RuntimeError("FP32 bilan tekshirilmagan yoki farq katta "
+                                       "(python quantize.py)")
+            else:
+                artifact = cached_export(weights_path, backend, imgsz, cache_dir)
+            return YOLO(str(artifact), task="detect"), backend
+        except Exception as e:
+            logger.warning("%s backend ishlamadi, PyTorch ishlatiladi: %s", backend, e)
+    return YOLO(str(weights_path)), DEFAULT_BACKEND
@@ -0,0 +1,193 @@
+"""Headless batch analysis for whole folders of microscope images.
+
+Usage:
+    python batch_analyze.py images/val --batch-size 8
+
+Writes one CSV row per image plus an aggregated "JAMI" row and prints the
+throughput in images/sec. With ``--db`` every counted detection is also
+appended to the database's ``detection_store``. PyQt6 is never imported.
+"""
+import argparse
+import csv
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from analysis import DEFAULT_MODEL_PATH, SpermAnalyzer, percentage
+from app_config import load_config
+from backends import BACKENDS, DEFAULT_BACKEND
+from detection_cache import DetectionCache
+from detection_store import DetectionStore, store_dir
+from results_db import DEFAULT_DB_PATH, ResultsDB
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp"}
+CSV_FIELDS = ["image", "total", "trik", "olik", "yetilmagan",
+              "trik_pct", "olik_pct", "yetilmagan_pct"]
+
+
+def find_images(directory):
+    directory = Path(directory)
+    return sorted(p for p in directory.iterdir()
+                  if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def make_row(name, live, dead, immature):
+    total = live + dead + immature
+    return {
+        "image": name,
+        "total": total,
+        "trik": live,
+        "olik": dead,
+        "yetilmagan": immature,
+        "trik_pct": percentage(live, total),
+        "olik_pct": percentage(dead, total),
+        "yetilmagan_pct": percentage(immature, total),
+    }
+
+
+def db_record(path, row):
+    return {
+        "total": row["total"],
+        "live_count": row["trik"],
+        "dead_count": row["olik"],
+        "immature_count": row["yetilmagan"],
+        "live_pct": row["trik_pct"],
+        "dead_pct": row["olik_pct"],
+        "immature_pct": row["yetilmagan_pct"],
+        "image_path": str(path),
+        "source": "batch",
+    }
+
+
+def analyze_folder(analyzer, image_paths, batch_size=8, tile_size=0, tile_overlap=None):
+    """Yield ``(path, AnalysisResult)`` for every image, batched.
+
+    With ``tile_size`` each image is analyzed on its own and its tiles form
+    the batch instead.
+    """
+    if tile_size:
+        for path in image_paths:
+            result = analyzer.analyze_tiled(str(path), tile_size, tile_overlap, batch_size)
+            yield path, result
+        return
+
+    for batch in chunked(image_paths, batch_size):
+        results = analyzer.analyze_batch([str(p) for p in batch])
+        yield from zip(batch, results)
+
+
+def parse_args(argv=None):
+    # Defaults come from the sweep.py recommendation when there is one
+    config = load_config()
+    parser = argparse.ArgumentParser(description="SpermAI batch tahlili (GUI'siz)")
+    parser.add_argument("directory", help="Rasmlar joylashgan papka, masalan images/val")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="YOLO model fayli")
+    parser.add_argument("--batch-size", type=int, default=config.get("batch_size", 8),
+                        help="Bir martada tahlil qilinadigan rasmlar soni")
+    parser.add_argument("--backend", default=config.get("backend", DEFAULT_BACKEND),
+                        choices=sorted(BACKENDS),
+                        help="Inference backend (eksport birinchi ishlatilganda keshlanadi)")
+    parser.add_argument("--imgsz", type=int, default=config.get("imgsz"), help="Model kirish o'lchami")
+    parser.add_argument("--tile-size", type=int, default=config.get("tile_size", 0),
+                        help="Katta rasmlarni shu o'lchamdagi bo'laklarga bo'lib tahlil qilish (0 = o'chiq)")
+    parser.add_argument("--tile-overlap", type=float, default=None,
+                        help="Bo'laklar ustma-ustligi, tile o'lchamiga nisbatan (standart 0.2)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Parallel inference jarayonlari soni (0 = bitta jarayon)")
+    parser.add_argument("--threads", type=int, default=config.get("threads"),
+                        help="Har bir jarayon uchun torch oqimlari (standart: CPU / jarayonlar)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Avval tahlil qilingan rasmlar uchun keshdagi natijalardan foydalanish")
+    parser.add_argument("--db", nargs="?", const=str(DEFAULT_DB_PATH), default=None,
+                        help="Natijalarni SQLite bazasiga ham yozish (standart: results/spermai.db)")
+    parser.add_argument("--output", default=None, help="CSV fayl (standart: results/batch_<vaqt>.csv)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.batch_size < 1:
+        print("--batch-size kamida 1 bo'lishi kerak", file=sys.stderr)
+        return 2
+    if args.workers and args.tile_size:
+        print("--workers va --tile-size birga ishlatilmaydi", file=sys.stderr)
+        return 2
+
+    image_paths = find_images(args.directory)
+    if not image_paths:
+        print(f"Papkada rasm topilmadi: {args.directory}", file=sys.stderr)
+        return 1
+
+    if args.output:
+        output_path = Path(args.output)
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = Path("results") / f"batch_{timestamp}.csv"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    predict_kwargs = {"imgsz": args.imgsz} if args.imgsz else {}
+    cache = DetectionCache() if args.cache else None
+    if args.workers:
+        from inference_pool import InferencePool
+
+        # Keep every worker busy: a batch is spread across the pool
+        args.batch_size = max(args.batch_size, 2 * args.workers)
+        analyzer = InferencePool(args.model, args.backend, args.workers, args.threads,
+                                 cache=cache, **predict_kwargs).load()
+    else:
+        if args.threads:
+            import torch
+            torch.set_num_threads(args.threads)
+        analyzer = SpermAnalyzer(args.model, backend=args.backend, cache=cache,
+                                 **predict_kwargs).load()
+
+    totals = np.zeros(3, dtype=np.int64)
+    records = []
+    results = []
+    start = time.perf_counter()
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for path, result in analyze_folder(analyzer, image_paths, args.batch_size,
+                                            args.tile_size, args.tile_overlap):
+            totals += result.counts
+            row = make_row(path.name, *result.counts)
+            writer.writerow(row)
+            if args.db:
+                records.append(db_record(path, row))
+                results.append(result)
+        writer.writerow(make_row("JAMI", *(int(c) for c in totals)))
+    elapsed = time.perf_counter() - start
+    if args.workers:
+        analyzer.close()
+
+    if records:
+        with ResultsDB(args.db) as db, DetectionStore(store_dir(args.db)) as store:
+            store.append_results(zip(db.add_batch(records), results))
+
+    summary = make_row("JAMI", *(int(c) for c in totals))
+    workers = f"  |  {analyzer.workers} jarayon x {analyzer.threads} oqim" if args.workers else ""
+    print(f"Backend: {analyzer.backend}{workers}")
+    print(f"Rasmlar: {len(image_paths)}  |  vaqt: {elapsed:.2f} s  |  "
+          f"{len(image_paths) / elapsed:.2f} rasm/s")
+    print(f"Trik: {summary['trik']} ({summary['trik_pct']}%)  "
+          f"O'lik: {summary['olik']} ({summary['olik_pct']}%)  "
+          f"Yetilmagan: {summary['yetilmagan']} ({summary['yetilmagan_pct']}%)")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Kesh: {stats['hits']} topildi / {stats['misses']} topilmadi, "
+              f"{stats['saved_seconds']:.2f} s tejaldi")
+    print(f"Natijalar: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""Reproducible benchmark of the analysis pipeline.
+
+Usage:
+    python benchmark.py                                   # images/train + images/val
+    python benchmark.py --modes single cached --repeat 5
+    python benchmark.py --compare results/benchmark_20250101_120000.json
+
+Every image goes through the same stages as in the desktop app:
+
+    decode       read_image (image_buffer.decode_image)
+    preprocess   letterbox + tensor conversion (ultralytics)
+    inference    the model forward pass (ultralytics)
+    postprocess  ultralytics postprocess: box decoding and the confidence
+                 floor; at ``RAW_IOU`` it suppresses nothing
+    pack         detections.pack (suppress_iou for the slider preview)
+    cache        detection-cache lookup (cached mode only)
+    nms          detections.nms_mask at the analyzer's thresholds
+    count        class counts + percentages
+    report       report_values + write_report (HTML and TXT), as in save_report
+
+Modes are "single" (one image per model call), "batched" (``--batch-size``
+images per call) and "cached" (detections served from a warmed
+DetectionCache). Each mode runs in a fresh process, so its peak RSS is its
+own. p50/p95 per stage, images/sec and peak RSS are written as JSON to
+``results/benchmark_<timestamp>.json``.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from analysis import DEFAULT_MODEL_PATH, SpermAnalyzer, read_image
+from backends import BACKENDS, DEFAULT_BACKEND
+
+MODES = ("single", "batched", "cached")
+STAGES = ("decode", "preprocess", "inference", "postprocess", "pack", "cache", "nms", "count",
+          "report")
+DEFAULT_SETS = ("images/train", "images/val")
+BENCH_PATIENT = {"name": "Benchmark", "birth_date": "01.01.1990", "id": "BENCH",
+                 "conclusion": "-", "doctor": "-"}
+
+
+def _ms(start, stop):
+    return (stop - start) * 1000.0
+
+
+def _count_and_report(detections, analyzer, reports_dir, index, timings):
+    # What apply_thresholds does in process_results, split at the NMS
+    from analysis import MAX_DET, percentage
+    from detections import class_counts, nms_mask
+    from report import report_values, write_report
+
+    start = time.perf_counter()
+    mask = nms_mask(detections, analyzer.conf, analyzer.iou, MAX_DET)
+    suppressed = time.perf_counter()
+    counts = tuple(int(c) for c in class_counts(detections, mask))
+    percentages = tuple(percentage(c, sum(counts)) for c in counts)
+    counted = time.perf_counter()
+    write_report(report_values(BENCH_PATIENT, counts, percentages), reports_dir,
+                 stem=f"bench_{index:06d}")
+    timings["nms"] = _ms(start, suppressed)
+    timings["count"] = _ms(suppressed, counted)
+    timings["report"] = _ms(counted, time.perf_counter())
+
+
+def _pack(raw):
+    from detections import pack
+
+    boxes = raw.boxes.cpu()
+    return pack(boxes.xyxy.numpy(), boxes.cls.numpy().astype("int64"), boxes.conf.numpy())
+
+
+def _model_stages(raw, timings):
+    # ultralytics reports per-image milliseconds, already divided by batch size
+    speed = raw.speed
+    timings["preprocess"] = speed.get("preprocess") or 0.0
+    timings["inference"] = speed.get("inference") or 0.0
+    timings["postprocess"] = speed.get("postprocess") or 0.0
+
+
+def _run_single(analyzer, paths, reports_dir, index):
+    samples = []
+    for path in paths:
+        timings = {}
+        start = time.perf_counter()
+        image = read_image(path)
+        decoded = time.perf_counter()
+        raw = analyzer.infer(image)[0]
+        inferred = time.perf_counter()
+        detections = _pack(raw)
+        timings["decode"] = _ms(start, decoded)
+        _model_stages(raw, timings)
+        timings["pack"] = _ms(inferred, time.perf_counter())
+        _count_and_report(detections, analyzer, reports_dir, index, timings)
+        timings["total"] = _ms(start, time.perf_counter())
+        samples.append(timings)
+        index += 1
+    return samples
+
+
+def _run_batched(analyzer, paths, reports_dir, index, batch_size):
+    samples = []
+    for offset in range(0, len(paths), batch_size):
+        batch = paths[offset:offset + batch_size]
+        start = time.perf_counter()
+        decode_ms = []
+        images = []
+        for path in batch:
+            t = time.perf_counter()
+            images.append(read_image(path))
+            decode_ms.append(_ms(t, time.perf_counter()))
+        raws = analyzer.infer(images)
+        inferred = time.perf_counter()
+        packed = [_pack(raw) for raw in raws]
+        pack_ms = _ms(inferred, time.perf_counter()) / len(batch)
+        shared_ms = _ms(start, time.perf_counter()) / len(batch)
+        for raw, detections, decode in zip(raws, packed, decode_ms):
+            timings = {"decode": decode, "pack": pack_ms}
+            _model_stages(raw, timings)
+            _count_and_report(detections, analyzer, reports_dir, index, timings)
+            # Decode and inference are shared by the batch; attribute evenly
+            timings["total"] = shared_ms + timings["nms"] + timings["count"] + timings["report"]
+            samples.append(timings)
+            index += 1
+    return samples
+
+
+def _run_cached(analyzer, paths, reports_dir, index):
+    samples = []
+    for path in paths:
+        timings = {}
+        start = time.perf_counter()
+        image = read_image(path)       # the app still decodes for the preview
+        decoded = time.perf_counter()
+        result = analyzer.cached(path)
+        looked_up = time.perf_counter()
+        if result is None:
+            raise RuntimeError(f"Keshda topilmadi: {path}")
+        timings["decode"] = _ms(start, decoded)
+        timings["cache"] = _ms(decoded, looked_up)
+        _count_and_report(result.detections, analyzer, reports_dir, index, timings)
+        timings["total"] = _ms(start, time.perf_counter())
+        samples.append(timings)
+        index += 1
+        del image
+    return samples
+
+
+def percentiles(values):
+    import numpy as np
+
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "mean": round(float(values.mean()), 3),
+        "n": int(values.size),
+    }
+
+
+def run_mode(mode, config):
+    """Benchmark one mode; meant to run in its own process."""
+    from detection_cache import DetectionCache
+    from image_buffer import peak_rss_mb
+
+    paths = [Path(p) for p in config["paths"]]
+    with tempfile.TemporaryDirectory(prefix="spermai_bench_") as scratch:
+        cache = DetectionCache(Path(scratch) / "cache") if mode == "cached" else None
+        start = time.perf_counter()
+        analyzer = SpermAnalyzer(config["model"], backend=config["backend"], cache=cache,
+                                 **config["predict_kwargs"]).load()
+        load_seconds = time.perf_counter() - start
+        reports_dir = Path(scratch) / "reports"
+
+        # Warm-up passes are not timed; in cached mode they also fill the cache
+        if mode == "cached":
+            for offset in range(0, len(paths), config["batch_size"]):
+                analyzer.analyze_batch(paths[offset:offset + config["batch_size"]])
+        else:
+            for path in paths[:max(1, config["warmup"])]:
+                analyzer.infer(read_image(path))
+
+        samples = []
+        start = time.perf_counter()
+        for _ in range(config["repeat"]):
+            if mode == "single":
+                samples += _run_single(analyzer, paths, reports_dir, len(samples))
+            elif mode == "batched":
+                samples += _run_batched(analyzer, paths, reports_dir, len(samples),
+                                        config["batch_size"])
+            else:
+                samples += _run_cached(analyzer, paths, reports_dir, len(samples))
+        elapsed = time.perf_counter() - start
+
+    stages = {}
+    for stage in STAGES + ("total",):
+        values = [s[stage] for s in samples if stage in s]
+        if values:
+            stages[stage] = percentiles(values)
+    return {
+        "images": len(samples),
+        "seconds": round(elapsed, 4),
+        "images_per_sec": round(len(samples) / elapsed, 3) if elapsed else None,
+        "model_load_seconds": round(load_seconds, 3),
+        "backend": analyzer.backend,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages_ms": stages,
+    }
+
+
+def environment(model):
+    from backends import file_hash
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    info = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model": str(model),
+        "model_sha256": file_hash(model)[:16] if Path(model).exists() else None,
+    }
+    for package in ("numpy", "cv2", "torch", "ultralytics"):
+        try:
+            info[package] = __import__(package).__version__
+        except ImportError:
+            info[package] = None
+    return info
+
+
+def compare(old, new):
+    """Print p50 and images/sec changes from run ``old`` to run ``new``."""
+    for mode, current in new["modes"].items():
+        previous = old.get("modes", {}).get(mode)
+        if not previous:
+            continue
+        print(f"[{mode}] {previous['images_per_sec']} -> {current['images_per_sec']} rasm/s")
+        for stage, stats in current["stages_ms"].items():
+            before = previous["stages_ms"].get(stage)
+            if not before or not before["p50"]:
+                continue
+            change = (stats["p50"] - before["p50"]) / before["p50"] * 100
+            print(f"  {stage:<12} p50 {before['p50']:9.2f} -> {stats['p50']:9.2f} ms  ({change:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Tahlil jarayonining benchmarki")
+    parser.add_argument("sets", nargs="*", default=list(DEFAULT_SETS),
+                        help="Rasm papkalari (standart: images/train images/val)")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=sorted(BACKENDS))
+    parser.add_argument("--imgsz", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3, help="Har bir rejimda to'plam necha marta o'tiladi")
+    parser.add_argument("--warmup", type=int, default=2, help="O'lchanmaydigan qizdirish rasmlari soni")
+    parser.add_argument("--output", default=None, help="JSON fayl (standart: results/benchmark_<vaqt>.json)")
+    parser.add_argument("--compare", default=None, help="Oldingi JSON natija bilan solishtirish")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from batch_analyze import find_images
+
+    args = parse_args(argv)
+    paths = []
+    for directory in args.sets:
+        if not Path(directory).is_dir():
+            print(f"Papka topilmadi: {directory}", file=sys.stderr)
+            return 1
+        paths += [str(p) for p in find_images(directory)]
+    if not paths:
+        print("Rasm topilmadi", file=sys.stderr)
+        return 1
+
+    if args.output:
+        output_path = Path(args.output)
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = Path("results") / f"benchmark_{timestamp}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    config = {
+        "paths": paths,
+        "model": args.model,
+        "backend": args.backend,
+        "predict_kwargs": {"imgsz": args.imgsz} if args.imgsz else {},
+        "batch_size": args.batch_size,
+        "repeat": args.repeat,
+        "warmup": args.warmup,
+    }
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "sets": args.sets,
+        "config": {k: v for k, v in config.items() if k != "paths"},
+        "environment": environment(args.model),
+        "modes": {},
+    }
+
+    context = multiprocessing.get_context("spawn")
+    for mode in args.modes:
+        with context.Pool(1) as pool:
+            stats = pool.apply(run_mode, (mode, config))
+        report["modes"][mode] = stats
+        total = stats["stages_ms"]["total"]
+        print(f"[{mode}] {stats['images']} rasm  |  {stats['images_per_sec']} rasm/s  |  "
+              f"p50 {total['p50']:.1f} ms  p95 {total['p95']:.1f} ms  |  "
+              f"RSS {stats['peak_rss_mb']} MB")
+
+    output_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
+    print(f"Natijalar: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
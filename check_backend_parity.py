@@ -0,0 +1,74 @@
+"""Check that an exported backend gives the same counts as PyTorch.
+
+Usage:
+    python check_backend_parity.py --backend onnx images/val
+
+Runs every image through the PyTorch model and through ``--backend`` and
+compares the per-image live/dead/immature counts. Exits with status 1 if
+any image differs by more than ``--tolerance`` detections per class.
+"""
+import argparse
+import sys
+import time
+
+from analysis import DEFAULT_MODEL_PATH, SpermAnalyzer
+from backends import BACKENDS, DEFAULT_BACKEND
+from batch_analyze import find_images
+
+
+def timed_counts(analyzer, image_paths):
+    counts = []
+    start = time.perf_counter()
+    for path in image_paths:
+        counts.append(analyzer.analyze(str(path)).counts)
+    return counts, time.perf_counter() - start
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Backend natijalarini PyTorch bilan solishtirish")
+    parser.add_argument("directory", nargs="?", default="images/val")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", required=True,
+                        choices=sorted(b for b in BACKENDS if b != DEFAULT_BACKEND))
+    parser.add_argument("--imgsz", type=int, default=None)
+    parser.add_argument("--tolerance", type=int, default=0,
+                        help="Har bir sinf uchun ruxsat etilgan farq (dona)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    image_paths = find_images(args.directory)
+    if not image_paths:
+        print(f"Papkada rasm topilmadi: {args.directory}", file=sys.stderr)
+        return 1
+
+    predict_kwargs = {"imgsz": args.imgsz} if args.imgsz else {}
+    reference = SpermAnalyzer(args.model, **predict_kwargs).load()
+    candidate = SpermAnalyzer(args.model, backend=args.backend, **predict_kwargs).load()
+    if candidate.backend != args.backend:
+        print(f"{args.backend} eksporti ishlamadi, solishtirish imkonsiz", file=sys.stderr)
+        return 1
+
+    # Warm up both so the one-off graph setup is not counted
+    reference.analyze(str(image_paths[0]))
+    candidate.analyze(str(image_paths[0]))
+
+    ref_counts, ref_time = timed_counts(reference, image_paths)
+    cand_counts, cand_time = timed_counts(candidate, image_paths)
+
+    mismatches = 0
+    for path, ref, cand in zip(image_paths, ref_counts, cand_counts):
+        delta = max(abs(r - c) for r, c in zip(ref, cand))
+        status = "OK" if delta <= args.tolerance else "FARQ"
+        mismatches += status != "OK"
+        print(f"{status:4}  {path.name}  pytorch={ref}  {args.backend}={cand}")
+
+    n = len(image_paths)
+    print(f"pytorch: {n / ref_time:.2f} rasm/s  |  {args.backend}: {n / cand_time:.2f} rasm/s")
+    print(f"Mos kelmadi: {mismatches}/{n}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
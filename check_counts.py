@@ -0,0 +1,109 @@
+"""Check that the reported counts equal a plain ``model(image)`` call.
+
+Usage:
+    python check_counts.py images/val
+    python check_counts.py images/val --thresholds 0.25:0.7 0.4:0.5
+    python check_counts.py big_frames/ --tile-size 640
+
+``SpermAnalyzer`` runs the model once without NMS and applies the
+thresholds afterwards (see ``detections.nms_mask``). For every image and
+every ``conf:iou`` pair this compares its live/dead/immature counts with
+those of the model called directly at that pair, and exits with status 1 if
+any differ. With ``--tile-size`` the reference is ``model(tile)`` on every
+tile followed by the same seam dedup ``SpermAnalyzer.analyze_tiled`` uses.
+"""
+import argparse
+import sys
+
+from analysis import (CLASS_DEAD, CLASS_IMMATURE, CLASS_LIVE, DEFAULT_CONF, DEFAULT_IOU,
+                      DEFAULT_MODEL_PATH, SpermAnalyzer)
+from batch_analyze import find_images
+
+
+def parse_pair(text):
+    conf, iou = text.split(":")
+    return float(conf), float(iou)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sonlarni oddiy model(rasm) natijasi bilan solishtirish")
+    parser.add_argument("directory", nargs="?", default="images/val")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--thresholds", nargs="+", type=parse_pair,
+                        default=[(DEFAULT_CONF, DEFAULT_IOU)], metavar="CONF:IOU")
+    parser.add_argument("--tile-size", type=int, default=0,
+                        help="Katta rasmlarni bo'laklab tahlil qilishni tekshirish")
+    return parser.parse_args(argv)
+
+
+def class_tuple(classes):
+    classes = list(classes)
+    return tuple(classes.count(c) for c in (CLASS_LIVE, CLASS_DEAD, CLASS_IMMATURE))
+
+
+def reference_counts(model, path, conf, iou):
+    return class_tuple(model(str(path), conf=conf, iou=iou, verbose=False)[0].boxes.cls.tolist())
+
+
+def tiled_reference_counts(model, path, conf, iou, tile_size):
+    from analysis import read_image
+    from tiling import DEFAULT_OVERLAP, tiled_detections
+
+    image = read_image(path)
+    if max(image.shape[:2]) <= tile_size:
+        return reference_counts(model, path, conf, iou)
+    _, classes, _ = tiled_detections(lambda tiles: model(tiles, conf=conf, iou=iou, verbose=False),
+                                     image, tile_size, DEFAULT_OVERLAP)
+    return class_tuple(classes.tolist())
+
+
+def tiled_check(args, model, image_paths):
+    mismatches = checks = 0
+    for conf, iou in args.thresholds:
+        # A tiled result is settled at the analyzer's thresholds
+        analyzer = SpermAnalyzer(args.model, conf=conf, iou=iou).load()
+        for path in image_paths:
+            counts = analyzer.analyze_tiled(str(path), args.tile_size).counts
+            expected = tiled_reference_counts(model, path, conf, iou, args.tile_size)
+            status = "OK" if counts == expected else "FARQ"
+            mismatches += status != "OK"
+            checks += 1
+            print(f"{status:4}  {path.name}  conf={conf:.2f} iou={iou:.2f} bo'lak={args.tile_size}  "
+                  f"model={expected}  dastur={counts}")
+    return mismatches, checks
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    image_paths = find_images(args.directory)
+    if not image_paths:
+        print(f"Papkada rasm topilmadi: {args.directory}", file=sys.stderr)
+        return 1
+
+    from ultralytics import YOLO
+
+    model = YOLO(args.model)
+    if args.tile_size:
+        mismatches, checks = tiled_check(args, model, image_paths)
+        print(f"Mos kelmadi: {mismatches}/{checks}")
+        return 1 if mismatches else 0
+
+    analyzer = SpermAnalyzer(args.model).load()
+    mismatches = checks = 0
+    for path in image_paths:
+        result = analyzer.analyze(str(path))
+        for conf, iou in args.thresholds:
+            counts = result.apply_thresholds(conf, iou)
+            expected = reference_counts(model, path, conf, iou)
+            status = "OK" if counts == expected else "FARQ"
+            mismatches += status != "OK"
+            checks += 1
+            print(f"{status:4}  {path.name}  conf={conf:.2f} iou={iou:.2f}  "
+                  f"model={expected}  dastur={counts}")
+
+    print(f"Mos kelmadi: {mismatches}/{checks}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
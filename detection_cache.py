@@ -0,0 +1,208 @@
+"""Content-addressed on-disk cache of raw detections.
+
+Entries are keyed by the SHA-256 of the image bytes together with the
+weights hash, the backend and the inference options, so a re-opened image
+skips inference entirely while any change to the model or settings misses.
+Each entry is a small ``.npz`` with the packed detection columns
+(``detections.DETECTION_DTYPE``), so a hit needs no re-packing.
+
+The cache is bounded by total size; the least recently used entries are
+evicted first. Recency is the file mtime, refreshed on every hit, so the
+order survives restarts without a separate index file.
+"""
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from backends import CACHE_DIR, file_hash
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+STALE_TMP_SECONDS = 3600
+
+
+@functools.lru_cache(maxsize=1024)
+def _hash_file(path, mtime_ns, size):
+    return file_hash(path)
+
+
+def image_hash(path):
+    """SHA-256 of an image file, memoized on path, mtime and size."""
+    stat = os.stat(path)
+    return _hash_file(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+def make_key(image_hash, model_hash, backend, options=None):
+    options = json.dumps(options or {}, sort_keys=True, default=str)
+    payload = f"{image_hash}|{model_hash}|{backend}|{options}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FileCache:
+    """Files under ``directory/<key[:2]>/``, evicted least recently used first
+    once they add up to more than ``max_bytes``.
+
+    Only the bookkeeping lives here; subclasses decide what an entry holds
+    and write it with ``_store``.
+    """
+    SUFFIX = ""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._scan()
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}{self.SUFFIX}"
+
+    def _scan(self):
+        if not self.directory.exists():
+            return
+        # Leftovers of a put interrupted before its rename; older versions
+        # named them tmp*.npz (keys are hex, so never start with "tmp"). Recent
+        # ones may belong to another process sharing the cache
+        stale = time.time() - STALE_TMP_SECONDS
+        for path in [*self.directory.glob("*/*.tmp"), *self.directory.glob("*/tmp*.npz")]:
+            try:
+                if path.stat().st_mtime < stale:
+                    path.unlink()
+            except OSError:
+                pass
+        files = []
+        for path in self.directory.glob(f"*/*{self.SUFFIX}"):
+            if path.stem.startswith("tmp"):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _lookup(self, key):
+        """Path of a known entry, now the most recently used; ``None`` on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        return self._path(key)
+
+    def _hit(self, path):
+        os.utime(path)
+        with self._lock:
+            self.hits += 1
+
+    def _lost(self, key):
+        # Deleted or corrupted behind our back: treat as a miss
+        with self._lock:
+            self._forget(key)
+            self.misses += 1
+
+    def _store(self, key, write):
+        """Call ``write(f)`` on a temporary file and rename it into place as ``key``."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        size = path.stat().st_size
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._path(key).unlink(missing_ok=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._path(key).unlink(missing_ok=True)
+            self._entries.clear()
+            self._total_bytes = 0
+
+
+class DetectionCache(FileCache):
+    SUFFIX = ".npz"
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.saved_seconds = 0.0
+        super().__init__(directory or CACHE_DIR.parent / "detections", max_bytes)
+
+    def get(self, key):
+        """Return ``(detections, image_shape)`` or ``None``."""
+        import numpy as np
+
+        from detections import DETECTION_DTYPE
+
+        path = self._lookup(key)
+        if path is None:
+            return None
+        try:
+            with np.load(path) as data:
+                detections = np.empty(len(data["cls"]), dtype=DETECTION_DTYPE)
+                for name in DETECTION_DTYPE.names:
+                    detections[name] = data[name]
+                entry = (detections, tuple(int(v) for v in data["image_shape"]) or None)
+                seconds = float(data["seconds"])
+            self._hit(path)
+        except (OSError, KeyError, ValueError):
+            self._lost(key)
+            return None
+        with self._lock:
+            self.saved_seconds += seconds
+        return entry
+
+    def put(self, key, detections, image_shape=None, seconds=0.0):
+        """Store a packed detection array; ``seconds`` is the inference time a hit saves."""
+        import numpy as np
+
+        self._store(key, lambda f: np.savez(
+            f, **{name: np.ascontiguousarray(detections[name]) for name in detections.dtype.names},
+            image_shape=np.asarray(image_shape or (), dtype=np.int64),
+            seconds=np.float64(seconds)))
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["saved_seconds"] = self.saved_seconds
+        return stats
@@ -0,0 +1,382 @@
+"""Append-only columnar archive of every counted detection.
+
+Each row is one detection: the ``analyses`` row id of its image, class,
+confidence and box. Columns are flat little-endian files, so a query maps
+only the columns it needs and runs on whole arrays::
+
+    <db stem>_detections/
+        20241019_161949_4242_0/     one segment per writer process
+            image_id.bin  uint32
+            cls.bin       uint8
+            conf.bin      float32
+            box.bin       float32 x 4 (x1, y1, x2, y2)
+            schema.json
+
+Writers never share a file: every process that appends (the desktop app,
+``batch_analyze.py --db``, ``watch_folder.py``) opens a segment of its own,
+so no locking is needed. Rows are appended column by column; after a crash
+the columns of the last segment may differ in length, and readers use the
+shortest. Rows are never rewritten; detections of analyses deleted from the
+database stay until ``--compact`` rewrites the store without them (run it
+while nothing else is writing).
+
+Usage:
+    python detection_store.py                                 # rows per class
+    python detection_store.py --hist immature                 # confidence histogram
+    python detection_store.py --export immature.npy --class immature
+    python detection_store.py --backfill                      # from saved analysis_*.npz
+    python detection_store.py --bench 1000000                 # timing on synthetic rows
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from analysis import CLASS_DEAD, CLASS_IMMATURE, CLASS_LIVE, CLASS_NAMES
+from archive import atomic_write
+from results_db import DEFAULT_DB_PATH
+
+# Column -> (dtype, shape of one value)
+COLUMNS = {
+    "image_id": ("<u4", ()),
+    "cls": ("u1", ()),
+    "conf": ("<f4", ()),
+    "box": ("<f4", (4,)),
+}
+CLASS_IDS = {"live": CLASS_LIVE, "dead": CLASS_DEAD, "immature": CLASS_IMMATURE}
+_SEGMENT_NUMBERS = itertools.count()
+
+
+def store_dir(db_path=DEFAULT_DB_PATH):
+    """The store that belongs to a results database; ids refer to its rows."""
+    db_path = Path(db_path)
+    return db_path.with_name(f"{db_path.stem}_detections")
+
+
+def store_dtype():
+    import numpy as np
+
+    return np.dtype([(name, dtype, shape) for name, (dtype, shape) in COLUMNS.items()])
+
+
+def _row_bytes(name):
+    import numpy as np
+
+    dtype, shape = COLUMNS[name]
+    return np.dtype(dtype).itemsize * int(np.prod(shape, dtype=int))
+
+
+class DetectionStore:
+    def __init__(self, directory=None):
+        self.directory = Path(directory) if directory else store_dir()
+        self._segment = None
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Writing ------------------------------------------------------------
+
+    def _open_segment(self):
+        name = (f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+                f"_{next(_SEGMENT_NUMBERS)}")
+        segment = self.directory / name
+        segment.mkdir(parents=True)
+        atomic_write(segment / "schema.json", lambda f: json.dump(
+            {name: [dtype, list(shape)] for name, (dtype, shape) in COLUMNS.items()}, f),
+            mode="w")
+        self._files = {name: open(segment / f"{name}.bin", "ab") for name in COLUMNS}
+        self._segment = segment
+
+    def append(self, image_id, boxes, classes, confidences):
+        """Add the detections of one image; return how many were written."""
+        return self.append_many([(image_id, boxes, classes, confidences)])
+
+    def append_many(self, images):
+        """Add ``(image_id, boxes, classes, confidences)`` for several images."""
+        import numpy as np
+
+        images = [entry for entry in images if entry[0] is not None and len(entry[2])]
+        if not images:
+            return 0
+        lengths = [len(classes) for _, _, classes, _ in images]
+        columns = {
+            "image_id": np.repeat(np.array([entry[0] for entry in images], dtype="<u4"), lengths),
+            "cls": np.concatenate([np.asarray(entry[2]) for entry in images]).astype("u1"),
+            "conf": np.concatenate([np.asarray(entry[3]) for entry in images]).astype("<f4"),
+            "box": np.concatenate([np.asarray(entry[1], dtype="<f4").reshape(-1, 4)
+                                   for entry in images]),
+        }
+        with self._lock:
+            if self._segment is None:
+                self._open_segment()
+            offsets = {name: f.tell() for name, f in self._files.items()}
+            try:
+                for name, values in columns.items():
+                    self._files[name].write(np.ascontiguousarray(values).tobytes())
+                # Readers in other processes see the rows from now on
+                for f in self._files.values():
+                    f.flush()
+            except OSError:
+                # E.g. disk full: keep the columns aligned for later appends
+                for name, f in self._files.items():
+                    f.truncate(offsets[name])
+                raise
+        return len(columns["cls"])
+
+    def append_results(self, pairs):
+        """Add ``(image_id, AnalysisResult)`` pairs: the detections that were counted."""
+        return self.append_many([(image_id, result.boxes, result.classes, result.confidences)
+                                 for image_id, result in pairs if result is not None])
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+            self._files = {}
+            self._segment = None
+
+    # --- Reading ------------------------------------------------------------
+
+    def segments(self, columns=tuple(COLUMNS)):
+        """Yield ``{column: read-only memmap}`` for every non-empty segment."""
+        import numpy as np
+
+        if not self.directory.exists():
+            return
+        for segment in sorted(p for p in self.directory.iterdir() if p.is_dir()):
+            # Columns cut short by a crash: only rows present in all of them count
+            sizes = [(segment / f"{name}.bin").stat().st_size // _row_bytes(name)
+                     if (segment / f"{name}.bin").exists() else 0 for name in COLUMNS]
+            rows = min(sizes)
+            if rows == 0:
+                continue
+            yield {name: np.memmap(segment / f"{name}.bin", dtype=COLUMNS[name][0], mode="r",
+                                   shape=(rows, *COLUMNS[name][1]))
+                   for name in columns}
+
+    def _selected(self, segment, cls=None, image_ids=None):
+        import numpy as np
+
+        mask = None
+        if cls is not None:
+            mask = segment["cls"] == cls
+        if image_ids is not None:
+            in_ids = np.isin(segment["image_id"], image_ids)
+            mask = in_ids if mask is None else mask & in_ids
+        return mask
+
+    def count(self, cls=None, image_ids=None):
+        total = 0
+        for segment in self.segments(self._needed((), cls, image_ids)):
+            mask = self._selected(segment, cls, image_ids)
+            total += len(next(iter(segment.values()))) if mask is None else int(mask.sum())
+        return total
+
+    def class_counts(self, image_ids=None):
+        """Detections per class id over the whole store (or some images)."""
+        import numpy as np
+
+        counts = np.zeros(len(CLASS_NAMES), dtype=np.int64)
+        for segment in self.segments(self._needed(("cls",), None, image_ids)):
+            mask = self._selected(segment, None, image_ids)
+            classes = segment["cls"] if mask is None else segment["cls"][mask]
+            counts += np.bincount(classes, minlength=len(CLASS_NAMES))[:len(CLASS_NAMES)]
+        return counts
+
+    def histogram(self, column="conf", cls=None, bins=20, value_range=(0.0, 1.0), image_ids=None):
+        """``(counts, edges)`` of a scalar column, optionally for one class."""
+        import numpy as np
+
+        edges = np.linspace(*value_range, bins + 1)
+        counts = np.zeros(bins, dtype=np.int64)
+        for segment in self.segments(self._needed((column,), cls, image_ids)):
+            mask = self._selected(segment, cls, image_ids)
+            values = segment[column] if mask is None else segment[column][mask]
+            counts += np.histogram(values, edges)[0]
+        return counts, edges
+
+    def read(self, cls=None, image_ids=None):
+        """Matching rows as one structured array (``store_dtype``), e.g. for export."""
+        import numpy as np
+
+        parts = []
+        for segment in self.segments():
+            mask = self._selected(segment, cls, image_ids)
+            part = np.empty(len(segment["cls"]) if mask is None else int(mask.sum()),
+                            dtype=store_dtype())
+            for name, values in segment.items():
+                part[name] = values if mask is None else values[mask]
+            parts.append(part)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=store_dtype())
+
+    def image_ids(self):
+        import numpy as np
+
+        ids = [np.unique(segment["image_id"]) for segment in self.segments(("image_id",))]
+        return np.unique(np.concatenate(ids)) if ids else np.empty(0, dtype="<u4")
+
+    def compact(self, keep_ids=None):
+        """Rewrite all segments as one, keeping only ``keep_ids`` if given."""
+        import shutil
+
+        rows = self.read(image_ids=keep_ids)
+        staging = self.directory.with_name(f"{self.directory.name}.compact")
+        retired = self.directory.with_name(f"{self.directory.name}.old")
+        shutil.rmtree(staging, ignore_errors=True)
+        with DetectionStore(staging) as merged:
+            staging.mkdir(parents=True)
+            if len(rows):
+                with merged._lock:
+                    merged._open_segment()
+                    for name in COLUMNS:
+                        merged._files[name].write(rows[name].tobytes())
+        # Swap whole directories; the old store is only deleted once replaced
+        shutil.rmtree(retired, ignore_errors=True)
+        if self.directory.exists():
+            os.replace(self.directory, retired)
+        os.replace(staging, self.directory)
+        shutil.rmtree(retired, ignore_errors=True)
+        return len(rows)
+
+    @staticmethod
+    def _needed(columns, cls, image_ids):
+        needed = list(columns)
+        if cls is not None:
+            needed.append("cls")
+        if image_ids is not None:
+            needed.append("image_id")
+        return tuple(dict.fromkeys(needed)) or ("cls",)
+
+
+def backfill(db, store):
+    """Add the detections saved next to each analysis image (``analysis_<ts>.npz``)."""
+    from analysis import AnalysisResult
+    from archive import load_detections
+
+    present = set(int(i) for i in store.image_ids())
+    pairs = []
+    for row in db._query("SELECT id, image_path FROM analyses WHERE image_path IS NOT NULL"):
+        path = Path(row["image_path"]).with_suffix(".npz")
+        if row["id"] in present or not path.exists():
+            continue
+        detections, image_shape, conf, iou = load_detections(path)
+        thresholds = {k: v for k, v in (("conf", conf), ("iou", iou)) if v is not None}
+        pairs.append((row["id"], AnalysisResult.from_detections(detections, image_shape,
+                                                                **thresholds)))
+    return len(pairs), store.append_results(pairs)
+
+
+def bench(rows, directory):
+    """Fill a scratch store with ``rows`` synthetic detections and time queries."""
+    import tempfile
+
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    per_image = 200
+    images = [(i + 1, rng.random((per_image, 4), dtype=np.float32) * 640,
+               rng.integers(0, 3, per_image), rng.random(per_image, dtype=np.float32))
+              for i in range(max(1, rows // per_image))]
+    with tempfile.TemporaryDirectory(prefix="spermai_store_", dir=directory) as scratch:
+        store = DetectionStore(scratch)
+        t = time.perf_counter()
+        for start in range(0, len(images), 50):
+            store.append_many(images[start:start + 50])
+        store.close()
+        append_s = time.perf_counter() - t
+        reader = DetectionStore(scratch)
+        t = time.perf_counter()
+        counts, _ = reader.histogram("conf", cls=CLASS_IDS["immature"])
+        hist_ms = (time.perf_counter() - t) * 1000
+        t = time.perf_counter()
+        by_class = reader.class_counts()
+        classes_ms = (time.perf_counter() - t) * 1000
+        t = time.perf_counter()
+        subset = reader.read(image_ids=np.arange(1, 101))
+        read_ms = (time.perf_counter() - t) * 1000
+        size = sum(p.stat().st_size for p in Path(scratch).glob("*/*.bin"))
+    total = int(by_class.sum())
+    print(f"{total} ta detection: yozish {append_s:.2f} s, diskda {size / 1e6:.1f} MB "
+          f"({size / total:.0f} bayt/qator)")
+    print(f"Yetilmagan ishonch gistogrammasi: {hist_ms:.1f} ms ({int(counts.sum())} qator)")
+    print(f"Sinflar bo'yicha soni: {classes_ms:.1f} ms  |  100 ta rasm qatorlari: "
+          f"{read_ms:.1f} ms ({len(subset)} qator)")
+
+
+def _class_id(name):
+    if name is None:
+        return None
+    if name not in CLASS_IDS:
+        raise SystemExit(f"Noma'lum sinf: {name} ({', '.join(CLASS_IDS)})")
+    return CLASS_IDS[name]
+
+
+def main(argv=None):
+    from results_db import ResultsDB
+
+    parser = argparse.ArgumentParser(description="Har bir aniqlangan sperma bo'yicha arxiv")
+    parser.add_argument("--db", default=str(DEFAULT_DB_PATH))
+    parser.add_argument("--hist", metavar="SINF", nargs="?", const="all",
+                        help="Ishonch gistogrammasi (sinf: live, dead, immature yoki all)")
+    parser.add_argument("--bins", type=int, default=20)
+    parser.add_argument("--export", metavar="FAYL", help="Qatorlarni .npy faylga yozish")
+    parser.add_argument("--class", dest="cls", choices=sorted(CLASS_IDS), help="--export uchun sinf")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Saqlangan analysis_*.npz fayllaridan qo'shish")
+    parser.add_argument("--compact", action="store_true",
+                        help="Bazada yo'q tahlillarni olib tashlab, bitta segmentga yig'ish")
+    parser.add_argument("--bench", type=int, default=0, metavar="N",
+                        help="N ta sun'iy qator bilan tezlikni o'lchash")
+    args = parser.parse_args(argv)
+
+    directory = store_dir(args.db)
+    if args.bench:
+        bench(args.bench, directory.parent if directory.parent.exists() else None)
+        return 0
+
+    store = DetectionStore(directory)
+    if args.backfill or args.compact:
+        with ResultsDB(args.db) as db:
+            if args.backfill:
+                images, rows = backfill(db, store)
+                store.close()
+                print(f"Qo'shildi: {images} ta tahlil, {rows} ta qator")
+            if args.compact:
+                kept = store.compact([row["id"] for row in db._query("SELECT id FROM analyses")])
+                print(f"Qoldi: {kept} ta qator")
+    if args.export:
+        import numpy as np
+
+        rows = store.read(_class_id(args.cls))
+        np.save(args.export, rows)
+        print(f"{len(rows)} ta qator yozildi: {args.export}")
+        return 0
+
+    counts = store.class_counts()
+    print(f"{directory}: {int(counts.sum())} ta detection")
+    for cls, name in CLASS_NAMES.items():
+        print(f"  {name:<11} {int(counts[cls])}")
+    if args.hist:
+        cls = None if args.hist == "all" else _class_id(args.hist)
+        counts, edges = store.histogram("conf", cls, args.bins)
+        peak = max(int(counts.max()), 1)
+        print(f"\nIshonch gistogrammasi ({args.hist}):")
+        for n, low, high in zip(counts, edges, edges[1:]):
+            print(f"  {low:.2f}-{high:.2f} {int(n):>9} {'#' * round(40 * n / peak)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Compact per-detection storage with live re-thresholding.
+
+The model is run once with a low confidence floor and NMS switched off
+(see ``analysis.RAW_CONF`` / ``analysis.RAW_IOU``) and every candidate is
+kept in one structured array. ``nms_mask`` runs the same greedy NMS the
+model would on the candidates above a confidence threshold, so the counts
+equal those of a plain ``model(image)`` call at that pair.
+
+For each detection we also precompute ``suppress_iou``: the highest IoU with
+any higher-confidence detection of the same class. Keeping the detections
+where it is below ``t`` is "Fast NMS", which can keep a few more boxes than
+greedy NMS (a box suppressed by one that was itself suppressed) but needs
+only two comparisons, so it serves the live preview while a slider moves.
+"""
+import numpy as np
+
+DETECTION_DTYPE = np.dtype([
+    ("box", "<f4", (4,)),         # x1, y1, x2, y2 in image pixels
+    ("cls", "u1"),
+    ("conf", "<f4"),
+    ("suppress_iou", "<f4"),
+])
+# ultralytics' max_wh: per-class box offset that keeps NMS class-aware
+CLASS_OFFSET = 7680
+
+
+def pairwise_iou(a, b):
+    ix = np.clip(np.minimum(a[:, None, 2], b[None, :, 2])
+                 - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    iy = np.clip(np.minimum(a[:, None, 3], b[None, :, 3])
+                 - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = ix * iy
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def suppression_iou(boxes, classes, confidences, chunk_size=512):
+    """Max IoU of each detection with a higher-confidence one of its class."""
+    n = len(boxes)
+    result = np.zeros(n, dtype=np.float32)
+    if n < 2:
+        return result
+
+    order = np.argsort(-confidences, kind="stable")
+    boxes = boxes[order]
+    classes = classes[order]
+    ranked = np.zeros(n, dtype=np.float32)
+    for start in range(1, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        iou = pairwise_iou(boxes[start:stop], boxes[:stop])
+        iou[classes[start:stop, None] != classes[None, :stop]] = 0
+        iou[np.arange(start, stop)[:, None] <= np.arange(stop)[None, :]] = 0
+        ranked[start:stop] = iou.max(axis=1)
+    result[order] = ranked
+    return result
+
+
+def pack(boxes, classes, confidences):
+    """Build the structured detection array from the model's raw arrays."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    classes = np.asarray(classes, dtype=np.int64)
+    confidences = np.asarray(confidences, dtype=np.float32)
+    detections = np.empty(len(boxes), dtype=DETECTION_DTYPE)
+    detections["box"] = boxes
+    detections["cls"] = classes
+    detections["conf"] = confidences
+    detections["suppress_iou"] = suppression_iou(boxes, classes, confidences)
+    return detections
+
+
+def threshold_mask(detections, conf, iou):
+    """Fast NMS approximation of ``nms_mask``, cheap enough for every slider step."""
+    return (detections["conf"] > conf) & (detections["suppress_iou"] < iou)
+
+
+def greedy_nms(boxes, classes, confidences, conf, iou, max_det=300):
+    """Indices ultralytics keeps at ``conf``/``iou``: class-aware greedy NMS
+    over the candidates above ``conf``, at most ``max_det`` of them."""
+    import torch
+    from torchvision.ops import nms
+
+    confidences = np.asarray(confidences, dtype=np.float32)
+    candidates = np.flatnonzero(confidences > conf)
+    if not len(candidates):
+        return candidates
+    # Classes are separated by the same float32 offset ultralytics adds, so
+    # rounding near the threshold matches too; merged tiles of a bigger
+    # frame need a bigger one
+    boxes = np.asarray(boxes, dtype=np.float32)[candidates]
+    offset = np.float32(max(CLASS_OFFSET, float(boxes.max()) + 1))
+    boxes = boxes + np.asarray(classes, dtype=np.float32)[candidates, None] * offset
+    keep = nms(torch.from_numpy(boxes), torch.from_numpy(confidences[candidates]), iou)
+    return candidates[keep[:max_det].numpy()]
+
+
+def nms_mask(detections, conf, iou, max_det=300):
+    """``greedy_nms`` over a detection array, as a boolean mask."""
+    mask = np.zeros(len(detections), dtype=bool)
+    mask[greedy_nms(detections["box"], detections["cls"], detections["conf"],
+                    conf, iou, max_det)] = True
+    return mask
+
+
+def class_counts(detections, mask=None):
+    classes = detections["cls"] if mask is None else detections["cls"][mask]
+    return np.bincount(classes, minlength=3)[:3]
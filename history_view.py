@@ -0,0 +1,229 @@
+"""History browser behind the "Hisobotlar" sidebar button.
+
+``HistoryModel`` is a ``QAbstractListModel`` over ``ResultsDB.page``: the
+view asks for more rows (``fetchMore``) only as it scrolls, 200 at a time,
+and thumbnails are requested only for rows the view actually paints.
+``ThumbnailLoader`` renders them on a ``QThreadPool`` newest request
+first, dropping requests for rows scrolled far past, and the rendered JPEGs
+land in the persistent ``thumbnails.ThumbnailCache``.
+"""
+import threading
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from PyQt6.QtCore import (QAbstractListModel, QModelIndex, QObject, QRunnable, QSize, Qt,
+                          QThreadPool, QUrl, pyqtSignal)
+from PyQt6.QtGui import QColor, QDesktopServices, QPixmap
+from PyQt6.QtWidgets import QLabel, QListView, QVBoxLayout, QWidget
+
+from thumbnails import THUMBNAIL_SIZE, ThumbnailCache
+
+PAGE_SIZE = 200
+PIXMAP_CACHE_SIZE = 512     # decoded thumbnails kept in memory
+MAX_PENDING = 64            # thumbnail requests waiting for a worker
+
+
+def preferred_image(image_path):
+    """The annotated copy of a saved image when there is one."""
+    path = Path(image_path)
+    annotated = path.with_name(f"{path.stem}_annotated.jpg")
+    return annotated if annotated.exists() else path
+
+
+class _Signals(QObject):
+    ready = pyqtSignal(int, bytes)      # analysis id, JPEG bytes (empty on failure)
+
+
+class _ThumbnailJob(QRunnable):
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def run(self):
+        self.loader.work()
+
+
+class ThumbnailLoader:
+    """Renders thumbnails in the background, most recent request first."""
+
+    def __init__(self, cache=None, threads=2):
+        self.cache = cache or ThumbnailCache()
+        self.signals = _Signals()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads)
+        self._pending = deque()
+        self._queued = set()
+        self._lock = threading.Lock()
+
+    def request(self, analysis_id, image_path):
+        with self._lock:
+            if analysis_id in self._queued:
+                return
+            self._pending.append((analysis_id, image_path))
+            self._queued.add(analysis_id)
+            # Rows scrolled past long ago are not worth rendering any more
+            while len(self._pending) > MAX_PENDING:
+                dropped, _ = self._pending.popleft()
+                self._queued.discard(dropped)
+        self.pool.start(_ThumbnailJob(self))
+
+    def work(self):
+        with self._lock:
+            if not self._pending:
+                return
+            analysis_id, image_path = self._pending.pop()
+        try:
+            data = self.cache.get(preferred_image(image_path))
+        except Exception:
+            data = b""
+        with self._lock:
+            self._queued.discard(analysis_id)
+        self.signals.ready.emit(analysis_id, data)
+
+    def shutdown(self):
+        with self._lock:
+            self._pending.clear()
+            self._queued.clear()
+        self.pool.waitForDone()
+
+
+class HistoryModel(QAbstractListModel):
+    def __init__(self, db, loader, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.loader = loader
+        self.rows = []
+        self.row_of = {}                # analysis id -> row number
+        self.total = 0
+        self.pixmaps = OrderedDict()    # analysis id -> QPixmap, or None if it failed
+        self.placeholder = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.placeholder.fill(QColor("#374151"))
+        loader.signals.ready.connect(self.on_thumbnail)
+
+    def reload(self):
+        self.beginResetModel()
+        self.rows = []
+        self.row_of = {}
+        self.total = self.db.count()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and len(self.rows) < self.total
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        last = self.rows[-1] if self.rows else None
+        page = self.db.page((last["created_at"], last["id"]) if last else None, PAGE_SIZE)
+        if not page:
+            self.total = len(self.rows)
+            return
+        start = len(self.rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        for offset, row in enumerate(page):
+            self.row_of[row["id"]] = start + offset
+        self.rows.extend(page)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.describe(row)
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.thumbnail(row)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return "\n".join(str(row[k]) for k in ("image_path", "report_html_path", "data_path")
+                             if row[k])
+        if role == Qt.ItemDataRole.UserRole:
+            return row
+        return None
+
+    @staticmethod
+    def describe(row):
+        patient = row["patient_name"] or "Bemor ko'rsatilmagan"
+        if row["patient_id"]:
+            patient += f" ({row['patient_id']})"
+        counts = (f"Trik {row['live_pct'] or 0}%  ·  O'lik {row['dead_pct'] or 0}%  ·  "
+                  f"Yetilmagan {row['immature_pct'] or 0}%")
+        if row["total"] is not None:
+            counts += f"  ·  jami {row['total']} dona"
+        doctor = f"  ·  {row['doctor']}" if row["doctor"] else ""
+        return f"{row['created_at'][:16]}  {patient}{doctor}\n{counts}"
+
+    def thumbnail(self, row):
+        analysis_id = row["id"]
+        if analysis_id in self.pixmaps:
+            self.pixmaps.move_to_end(analysis_id)
+            return self.pixmaps[analysis_id] or self.placeholder
+        if row["image_path"]:
+            self.loader.request(analysis_id, row["image_path"])
+        return self.placeholder
+
+    def on_thumbnail(self, analysis_id, data):
+        pixmap = QPixmap()
+        if not data or not pixmap.loadFromData(data, "JPG"):
+            pixmap = None
+        self.pixmaps[analysis_id] = pixmap
+        while len(self.pixmaps) > PIXMAP_CACHE_SIZE:
+            self.pixmaps.popitem(last=False)
+        row = self.row_of.get(analysis_id)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
+class HistoryPage(QWidget):
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.loader = ThumbnailLoader()
+        self.model = HistoryModel(db, self.loader, self)
+
+        layout = QVBoxLayout(self)
+        layout.setSpacing(15)
+        title = QLabel("Hisobotlar")
+        title.setStyleSheet("color: white; font-size: 24px; font-weight: bold;")
+        self.count_label = QLabel("")
+        self.count_label.setStyleSheet("color: #9CA3AF; font-size: 14px;")
+
+        self.view = QListView()
+        self.view.setModel(self.model)
+        # Uniform rows let the view lay out only what is on screen
+        self.view.setUniformItemSizes(True)
+        self.view.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.view.setSpacing(4)
+        self.view.doubleClicked.connect(self.open_entry)
+        self.view.setStyleSheet("""
+            QListView {
+                background-color: #1F2937;
+                color: #E5E7EB;
+                border-radius: 10px;
+                font-size: 13px;
+            }
+            QListView::item:selected {
+                background-color: rgba(79, 70, 229, 0.4);
+            }
+        """)
+
+        layout.addWidget(title)
+        layout.addWidget(self.count_label)
+        layout.addWidget(self.view)
+
+    def refresh(self):
+        self.model.reload()
+        self.count_label.setText(f"Jami {self.model.total} ta tahlil. "
+                                 "Ochish uchun ikki marta bosing.")
+
+    def open_entry(self, index):
+        row = self.model.data(index, Qt.ItemDataRole.UserRole)
+        for key in ("report_html_path", "image_path", "data_path"):
+            if row[key] and Path(row[key]).exists():
+                QDesktopServices.openUrl(QUrl.fromLocalFile(str(Path(row[key]).resolve())))
+                return
+
+    def shutdown(self):
+        self.loader.shutdown()
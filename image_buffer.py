@@ -0,0 +1,156 @@
+"""Decode-once image buffers shared by the preview and inference.
+
+An image is decoded into one BGR ndarray. Uncompressed 24-bit BMP files
+(and uncompressed TIFFs when ``tifffile`` is installed) are memory-mapped
+instead of read, so a very large frame costs address space rather than
+resident memory until pixels are actually touched. The preview is a small
+downscaled copy made from that same buffer; inference and tiling read the
+buffer directly.
+
+Usage:
+    python image_buffer.py big_frame.bmp    # decode/preview latency and peak RSS
+"""
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+
+MEMMAP_MIN_BYTES = 32 * 1024 * 1024
+
+
+def _memmap_bmp(path):
+    """Map a 24-bit uncompressed BMP as an (H, W, 3) BGR view, or ``None``."""
+    import numpy as np
+
+    with open(path, "rb") as f:
+        header = f.read(54)
+    if len(header) < 54 or header[:2] != b"BM":
+        return None
+    offset, = struct.unpack_from("<I", header, 10)
+    width, height = struct.unpack_from("<ii", header, 18)
+    bpp, compression = struct.unpack_from("<HI", header, 28)
+    if bpp != 24 or compression != 0 or width <= 0 or height == 0:
+        return None
+
+    rows = abs(height)
+    stride = (width * 3 + 3) // 4 * 4
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(rows, stride))
+    image = np.lib.stride_tricks.as_strided(
+        data, shape=(rows, width, 3), strides=(stride, 3, 1), writeable=False
+    )
+    # Positive height means rows are stored bottom-up
+    return image[::-1] if height > 0 else image
+
+
+def _memmap_tiff(path):
+    import numpy as np
+
+    try:
+        import tifffile
+    except ImportError:
+        return None
+    try:
+        image = tifffile.memmap(path, mode="r")
+    except (ValueError, OSError):
+        # Compressed or tiled TIFFs cannot be mapped
+        return None
+    if image.ndim != 3 or image.shape[2] != 3 or image.dtype != np.uint8:
+        return None
+    return image[..., ::-1]     # TIFF stores RGB
+
+
+def decode_image(path, memmap_min_bytes=MEMMAP_MIN_BYTES):
+    """Decode ``path`` once into a BGR ndarray (memory-mapped when possible)."""
+    path = str(path)
+    suffix = Path(path).suffix.lower()
+    if os.path.getsize(path) >= memmap_min_bytes:
+        if suffix == ".bmp":
+            image = _memmap_bmp(path)
+        elif suffix in (".tif", ".tiff"):
+            image = _memmap_tiff(path)
+        else:
+            image = None
+        if image is not None:
+            return image
+
+    import cv2
+
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Rasmni o'qib bo'lmadi: {path}")
+    return image
+
+
+def is_mapped(image):
+    """True when ``image`` is a view over a memory-mapped file."""
+    import mmap
+
+    import numpy as np
+
+    while image is not None:
+        if isinstance(image, (np.memmap, mmap.mmap)):
+            return True
+        image = getattr(image, "base", None)
+    return False
+
+
+def contiguous(image):
+    """The buffer itself if OpenCV can use it directly, else one copy."""
+    import numpy as np
+
+    return image if image.flags.c_contiguous else np.ascontiguousarray(image)
+
+
+def downscale(image, max_width, max_height):
+    """Contiguous BGR copy that fits in ``max_width`` x ``max_height``.
+
+    Large memory-mapped frames are first subsampled by an integer step, so
+    only the rows that end up in the preview are read from disk.
+    """
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = min(max_width / width, max_height / height, 1.0)
+    target = (max(1, int(width * scale)), max(1, int(height * scale)))
+    step = max(1, int(1 / scale) // 2)
+    if step > 1:
+        image = image[::step, ::step]
+    image = contiguous(image)
+    if (image.shape[1], image.shape[0]) == target:
+        return image
+    return cv2.resize(image, target, interpolation=cv2.INTER_AREA)
+
+
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("Foydalanish: python image_buffer.py RASM [PREVIEW_W PREVIEW_H]", file=sys.stderr)
+        return 2
+    path = argv[0]
+    max_w, max_h = (int(argv[1]), int(argv[2])) if len(argv) >= 3 else (800, 600)
+
+    start = time.perf_counter()
+    image = decode_image(path)
+    decoded = time.perf_counter()
+    preview = downscale(image, max_w, max_h)
+    done = time.perf_counter()
+
+    kind = "memmap" if is_mapped(image) else "decode"
+    print(f"{path}: {image.shape[1]}x{image.shape[0]} ({kind})")
+    print(f"  decode:  {(decoded - start) * 1000:.1f} ms")
+    print(f"  preview: {(done - decoded) * 1000:.1f} ms -> {preview.shape[1]}x{preview.shape[0]}")
+    print(f"  peak RSS: {peak_rss_mb():.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""Multi-process inference pool for multi-core CPUs.
+
+Each worker process loads its own copy of the model and pins torch to a
+fixed number of intra-op threads, so N workers x T threads fill the machine
+without oversubscribing it. Image files are decoded by the workers
+themselves; decoded arrays are handed over through ``SharedMemory`` blocks,
+never pickled. Workers return the packed detection array (a few KB) and
+``submit`` returns a ``Future``; ``map`` yields results in submission order.
+
+``InferencePool`` offers the parts of the ``SpermAnalyzer`` interface the
+desktop app and ``batch_analyze.py`` use (``load``, ``analyze``,
+``analyze_batch``, ``cached``, ``remember``), so either can be passed where
+an analyzer is expected. Tiled analysis stays in-process.
+
+Usage:
+    python inference_pool.py images/train --workers 1 2 4 8    # scaling run
+"""
+import argparse
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+
+from analysis import DEFAULT_CONF, DEFAULT_IOU, DEFAULT_MODEL_PATH, AnalysisResult, SpermAnalyzer
+
+
+def default_layout(workers=None, threads=None):
+    """``(workers, threads)`` filling the CPU count; 4 threads per worker by default."""
+    cpus = os.cpu_count() or 1
+    if workers is None:
+        workers = max(1, cpus // (threads or 4))
+    if threads is None:
+        threads = max(1, cpus // workers)
+    return workers, threads
+
+
+def pin_threads(threads):
+    """Limit this process to ``threads`` compute threads; call before loading a model."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    import cv2
+
+    cv2.setNumThreads(1)
+
+
+def _worker_main(index, config, tasks, results):
+    try:
+        pin_threads(config["threads"])
+        import numpy as np
+
+        analyzer = SpermAnalyzer(config["model_path"], backend=config["backend"],
+                                 conf=config["conf"], iou=config["iou"],
+                                 **config["predict_kwargs"]).load()
+        # The first predict call builds the predictor; do it before reporting ready
+        imgsz = config["predict_kwargs"].get("imgsz") or 640
+        analyzer.infer(np.zeros((imgsz, imgsz, 3), dtype=np.uint8))
+    except Exception as e:
+        results.put(("failed", index, str(e)))
+        return
+    results.put(("ready", index, analyzer.backend))
+
+    from multiprocessing import shared_memory
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, kind, payload = task
+        try:
+            if kind == "path":
+                result = analyzer.analyze(payload)
+            else:
+                name, shape, dtype = payload
+                # Spawned workers share the parent's resource tracker, so
+                # attaching does not make them owners; the parent unlinks
+                block = shared_memory.SharedMemory(name=name)
+                try:
+                    image = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+                    result = analyzer.postprocess(analyzer.infer(image))[0]
+                    del image
+                finally:
+                    block.close()
+            results.put(("done", job_id, (result.detections, result.image_shape)))
+        except Exception as e:
+            results.put(("error", job_id, str(e)))
+
+
+class InferencePool:
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, backend="pytorch", workers=None,
+                 threads=None, cache=None, conf=DEFAULT_CONF, iou=DEFAULT_IOU,
+                 **predict_kwargs):
+        self.workers, self.threads = default_layout(workers, threads)
+        self.conf = conf
+        self.iou = iou
+        # Never loaded: only used for cache keys, so hits match SpermAnalyzer's
+        self._keys = SpermAnalyzer(model_path, backend=backend, cache=cache, conf=conf,
+                                   iou=iou, **predict_kwargs)
+        self._config = {
+            "model_path": model_path,
+            "backend": backend,
+            "threads": self.threads,
+            "conf": conf,
+            "iou": iou,
+            "predict_kwargs": predict_kwargs,
+        }
+        self.backend = None
+        self._processes = []
+        self._pending = {}          # job id -> (future, shared memory block or None)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._collector = None
+        self._closed = False
+
+    @property
+    def cache(self):
+        return self._keys.cache
+
+    @property
+    def is_loaded(self):
+        return bool(self._processes)
+
+    def load(self):
+        """Start the workers and wait until every one has loaded the model."""
+        import multiprocessing
+
+        if self._processes:
+            return self
+        context = multiprocessing.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        for index in range(self.workers):
+            process = context.Process(target=_worker_main, daemon=True,
+                                      args=(index, self._config, self._tasks, self._results))
+            process.start()
+            self._processes.append(process)
+
+        ready = 0
+        while ready < self.workers:
+            try:
+                status, index, detail = self._results.get(timeout=0.5)
+            except queue.Empty:
+                # A worker killed by an import error, OOM or a crash never reports
+                if any(not p.is_alive() for p in self._processes):
+                    self.close()
+                    raise RuntimeError("Ishchi jarayon model yuklanmasdan to'xtadi")
+                continue
+            if status == "failed":
+                self.close()
+                raise RuntimeError(f"{index}-ishchi modelni yuklay olmadi: {detail}")
+            ready += 1
+            self.backend = detail
+        self._keys.backend = self.backend
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        return self
+
+    def _collect(self):
+        while True:
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                if self._closed:
+                    return
+                if any(not p.is_alive() for p in self._processes):
+                    self._fail_pending("Ishchi jarayon kutilmaganda to'xtadi")
+                    return
+                continue
+            if message is None:
+                return
+            status, job_id, payload = message
+            with self._lock:
+                future, block = self._pending.pop(job_id, (None, None))
+            if block is not None:
+                block.close()
+                block.unlink()
+            if future is None:
+                continue
+            if status == "done":
+                detections, image_shape = payload
+                future.set_result(AnalysisResult.from_detections(
+                    detections, image_shape, self.conf, self.iou))
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def _fail_pending(self, message):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, block in pending.values():
+            if block is not None:
+                block.close()
+                block.unlink()
+            if not future.done():
+                future.set_exception(RuntimeError(message))
+
+    def submit(self, source):
+        """Queue one image (path or BGR array); return a Future of AnalysisResult."""
+        if not self._processes:
+            self.load()
+        if self._closed:
+            raise RuntimeError("Pool yopilgan")
+        job_id = next(self._ids)
+        future = Future()
+        block = None
+        if isinstance(source, (str, Path)):
+            task = (job_id, "path", str(source))
+        else:
+            import numpy as np
+            from multiprocessing import shared_memory
+
+            block = shared_memory.SharedMemory(create=True, size=max(1, source.nbytes))
+            np.ndarray(source.shape, dtype=source.dtype, buffer=block.buf)[...] = source
+            task = (job_id, "shm", (block.name, source.shape, source.dtype.str))
+        with self._lock:
+            self._pending[job_id] = (future, block)
+        self._tasks.put(task)
+        return future
+
+    def map(self, sources, window=None):
+        """Yield results in submission order, keeping at most ``window`` in flight."""
+        window = window or 2 * self.workers
+        in_flight = deque()
+        for source in sources:
+            in_flight.append(self.submit(source))
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+    # --- SpermAnalyzer-compatible surface ------------------------------------
+
+    def cached(self, path, **options):
+        return self._keys.cached(path, **options)
+
+    def remember(self, path, result, seconds, **options):
+        self._keys.remember(path, result, seconds, **options)
+
+    def analyze(self, source):
+        return self.analyze_batch([source])[0]
+
+    def analyze_batch(self, sources):
+        sources = list(sources)
+        results = [None] * len(sources)
+        for i, source in enumerate(sources):
+            if self.cache is not None and isinstance(source, (str, Path)):
+                results[i] = self.cached(source)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            start = time.perf_counter()
+            for i, result in zip(missing, self.map(sources[i] for i in missing)):
+                results[i] = result
+            seconds = (time.perf_counter() - start) / len(missing)
+            for i in missing:
+                if isinstance(sources[i], (str, Path)):
+                    self.remember(sources[i], results[i], seconds)
+        return results
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if self._collector is not None:
+            self._results.put(None)
+            self._collector.join(timeout=5)
+        self._fail_pending("Pool yopildi")
+
+    def __enter__(self):
+        return self.load()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    from backends import BACKENDS, DEFAULT_BACKEND
+    from batch_analyze import find_images
+
+    parser = argparse.ArgumentParser(description="Inference pool masshtablanishini o'lchash")
+    parser.add_argument("directory", help="Rasmlar papkasi, masalan images/train")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=sorted(BACKENDS))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Har bir ishchi uchun torch oqimlari (standart: CPU / ishchilar)")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--arrays", action="store_true",
+                        help="Rasmlarni oldindan o'qib, shared memory orqali yuborish")
+    args = parser.parse_args(argv)
+
+    paths = [str(p) for p in find_images(args.directory)] * args.repeat
+    if not paths:
+        print(f"Papkada rasm topilmadi: {args.directory}", file=sys.stderr)
+        return 1
+    sources = paths
+    if args.arrays:
+        from analysis import read_image
+        sources = [read_image(p) for p in paths]
+
+    baseline = None
+    print(f"CPU: {os.cpu_count()}  |  rasmlar: {len(sources)}")
+    for workers in args.workers:
+        with InferencePool(args.model, args.backend, workers, args.threads) as pool:
+            pool.analyze(sources[0])       # warm-up
+            start = time.perf_counter()
+            counts = [result.counts for result in pool.map(sources)]
+            elapsed = time.perf_counter() - start
+        rate = len(counts) / elapsed
+        baseline = baseline or rate
+        print(f"{workers} ishchi x {pool.threads} oqim: {rate:.2f} rasm/s  "
+              f"(x{rate / baseline:.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
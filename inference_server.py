@@ -0,0 +1,407 @@
+"""Local inference server with dynamic micro-batching.
+
+Usage:
+    python inference_server.py --port 8765 --max-batch 8 --max-wait-ms 10
+    SPERMAI_SERVER=http://127.0.0.1:8765 python main.py
+
+One process loads the model once and serves every station on the machine
+over localhost HTTP (asyncio, stdlib only). Concurrent requests are queued
+and coalesced into micro-batches of equal-sized images: a batch is sent to
+the model as soon as it holds ``--max-batch`` images or the oldest one has
+waited ``--max-wait-ms``.
+When ``--queue-size`` images are already waiting, new requests get ``503``
+with ``Retry-After`` instead of piling up.
+
+Endpoints:
+    POST /analyze   body: encoded image file, or raw BGR pixels with
+                    ``Content-Type: application/x-ndarray`` and
+                    ``X-Shape: H,W,3``. Response: the packed
+                    ``detections.DETECTION_DTYPE`` array, image shape in
+                    ``X-Image-Shape``.
+    GET  /health    JSON: backend, weights hash, queue depth, batch stats.
+    GET  /metrics   Prometheus text (see ``metrics``).
+
+``RemoteAnalyzer`` is the client side; it offers the analyzer interface the
+desktop app uses, so the app can run without a local model.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+from analysis import DEFAULT_CONF, DEFAULT_IOU, DEFAULT_MODEL_PATH, AnalysisResult, SpermAnalyzer
+from metrics import METRICS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 8
+DEFAULT_MAX_WAIT_MS = 10.0
+DEFAULT_QUEUE_SIZE = 64
+MAX_BODY_BYTES = 512 * 1024 * 1024
+NDARRAY_TYPE = "application/x-ndarray"
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def decode_body(body, headers):
+    """Image bytes from a request body -> BGR ndarray."""
+    import numpy as np
+
+    if headers.get("content-type", "").startswith(NDARRAY_TYPE):
+        try:
+            shape = tuple(int(v) for v in headers["x-shape"].split(","))
+        except (KeyError, ValueError):
+            raise HTTPError(400, "X-Shape sarlavhasi kerak (H,W,3)")
+        if np.prod(shape) != len(body):
+            raise HTTPError(400, "Tana hajmi X-Shape ga mos emas")
+        return np.frombuffer(body, dtype=np.uint8).reshape(shape)
+
+    import cv2
+
+    image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise HTTPError(400, "Rasmni o'qib bo'lmadi")
+    return image
+
+
+class InferenceServer:
+    def __init__(self, analyzer, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.analyzer = analyzer
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue_size = queue_size
+        self.batches = 0
+        self.images = 0
+        self.rejected = 0
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._batcher = asyncio.create_task(self._batch_loop())
+        self._batcher.add_done_callback(self._batcher_done)
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._batcher.cancel()
+
+    # --- Micro-batching -----------------------------------------------------
+
+    async def _batch_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await self._run_batch(batch)
+            except asyncio.CancelledError:
+                self._fail(batch, HTTPError(503, "Server tahlilni to'xtatdi"))
+                raise
+            except Exception as e:
+                # Whatever went wrong, these requests get an answer and the
+                # loop keeps serving the next ones
+                print(f"Paketni qayta ishlashda xatolik: {e!r}", file=sys.stderr)
+                self._fail(batch, e)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        now = time.perf_counter()
+        for _, _, queued_at in batch:
+            METRICS.record("server_queue_wait", now - queued_at)
+        # ultralytics letterboxes mixed-size batches differently from
+        # single images; batching only equal shapes keeps results identical
+        groups = {}
+        for item in batch:
+            groups.setdefault(item[0].shape, []).append(item)
+        for group in groups.values():
+            try:
+                # The model call blocks; run it off the event loop
+                results = await loop.run_in_executor(
+                    None, self._infer, [image for image, _, _ in group])
+            except Exception as e:
+                self._fail(group, e)
+                continue
+            self.batches += 1
+            self.images += len(group)
+            for (_, future, _), result in zip(group, results):
+                if not future.done():
+                    future.set_result(result)
+
+    @staticmethod
+    def _fail(items, error):
+        for _, future, _ in items:
+            if not future.done():
+                future.set_exception(error)
+
+    def _batcher_done(self, task):
+        # Only reached when the loop is cancelled (close) or something above
+        # the per-batch handler broke: nothing would answer queued requests
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Paketlash to'xtadi: {task.exception()!r}", file=sys.stderr)
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._fail(pending, HTTPError(503, "Server tahlilni to'xtatdi"))
+
+    def _infer(self, images):
+        with METRICS.stage("server_batch"):
+            return self.analyzer.postprocess(self.analyzer.infer(images))
+
+    async def submit(self, image):
+        """Queue one image; raises ``HTTPError(503)`` when the queue is full."""
+        if self._batcher.done():
+            raise HTTPError(503, "Server tahlilni to'xtatdi")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((image, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise HTTPError(503, "Navbat to'la, keyinroq urinib ko'ring")
+        return await future
+
+    # --- HTTP ---------------------------------------------------------------
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, b"", close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload, extra = await self._route(method, target.split("?")[0],
+                                                           headers, body)
+                await self._respond(writer, status, payload, extra, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, headers, body):
+        try:
+            if method == "POST" and path == "/analyze":
+                loop = asyncio.get_running_loop()
+                image = await loop.run_in_executor(None, decode_body, body, headers)
+                result = await self.submit(image)
+                shape = ",".join(str(v) for v in result.image_shape or ())
+                return 200, result.detections.tobytes(), {
+                    "Content-Type": "application/octet-stream",
+                    "X-Image-Shape": shape,
+                }
+            if method == "GET" and path == "/health":
+                return 200, json.dumps(self.health()).encode("utf-8"), {
+                    "Content-Type": "application/json"}
+            if method == "GET" and path == "/metrics":
+                return 200, METRICS.prometheus().encode("utf-8"), {
+                    "Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+            raise HTTPError(404, f"Noma'lum yo'l: {method} {path}")
+        except HTTPError as e:
+            extra = {"Retry-After": "1"} if e.status == 503 else {}
+            return e.status, str(e).encode("utf-8"), {"Content-Type": "text/plain; charset=utf-8",
+                                                      **extra}
+        except Exception as e:
+            return 500, str(e).encode("utf-8"), {"Content-Type": "text/plain; charset=utf-8"}
+
+    async def _respond(self, writer, status, payload, extra=None, close=False):
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+                f"Content-Length: {len(payload)}",
+                f"Connection: {'close' if close else 'keep-alive'}"]
+        head += [f"{name}: {value}" for name, value in (extra or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+    def health(self):
+        from backends import file_hash
+
+        analyzer = self.analyzer
+        if analyzer._model_hash is None:
+            analyzer._model_hash = file_hash(analyzer.model_path)
+        return {
+            "backend": analyzer.backend,
+            "model_sha256": analyzer._model_hash,
+            "predict_kwargs": {k: v for k, v in analyzer.predict_kwargs.items() if k != "verbose"},
+            "queue": self._queue.qsize(),
+            "queue_size": self.queue_size,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "images": self.images,
+            "mean_batch": self.images / self.batches if self.batches else 0.0,
+            "rejected": self.rejected,
+        }
+
+
+class RemoteAnalyzer:
+    """Analyzer interface backed by an ``InferenceServer``.
+
+    Raw detections come back from the server, so thresholds are applied and
+    re-applied locally exactly as with an in-process model. With a
+    ``DetectionCache`` the cache keys use the server's weights hash and
+    settings, so entries are shared with local analysis of the same model.
+    """
+
+    def __init__(self, url, cache=None, conf=DEFAULT_CONF, iou=DEFAULT_IOU, timeout=120,
+                 retries=5):
+        self.url = url.rstrip("/")
+        self.conf = conf
+        self.iou = iou
+        self.timeout = timeout
+        self.retries = retries
+        self.backend = None
+        self._keys = SpermAnalyzer(None, cache=cache, conf=conf, iou=iou)
+
+    @property
+    def cache(self):
+        return self._keys.cache
+
+    @property
+    def is_loaded(self):
+        return self.backend is not None
+
+    def _request(self, path, body=None, headers=None):
+        import urllib.error
+        import urllib.request
+
+        for attempt in range(self.retries + 1):
+            request = urllib.request.Request(self.url + path, data=body, headers=headers or {})
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return response.read(), response.headers
+            except urllib.error.HTTPError as e:
+                if e.code != 503 or attempt == self.retries:
+                    raise RuntimeError(f"Server xatosi {e.code}: {e.read().decode('utf-8', 'replace')}")
+                # Backpressure: back off and retry
+                time.sleep(float(e.headers.get("Retry-After", 1)) * (attempt + 1) / 4)
+            except urllib.error.URLError as e:
+                raise RuntimeError(f"Serverga ulanib bo'lmadi ({self.url}): {e.reason}")
+
+    def load(self):
+        body, _ = self._request("/health")
+        health = json.loads(body)
+        self.backend = f"server:{health['backend']}"
+        self._keys.backend = health["backend"]
+        self._keys._model_hash = health["model_sha256"]
+        self._keys.predict_kwargs = health["predict_kwargs"]
+        return self
+
+    def analyze(self, source):
+        import numpy as np
+
+        from detections import DETECTION_DTYPE
+
+        if isinstance(source, (str, Path)):
+            body, headers = Path(source).read_bytes(), {"Content-Type": "application/octet-stream"}
+        else:
+            source = np.ascontiguousarray(source, dtype=np.uint8)
+            body = source.tobytes()
+            headers = {"Content-Type": NDARRAY_TYPE,
+                       "X-Shape": ",".join(str(v) for v in source.shape)}
+        payload, response_headers = self._request("/analyze", body, headers)
+        detections = np.frombuffer(payload, dtype=DETECTION_DTYPE).copy()
+        shape = response_headers.get("X-Image-Shape") or ""
+        image_shape = tuple(int(v) for v in shape.split(",")[:2]) if shape else None
+        return AnalysisResult.from_detections(detections, image_shape, self.conf, self.iou)
+
+    def analyze_batch(self, sources):
+        # Concurrent requests let the server batch them together
+        from concurrent.futures import ThreadPoolExecutor
+
+        sources = list(sources)
+        results = [self.cached(s) if isinstance(s, (str, Path)) else None for s in sources]
+        missing = [i for i, result in enumerate(results) if result is None]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(8, len(missing) or 1)) as executor:
+            for i, result in zip(missing, executor.map(self.analyze, [sources[i] for i in missing])):
+                results[i] = result
+        seconds = (time.perf_counter() - start) / max(1, len(missing))
+        for i in missing:
+            if isinstance(sources[i], (str, Path)):
+                self.remember(sources[i], results[i], seconds)
+        return results
+
+    def cached(self, path, **options):
+        if self.cache is None or not self.is_loaded:
+            return None
+        return self._keys.cached(path, **options)
+
+    def remember(self, path, result, seconds, **options):
+        if self.is_loaded:
+            self._keys.remember(path, result, seconds, **options)
+
+
+def parse_args(argv=None):
+    from backends import BACKENDS, DEFAULT_BACKEND
+
+    parser = argparse.ArgumentParser(description="SpermAI lokal inference serveri")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=sorted(BACKENDS))
+    parser.add_argument("--imgsz", type=int, default=None)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help="Bitta model chaqiruvidagi eng ko'p rasm")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="Batch to'lishini kutish vaqti (ms)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Navbat to'lsa yangi so'rovlar 503 oladi")
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    predict_kwargs = {"imgsz": args.imgsz} if args.imgsz else {}
+    analyzer = SpermAnalyzer(args.model, backend=args.backend, **predict_kwargs).load()
+    server = InferenceServer(analyzer, args.max_batch, args.max_wait_ms, args.queue_size)
+    await server.start(args.host, args.port)
+    print(f"Server: http://{args.host}:{args.port}  |  backend: {analyzer.backend}  |  "
+          f"batch {args.max_batch}, kutish {args.max_wait_ms} ms, navbat {args.queue_size}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
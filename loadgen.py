@@ -0,0 +1,140 @@
+"""Load generator for ``inference_server.py``.
+
+Usage:
+    python loadgen.py images/val --concurrency 1 2 4 8 16 --requests 64
+    python loadgen.py images/train --url http://127.0.0.1:8765 --encoded
+
+For each concurrency level, that many client threads send requests back to
+back until ``--requests`` have completed. Latency p50/p95/p99, throughput
+and the number of 503 (backpressure) responses are printed per level and
+can be saved as JSON with ``--output``.
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+from inference_server import DEFAULT_HOST, DEFAULT_PORT, NDARRAY_TYPE
+
+
+def load_payloads(directory, encoded=False):
+    """Request bodies and headers for every image in ``directory``."""
+    from analysis import read_image
+    from batch_analyze import find_images
+
+    payloads = []
+    for path in find_images(directory):
+        if encoded:
+            payloads.append((Path(path).read_bytes(),
+                             {"Content-Type": "application/octet-stream"}))
+        else:
+            image = read_image(path)
+            payloads.append((image.tobytes(), {
+                "Content-Type": NDARRAY_TYPE,
+                "X-Shape": ",".join(str(v) for v in image.shape),
+            }))
+    return payloads
+
+
+def run_level(url, payloads, concurrency, total):
+    parsed = urlparse(url)
+    latencies = []
+    rejected = [0]
+    errors = [0]
+    counter = iter(range(total))
+    lock = threading.Lock()
+
+    def client():
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=300)
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                break
+            body, headers = payloads[index % len(payloads)]
+            start = time.perf_counter()
+            try:
+                connection.request("POST", "/analyze", body, headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=300)
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status == 200:
+                    latencies.append(elapsed)
+                elif response.status == 503:
+                    rejected[0] += 1
+                else:
+                    errors[0] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return latencies, rejected[0], errors[0], wall
+
+
+def summarize(concurrency, latencies, rejected, errors, wall):
+    import numpy as np
+
+    ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "rejected": rejected,
+        "errors": errors,
+        "seconds": round(wall, 3),
+        "images_per_sec": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inference server uchun yuklama generatori")
+    parser.add_argument("directory", help="So'rovlarda yuboriladigan rasmlar papkasi")
+    parser.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=64, help="Har bir daraja uchun so'rovlar soni")
+    parser.add_argument("--encoded", action="store_true",
+                        help="Xom piksellar o'rniga rasm faylini yuborish (server decode qiladi)")
+    parser.add_argument("--output", default=None, help="Natijalarni JSON faylga yozish")
+    args = parser.parse_args(argv)
+
+    payloads = load_payloads(args.directory, args.encoded)
+    if not payloads:
+        print(f"Papkada rasm topilmadi: {args.directory}", file=sys.stderr)
+        return 1
+
+    # One request first so model warm-up is not counted
+    run_level(args.url, payloads, 1, 1)
+    rows = []
+    print(f"{'parallel':>8} {'rasm/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'503':>5} {'xato':>5}")
+    for concurrency in args.concurrency:
+        row = summarize(concurrency, *run_level(args.url, payloads, concurrency, args.requests))
+        rows.append(row)
+        print(f"{concurrency:>8} {row['images_per_sec']:>8} {row['p50_ms']:>9} {row['p95_ms']:>9} "
+              f"{row['p99_ms']:>9} {row['rejected']:>5} {row['errors']:>5}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"url": args.url, "levels": rows}, indent=2),
+                                     encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,15 +3,30 @@ from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                            QHBoxLayout, QPushButton, QLabel, QFileDialog, 
                            QFrame, QStackedWidget, QProgressBar, QSplitter,
                            QGraphicsDropShadowEffect, QDialog, QFormLayout, 
-                           QLineEdit, QTextEdit, QDialogButtonBox, QMessageBox)
-from PyQt6.QtCore import Qt, QSize, QTimer, QPropertyAnimation, QEasingCurve
+                           QLineEdit, QTextEdit, QDialogButtonBox, QMessageBox,
+                           QSlider, QCheckBox, QSizePolicy, QTableWidget,
+                           QTableWidgetItem, QHeaderView)
+from PyQt6.QtCore import (Qt, QSize, QThread, pyqtSignal, QPropertyAnimation,
+                          QEasingCurve)
 from PyQt6.QtGui import QIcon, QPixmap, QImage, QPalette, QColor, QFont, QScreen
-import cv2
-import numpy as np
-from ultralytics import YOLO
 import os
+import queue
+import time
 from datetime import datetime
-from pathlib import Path
+
+from analysis import (CLASS_NAMES, DEFAULT_CONF, DEFAULT_IOU, DEFAULT_MODEL_PATH,
+                      AnalysisResult, SpermAnalyzer, read_image)
+from app_config import load_config, setting
+from archive import archive_paths, atomic_write, new_stem, save_analysis
+from detection_cache import DetectionCache
+from detection_store import DetectionStore, store_dir
+from history_view import HistoryPage
+from image_buffer import contiguous, downscale
+from metrics import METRICS
+from overlay import ALL_CLASSES, OverlayCache, annotate
+from report import report_values, write_report
+from results_db import ResultsDB
+from stats_engine import CLASSES, dashboard
 
 class ModernButton(QPushButton):
     def __init__(self, text, icon_path=None, gradient=False):
@@ -173,18 +188,337 @@ class PatientInfoDialog(QDialog):
             'doctor': self.doctor_input.text()
         }
 
+class StatisticsPage(QWidget):
+    """Totals, class distribution and percentiles over all saved analyses.
+
+    Everything comes from the aggregate tables ``stats_engine`` keeps up to
+    date, so refreshing costs the same with ten rows or a hundred thousand.
+    """
+
+    COLUMNS = ["Tahlillar", "Spermalar", "Trik %", "O'lik %", "Yetilmagan %"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setSpacing(15)
+
+        title = QLabel("Statistika")
+        title.setStyleSheet("color: white; font-size: 24px; font-weight: bold;")
+        self.summary_label = QLabel("")
+        self.summary_label.setStyleSheet("color: #9CA3AF; font-size: 14px;")
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(title)
+        layout.addWidget(self.summary_label)
+
+        self.cards = {}
+        cards_layout = QHBoxLayout()
+        for cls, title_text in zip(CLASSES, ("Trik", "O'lik", "Yetilmagan")):
+            card = StatsCard(title_text)
+            self.cards[cls] = card
+            cards_layout.addWidget(card)
+        layout.addLayout(cards_layout)
+
+        tables_layout = QHBoxLayout()
+        self.days_table = self.create_table("Sana")
+        self.doctors_table = self.create_table("Shifokor")
+        for caption, table in (("Kunlar bo'yicha", self.days_table),
+                               ("Shifokorlar bo'yicha", self.doctors_table)):
+            column = QVBoxLayout()
+            label = QLabel(caption)
+            label.setStyleSheet("color: white; font-weight: bold; font-size: 16px;")
+            column.addWidget(label)
+            column.addWidget(table)
+            tables_layout.addLayout(column)
+        layout.addLayout(tables_layout)
+
+    def create_table(self, key_title):
+        table = QTableWidget(0, len(self.COLUMNS) + 1)
+        table.setHorizontalHeaderLabels([key_title] + self.COLUMNS)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        table.horizontalHeader().setStretchLastSection(True)
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        table.setStyleSheet("""
+            QTableWidget {
+                background-color: #1F2937;
+                color: #E5E7EB;
+                gridline-color: #374151;
+                border-radius: 10px;
+            }
+            QHeaderView::section {
+                background-color: #374151;
+                color: white;
+                border: none;
+                padding: 6px;
+            }
+        """)
+        return table
+
+    @staticmethod
+    def spread(row, cls):
+        # Median of the per-analysis percentages with the 10th-90th percentile range
+        p = row["percentiles"][cls]
+        return f"{p['p50']} ({p['p10']}-{p['p90']})" if p else "-"
+
+    def fill_table(self, table, rows):
+        table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            values = [row["key"] or "Noma'lum", row["analyses"], row["total"]]
+            values += [self.spread(row, cls) for cls in CLASSES]
+            for j, value in enumerate(values):
+                table.setItem(i, j, QTableWidgetItem(str(value)))
+
+    def refresh(self, db):
+        with METRICS.stage("statistics"):
+            data = dashboard(db)
+            overview = data["overview"]
+            if overview is None:
+                self.summary_label.setText("Hali saqlangan tahlillar yo'q")
+            else:
+                self.summary_label.setText(
+                    f"Jami {overview['analyses']} ta tahlil, {overview['total']} ta sperma aniqlangan. "
+                    f"Kartalarda barcha spermalar ulushi, jadvallarda tahlillar foizining "
+                    f"medianasi (10-90 persentil).")
+                for cls, card in self.cards.items():
+                    card.update_values(overview["distribution"][cls],
+                                       f"+{overview['counts'][cls]} dona")
+            self.fill_table(self.days_table, data["days"])
+            self.fill_table(self.doctors_table, data["doctors"])
+
+# Stages shown in the status panel breakdown, in display order
+STAGE_LABELS = [
+    ("decode", "o'qish"),
+    ("cache", "kesh"),
+    ("inference", "model"),
+    ("process_results", "natija"),
+    ("overlay", "chizish"),
+    ("save_report", "hisobot"),
+    ("save_results", "saqlash"),
+    ("save_archive", "arxiv"),
+    ("analyze_image", "jami"),
+]
+
+class ModelLoader(QThread):
+    """Loads the model in the background so the window can show immediately."""
+
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, analyzer, threads=None, parent=None):
+        super().__init__(parent)
+        self.analyzer = analyzer
+        self.threads = threads
+
+    def run(self):
+        try:
+            if self.threads:
+                import torch
+                torch.set_num_threads(self.threads)
+            with METRICS.stage("model_load"):
+                analyzer = self.analyzer.load()
+            self.loaded.emit(analyzer)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class InferenceWorker(QThread):
+    """Runs decode, YOLO inference and post-processing off the GUI thread.
+
+    The image is decoded once; the preview and the model both read that
+    buffer. Without an analyzer the worker only decodes (model still loading).
+    """
+
+    image_ready = pyqtSignal(object, object)
+    progress = pyqtSignal(int, str)
+    result_ready = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+    def __init__(self, analyzer, image_path, image=None, tile_size=0, preview_size=None,
+                 metrics_token=None, parent=None):
+        super().__init__(parent)
+        self.analyzer = analyzer
+        self.image_path = image_path
+        self.image = image
+        self.tile_size = tile_size
+        self.preview_size = preview_size
+        # Timings of a cancelled job must not land in the next image's breakdown
+        self.metrics_token = metrics_token
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            if self.image is None:
+                self.progress.emit(10, "Rasm o'qilmoqda...")
+                with METRICS.stage("decode", self.metrics_token):
+                    self.image = read_image(self.image_path)
+                    preview = downscale(self.image, *self.preview_size)
+                if self._cancelled:
+                    return
+                self.image_ready.emit(self.image, preview)
+            if self.analyzer is None:
+                return
+
+            if self.tile_size:
+                self.progress.emit(30, "Model tahlil qilmoqda...")
+                with METRICS.stage("inference", self.metrics_token):
+                    result = self.analyzer.analyze_tiled(self.image, self.tile_size,
+                                                         path=self.image_path)
+                if self._cancelled:
+                    return
+                self.progress.emit(100, "Tahlil yakunlandi")
+                self.result_ready.emit(result)
+                return
+
+            with METRICS.stage("cache", self.metrics_token):
+                result = self.analyzer.cached(self.image_path)
+            if result is not None:
+                self.progress.emit(100, "Natija keshdan olindi")
+                self.result_ready.emit(result)
+                return
+
+            self.progress.emit(30, "Model tahlil qilmoqda...")
+            start = time.perf_counter()
+            # In-process model or InferencePool; both return an AnalysisResult
+            result = self.analyzer.analyze(contiguous(self.image))
+            seconds = time.perf_counter() - start
+            METRICS.record("inference", seconds, self.metrics_token)
+            if self._cancelled:
+                return
+            self.analyzer.remember(self.image_path, result, seconds)
+
+            self.progress.emit(100, "Tahlil yakunlandi")
+            self.result_ready.emit(result)
+        except Exception as e:
+            if not self._cancelled:
+                self.error.emit(str(e))
+
+class ResultsWriter(QThread):
+    """Writes saved analyses to the archive one by one, off the GUI thread.
+
+    A job is a dict built by ``SpermAnalysisApp.save_results``; jobs are
+    written in the order they were submitted, and ``stop`` returns only
+    after the queue is drained.
+    """
+
+    saved = pyqtSignal(object)
+    failed = pyqtSignal(object, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.jobs = queue.Queue()
+
+    def submit(self, job):
+        self.jobs.put(job)
+        if not self.isRunning():
+            self.start()
+
+    def stop(self):
+        if self.isRunning():
+            self.jobs.put(None)
+            self.wait()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            try:
+                self.write(job)
+                self.saved.emit(job)
+            except Exception as e:
+                self.failed.emit(job, str(e))
+
+    def write(self, job):
+        import cv2
+
+        with METRICS.stage("save_archive", job["metrics_token"]):
+            job["duplicate"] = save_analysis(job["source"], job["stem"], job["summary"],
+                                             job["result"])
+        if job["image"] is None:
+            return
+        with METRICS.stage("save_annotated", job["metrics_token"]):
+            frame = annotate(job["image"], job["result"].boxes, job["result"].classes,
+                             job["result"].confidences, job["visible"], job["labels"])
+            ok, buffer = cv2.imencode(".jpg", frame)
+            if not ok:
+                raise OSError(f"Rasmni yozib bo'lmadi: {job['paths']['annotated']}")
+            atomic_write(job["paths"]["annotated"], lambda f: f.write(buffer))
+
 class SpermAnalysisApp(QMainWindow):
     def __init__(self):
         super().__init__()
+        startup_started = time.perf_counter()
+        self.inference_worker = None
+        self.analyzer = None
+        self.current_image = None
+        self.current_result = None
+        # Database row of each analysis, recorded once one of its saves succeeds
+        # A new serial starts with every loaded image
+        self.analysis_serial = 0
+        self.analysis_rows = {}
+        self.saves_by_serial = {}     # serial -> saves still on the writer queue
+        self.metrics_token = None
+        self.overlay = None
+        self._display_pixmap = None
+        self.results_db = ResultsDB()
+        self.detection_store = DetectionStore(store_dir(self.results_db.path))
+        self.results_writer = ResultsWriter(self)
+        self.results_writer.saved.connect(self.on_results_saved)
+        self.results_writer.failed.connect(self.on_results_failed)
+        self.pending_saves = 0
+        self.queued_stems = set()
+        # Settings recommended by sweep.py; environment variables still win
+        config = load_config()
+        # Frames larger than this are analyzed tile by tile (0 disables tiling)
+        self.tile_size = setting(config, "tile_size", "SPERMAI_TILE_SIZE", 0)
         self.init_ui()
-        
-        model_path = "best(1).pt"  # Your model path here
-        try:
-            self.model = YOLO(model_path)
-            self.status_label.setText("Model muvaffaqiyatli yuklandi")
-        except Exception as e:
-            self.status_label.setText(f"Model yuklanishida xatolik: {str(e)}")
-            self.model = None
+
+        # The model loads in the background; an image picked meanwhile is
+        # analyzed as soon as loading finishes
+        self.status_label.setText("Model yuklanmoqda...")
+        backend = setting(config, "backend", "SPERMAI_BACKEND", "pytorch")
+        predict_kwargs = {"imgsz": config["imgsz"]} if "imgsz" in config else {}
+        self.detection_cache = DetectionCache()
+        # SPERMAI_SERVER uses a shared inference_server.py; SPERMAI_WORKERS > 0
+        # runs inference in a local process pool (neither applies with tiling)
+        server_url = os.environ.get("SPERMAI_SERVER")
+        workers = int(os.environ.get("SPERMAI_WORKERS", "0"))
+        if server_url and not self.tile_size:
+            from inference_server import RemoteAnalyzer
+            analyzer = RemoteAnalyzer(server_url, cache=self.detection_cache)
+        elif workers and not self.tile_size:
+            from inference_pool import InferencePool
+            analyzer = InferencePool(DEFAULT_MODEL_PATH, backend, workers,
+                                     cache=self.detection_cache, **predict_kwargs)
+        else:
+            analyzer = SpermAnalyzer(DEFAULT_MODEL_PATH, backend=backend,
+                                     cache=self.detection_cache, **predict_kwargs)
+        threads = config.get("threads") if isinstance(analyzer, SpermAnalyzer) else None
+        self.model_loader = ModelLoader(analyzer, threads, self)
+        self.model_loader.loaded.connect(self.on_model_loaded)
+        self.model_loader.failed.connect(self.on_model_failed)
+        self.model_loader.start()
+
+        # Stage histograms: written on exit and/or served for Prometheus
+        self.metrics_file = os.environ.get("SPERMAI_METRICS_FILE")
+        metrics_port = os.environ.get("SPERMAI_METRICS_PORT")
+        if METRICS.enabled and metrics_port:
+            METRICS.serve(int(metrics_port))
+        METRICS.record("startup", time.perf_counter() - startup_started)
+
+    def on_model_loaded(self, analyzer):
+        self.analyzer = analyzer
+        load_time = METRICS.last.get("model_load")
+        backend = analyzer.backend if load_time is None else f"{analyzer.backend}, {load_time:.1f} s"
+        self.status_label.setText(f"Model muvaffaqiyatli yuklandi ({backend})")
+        if hasattr(self, 'current_image_path'):
+            self.analyze_image()
+
+    def on_model_failed(self, message):
+        self.analyzer = None
+        self.status_label.setText(f"Model yuklanishida xatolik: {message}")
 
     def init_ui(self):
         self.setWindowTitle("SpermAI Analysis Pro")
@@ -241,9 +575,15 @@ class SpermAnalysisApp(QMainWindow):
             ("Hisobotlar", "icons/document.png", False)
         ]
         
+        self.sidebar_buttons = {}
         for text, icon, is_active in sidebar_buttons:
             btn = ModernButton(text, icon, gradient=is_active)
             sidebar_layout.addWidget(btn)
+            self.sidebar_buttons[text] = btn
+        self.sidebar_buttons["Dashboard"].clicked.connect(self.show_analysis_page)
+        self.sidebar_buttons["Yangi Tahlil"].clicked.connect(self.show_analysis_page)
+        self.sidebar_buttons["Statistika"].clicked.connect(self.show_statistics_page)
+        self.sidebar_buttons["Hisobotlar"].clicked.connect(self.show_history_page)
         
         sidebar_layout.addStretch()
         splitter.addWidget(sidebar)
@@ -278,6 +618,8 @@ class SpermAnalysisApp(QMainWindow):
         self.image_label = QLabel()
         self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.image_label.setMinimumSize(400, 400)
+        # The preview is scaled to the label, not the label to the preview
+        self.image_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
         self.image_label.setStyleSheet("""
             QLabel {
                 border: 2px dashed #4B5563;
@@ -331,12 +673,47 @@ class SpermAnalysisApp(QMainWindow):
         """)
         self.progress_bar.setVisible(False)
         
+        self.cache_label = QLabel("")
+        self.cache_label.setStyleSheet("color: #9CA3AF; font-size: 12px;")
+        self.timing_label = QLabel("")
+        self.timing_label.setStyleSheet("color: #9CA3AF; font-size: 12px;")
+        self.timing_label.setVisible(METRICS.enabled)
+
         status_layout.addWidget(self.status_label)
         status_layout.addWidget(self.progress_bar)
+        status_layout.addWidget(self.cache_label)
+        status_layout.addWidget(self.timing_label)
         results_layout.addWidget(status_panel)
         
         self.results_list = QWidget()
         results_list_layout = QVBoxLayout(self.results_list)
+
+        # Thresholds re-count the stored detections; the model is not re-run
+        self.conf_label = QLabel()
+        self.conf_slider = self.create_threshold_slider(DEFAULT_CONF, 1, 95)
+        self.iou_label = QLabel()
+        self.iou_slider = self.create_threshold_slider(DEFAULT_IOU, 10, 95)
+        for label, slider in ((self.conf_label, self.conf_slider),
+                              (self.iou_label, self.iou_slider)):
+            label.setStyleSheet("color: #9CA3AF; font-size: 13px;")
+            results_list_layout.addWidget(label)
+            results_list_layout.addWidget(slider)
+        self.update_threshold_labels()
+
+        # Overlay toggles re-compose the cached preview, nothing is re-drawn
+        self.class_toggles = {}
+        toggles_layout = QHBoxLayout()
+        for cls in ALL_CLASSES:
+            toggle = QCheckBox(CLASS_NAMES[cls])
+            toggle.setChecked(True)
+            self.class_toggles[cls] = toggle
+        self.labels_toggle = QCheckBox("Ishonch")
+        for toggle in (*self.class_toggles.values(), self.labels_toggle):
+            toggles_layout.addWidget(toggle)
+            toggle.setStyleSheet("color: #9CA3AF; font-size: 13px;")
+            toggle.toggled.connect(self.update_overlay)
+        results_list_layout.addLayout(toggles_layout)
+
         self.results_list.setVisible(False)
         results_layout.addWidget(self.results_list)
         results_layout.addStretch()
@@ -355,12 +732,55 @@ class SpermAnalysisApp(QMainWindow):
         analysis_layout.addWidget(results_frame)
         content_layout.addLayout(analysis_layout)
         
-        splitter.addWidget(content)
+        self.pages = QStackedWidget()
+        self.pages.addWidget(content)
+        self.statistics_page = StatisticsPage()
+        self.pages.addWidget(self.statistics_page)
+        self.history_page = HistoryPage(self.results_db)
+        self.pages.addWidget(self.history_page)
+        splitter.addWidget(self.pages)
 # Continue from where main_layout left off
         main_layout.addWidget(splitter)
         splitter.setStretchFactor(0, 1)
         splitter.setStretchFactor(1, 4)
 
+    def show_analysis_page(self):
+        self.pages.setCurrentIndex(0)
+
+    def show_statistics_page(self):
+        self.statistics_page.refresh(self.results_db)
+        self.pages.setCurrentWidget(self.statistics_page)
+
+    def show_history_page(self):
+        self.history_page.refresh()
+        self.pages.setCurrentWidget(self.history_page)
+
+    def create_threshold_slider(self, value, minimum, maximum):
+        slider = QSlider(Qt.Orientation.Horizontal)
+        slider.setRange(minimum, maximum)
+        slider.setValue(round(value * 100))
+        slider.valueChanged.connect(self.on_thresholds_changed)
+        # Exact NMS once the handle is let go; Fast NMS while it is dragged
+        slider.sliderReleased.connect(self.on_thresholds_changed)
+        return slider
+
+    def thresholds(self):
+        return self.conf_slider.value() / 100, self.iou_slider.value() / 100
+
+    def update_threshold_labels(self):
+        conf, iou = self.thresholds()
+        self.conf_label.setText(f"Ishonch chegarasi: {conf:.2f}")
+        self.iou_label.setText(f"IoU chegarasi: {iou:.2f}")
+
+    def on_thresholds_changed(self):
+        self.update_threshold_labels()
+        if self.current_result is None:
+            return
+        dragging = self.conf_slider.isSliderDown() or self.iou_slider.isSliderDown()
+        self.current_result.apply_thresholds(*self.thresholds(), exact=not dragging)
+        self.update_stats_cards(self.current_result)
+        self.update_overlay()
+
     def center_window(self):
         screen = QScreen.availableGeometry(QApplication.primaryScreen())
         window_size = self.geometry()
@@ -373,78 +793,217 @@ class SpermAnalysisApp(QMainWindow):
             self,
             "Rasmni tanlang",
             "",
-            "Rasm fayllari (*.png *.jpg *.jpeg *.bmp)"
+            "Rasm fayllari (*.png *.jpg *.jpeg *.bmp *.tif *.tiff)"
         )
         
         if file_name:
+            self.metrics_token = METRICS.begin()
             self.current_image_path = file_name
-            pixmap = QPixmap(file_name)
-            scaled_pixmap = pixmap.scaled(
-                self.image_label.size(),
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            self.image_label.setPixmap(scaled_pixmap)
+            self.current_image = None
+            self.current_result = None
+            self.analysis_serial += 1
+            self.prune_analysis_rows()
+            self.overlay = None
             self.analyze_image()
 
     def analyze_image(self):
-        if not hasattr(self, 'current_image_path') or not self.model:
+        if not hasattr(self, 'current_image_path'):
             return
+        if self.analyzer is None and self.current_image is not None:
+            # Already decoded and shown; on_model_loaded picks it up
+            return
+
+        # A newly loaded image replaces whatever job is still in flight
+        self.cancel_inference()
 
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
-        
-        # Progress simulation
-        self.progress_timer = QTimer()
-        self.progress_timer.timeout.connect(self.update_progress)
-        self.progress_timer.start(50)
-        
-        # Perform analysis with YOLO model
-        try:
-            results = self.model(self.current_image_path)[0]
-            self.process_results(results)
-        except Exception as e:
-            QMessageBox.critical(self, "Xatolik", f"Tahlil jarayonida xatolik: {str(e)}")
-            self.progress_bar.setVisible(False)
+        self.analysis_started = time.perf_counter()
+
+        preview_size = (self.image_label.width(), self.image_label.height())
+        worker = InferenceWorker(self.analyzer, self.current_image_path, self.current_image,
+                                 self.tile_size, preview_size, self.metrics_token, self)
+        worker.image_ready.connect(self.show_preview)
+        worker.progress.connect(self.update_progress)
+        worker.result_ready.connect(self.on_inference_finished)
+        worker.error.connect(self.on_inference_error)
+        worker.finished.connect(worker.deleteLater)
+        self.inference_worker = worker
+        worker.start()
 
-    def update_progress(self):
-        current_value = self.progress_bar.value()
-        if current_value >= 100:
-            self.progress_timer.stop()
+    def cancel_inference(self):
+        worker = self.inference_worker
+        if worker is None:
+            return
+        worker.cancel()
+        worker.image_ready.disconnect()
+        worker.progress.disconnect()
+        worker.result_ready.disconnect()
+        worker.error.disconnect()
+        self.inference_worker = None
+
+    def show_preview(self, image, preview):
+        METRICS.record("preview_ready", time.perf_counter() - self.analysis_started)
+        self.current_image = image
+        self.overlay = OverlayCache(preview, image.shape)
+        self.display_frame(preview)
+        if self.analyzer is None:
             self.progress_bar.setVisible(False)
-        else:
-            self.progress_bar.setValue(current_value + 1)
 
-    def process_results(self, results):
-        if not results.boxes:
-            self.status_label.setText("Hech qanday sperma topilmadi")
+    def display_frame(self, frame):
+        height, width = frame.shape[:2]
+        # QImage wraps the frame buffer without copying; keep it referenced
+        self._preview_buffer = frame
+        qimage = QImage(frame.data, width, height, frame.strides[0],
+                        QImage.Format.Format_BGR888)
+        self._display_pixmap = QPixmap.fromImage(qimage)
+        self.fit_preview()
+
+    def fit_preview(self):
+        pixmap = self._display_pixmap
+        if pixmap is None:
             return
+        size = self.image_label.size()
+        if pixmap.width() > size.width() or pixmap.height() > size.height():
+            # Window shrank: scale the cached frame instead of re-rendering it
+            pixmap = pixmap.scaled(size, Qt.AspectRatioMode.KeepAspectRatio,
+                                   Qt.TransformationMode.SmoothTransformation)
+        self.image_label.setPixmap(pixmap)
 
-        classes = results.boxes.cls.cpu().numpy()
-        confidences = results.boxes.conf.cpu().numpy()
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.fit_preview()
 
-        total_count = len(classes)
-        live_count = np.sum(classes == 0)
-        dead_count = np.sum(classes == 1)
-        immature_count = np.sum(classes == 2)
+    def visible_classes(self):
+        return tuple(cls for cls, toggle in self.class_toggles.items() if toggle.isChecked())
 
-        # Update stats cards
-        self.trik_card.update_values(
-            round((live_count / total_count) * 100),
-            f"+{live_count} dona"
-        )
-        self.ulik_card.update_values(
-            round((dead_count / total_count) * 100),
-            f"+{dead_count} dona"
-        )
-        self.yetilmagan_card.update_values(
-            round((immature_count / total_count) * 100),
-            f"+{immature_count} dona"
+    def update_overlay(self):
+        if self.overlay is None or self.current_result is None:
+            return
+        with METRICS.stage("overlay"):
+            frame = self.overlay.render(self.current_result, self.visible_classes(),
+                                        self.labels_toggle.isChecked())
+        self.display_frame(frame)
+
+    def update_progress(self, value, message):
+        self.progress_bar.setValue(value)
+        self.status_label.setText(message)
+
+    def on_inference_finished(self, results):
+        self.inference_worker = None
+        self.progress_bar.setVisible(False)
+        self.process_results(results)
+        METRICS.record("analyze_image", time.perf_counter() - self.analysis_started)
+        self.update_cache_stats()
+        self.update_timings()
+
+    def update_timings(self):
+        if not METRICS.enabled:
+            return
+        last = METRICS.last
+        parts = [f"{label} {last[name] * 1000:.0f} ms"
+                 for name, label in STAGE_LABELS if name in last]
+        self.timing_label.setText("Vaqt: " + " · ".join(parts) if parts else "")
+
+    def update_cache_stats(self):
+        stats = self.detection_cache.stats()
+        self.cache_label.setText(
+            f"Kesh: {stats['hits']} topildi / {stats['misses']} topilmadi, "
+            f"{stats['saved_seconds']:.1f} s tejaldi"
         )
 
+    def on_inference_error(self, message):
+        self.inference_worker = None
+        self.progress_bar.setVisible(False)
+        self.status_label.setText("Tahlil jarayonida xatolik")
+        QMessageBox.critical(self, "Xatolik", f"Tahlil jarayonida xatolik: {message}")
+
+    def closeEvent(self, event):
+        # Cancelled jobs may still be inside a model call; wait for every
+        # worker so no QThread is destroyed while running
+        self.model_loader.wait()
+        self.cancel_inference()
+        for worker in self.findChildren(InferenceWorker):
+            worker.cancel()
+            worker.wait()
+        # Queued saves are finished, not dropped, and their rows recorded
+        self.results_writer.stop()
+        QApplication.sendPostedEvents(self)
+        for serial in list(self.analysis_rows):
+            self.store_detections(serial)
+        self.detection_store.close()
+        self.history_page.shutdown()
+        # Only the process pool owns resources that need an explicit shutdown
+        close = getattr(self.analyzer, "close", None)
+        if close is not None:
+            close()
+        if METRICS.enabled and self.metrics_file:
+            METRICS.write(self.metrics_file)
+        METRICS.close()
+        super().closeEvent(event)
+
+    def process_results(self, result):
+        with METRICS.stage("process_results"):
+            self.current_result = result
+            # Results arrive at the analyzer defaults; honour the sliders instead
+            result.apply_thresholds(*self.thresholds())
+            self.update_stats_cards(result)
+        self.update_overlay()
+        if not len(result.detections):
+            self.status_label.setText("Hech qanday sperma topilmadi")
+            return
+
         self.status_label.setText("Tahlil muvaffaqiyatli yakunlandi")
         self.results_list.setVisible(True)
 
+    def update_stats_cards(self, result):
+        live_pct, dead_pct, immature_pct = result.percentages
+
+        # Update stats cards
+        self.trik_card.update_values(live_pct, f"+{result.live_count} dona")
+        self.ulik_card.update_values(dead_pct, f"+{result.dead_count} dona")
+        self.yetilmagan_card.update_values(immature_pct, f"+{result.immature_count} dona")
+
+    def record_analysis(self, serial, result, **fields):
+        # One database row per analysed image; a later save (report after
+        # results, or vice versa, or after moving the sliders) fills in that
+        # row and brings its counts up to date
+        if result is not None:
+            live_pct, dead_pct, immature_pct = result.percentages
+            fields.update(
+                total=result.total_count,
+                live_count=result.live_count,
+                dead_count=result.dead_count,
+                immature_count=result.immature_count,
+                live_pct=live_pct,
+                dead_pct=dead_pct,
+                immature_pct=immature_pct,
+            )
+        entry = self.analysis_rows.get(serial)
+        if entry is None:
+            entry = self.analysis_rows[serial] = {"id": self.results_db.add(fields), "result": None}
+        else:
+            self.results_db.update(entry["id"], **fields)
+        if result is not None:
+            entry["result"] = result
+        return entry["id"]
+
+    def store_detections(self, serial):
+        # The store is append-only, so a row's boxes are written once, when
+        # its image is done with: those counted at the thresholds last saved
+        entry = self.analysis_rows.pop(serial)
+        # Every counted box is kept for research exports, not just the percentages
+        self.detection_store.append_results([(entry["id"], entry["result"])])
+
+    def result_snapshot(self):
+        # Saves keep the counts of the moment; the sliders may re-threshold
+        # current_result afterwards
+        result = self.current_result
+        if result is None:
+            return None
+        return AnalysisResult.from_detections(result.detections, result.image_shape,
+                                              result.conf_threshold, result.iou_threshold)
+
     def create_report(self):
         dialog = PatientInfoDialog(self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
@@ -457,76 +1016,39 @@ class SpermAnalysisApp(QMainWindow):
             return
 
         try:
-            # Create reports directory if it doesn't exist
-            reports_dir = Path("reports")
-            reports_dir.mkdir(exist_ok=True)
-
-            # Create report filename with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            txt_report_path = reports_dir / f"report_{timestamp}.txt"
-            html_report_path = reports_dir / f"report_{timestamp}.html"
-
-            # Get current values
-            trik_value = self.trik_card.value_label.text().replace('%', '')
-            ulik_value = self.ulik_card.value_label.text().replace('%', '')
-            yetilmagan_value = self.yetilmagan_card.value_label.text().replace('%', '')
-            
-            # Get counts from change labels
-            trik_count = self.trik_card.change_label.text().replace('+', '').replace(' dona', '')
-            ulik_count = self.ulik_card.change_label.text().replace('+', '').replace(' dona', '')
-            yetilmagan_count = self.yetilmagan_card.change_label.text().replace('+', '').replace(' dona', '')
+            with METRICS.stage("save_report"):
+                # Get current values
+                trik_value = self.trik_card.value_label.text().replace('%', '')
+                ulik_value = self.ulik_card.value_label.text().replace('%', '')
+                yetilmagan_value = self.yetilmagan_card.value_label.text().replace('%', '')
             
-            total_count = int(trik_count) + int(ulik_count) + int(yetilmagan_count)
-
-            # Save TXT report
-            with open(txt_report_path, "w", encoding="utf-8") as f:
-                f.write("=== SPERM TAHLILI NATIJASI ===\n\n")
-                f.write(f"Sana: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n")
-                f.write(f"Bemor: {patient_data['name']}\n")
-                f.write(f"Tug'ilgan sana: {patient_data['birth_date']}\n")
-                f.write(f"ID: {patient_data['id']}\n\n")
-                f.write("--- NATIJALAR ---\n")
-                f.write(f"Trik spermalar: {trik_value}%\n")
-                f.write(f"O'lik spermalar: {ulik_value}%\n")
-                f.write(f"Yetilmagan spermalar: {yetilmagan_value}%\n\n")
-                f.write("XULOSA:\n")
-                f.write(f"{patient_data['conclusion']}\n\n")
-                f.write(f"Shifokor: {patient_data['doctor']}")
-
-            # Read HTML template
-            with open("index.html", "r", encoding="utf-8") as f:
-                html_template = f.read()
-
-            # Replace values in HTML
-            current_time = datetime.now().strftime('%d.%m.%Y %H:%M')
-            html_content = html_template.replace('Teshaboyev Teshavoy Teshavoyevich', patient_data['name'])
-            html_content = html_content.replace('01.01.1990', patient_data['birth_date'])
-            html_content = html_content.replace('19.10.2024', current_time.split()[0])
-            html_content = html_content.replace('10:30', current_time.split()[1])
-            html_content = html_content.replace('SP-2024/123', patient_data['id'])
-            
-            # Update table values
-            html_content = html_content.replace('<td>500</td>\n                <td>50%</td>', 
-                                             f'<td>{trik_count}</td>\n                <td>{trik_value}%</td>')
-            html_content = html_content.replace('<td>0</td>\n                <td>0%</td>', 
-                                             f'<td>{ulik_count}</td>\n                <td>{ulik_value}%</td>')
-            html_content = html_content.replace('<td>500</td>\n                <td>50%</td>', 
-                                             f'<td>{yetilmagan_count}</td>\n                <td>{yetilmagan_value}%</td>')
-            html_content = html_content.replace('<td>1000</td>', f'<td>{total_count}</td>')
-
-            # Update conclusion and doctor
-            html_content = html_content.replace('Trik spermatozoidlar miqdori me\'yordan biroz past.', 
-                                             patient_data['conclusion'])
-            html_content = html_content.replace('__________________</td>\n                    <td width="50"></td>', 
-                                             f'{patient_data["doctor"]}</td>\n                    <td width="50"></td>')
-
-            # Save HTML report
-            with open(html_report_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
-
-            # Copy the HTML report to index.html to display current results
-            with open("index.html", "w", encoding="utf-8") as f:
-                f.write(html_content)
+                # Get counts from change labels
+                trik_count = self.trik_card.change_label.text().replace('+', '').replace(' dona', '')
+                ulik_count = self.ulik_card.change_label.text().replace('+', '').replace(' dona', '')
+                yetilmagan_count = self.yetilmagan_card.change_label.text().replace('+', '').replace(' dona', '')
+
+                # Render both reports from the cached templates in templates/
+                values = report_values(
+                    patient_data,
+                    (int(trik_count or 0), int(ulik_count or 0), int(yetilmagan_count or 0)),
+                    (trik_value, ulik_value, yetilmagan_value),
+                )
+                paths = write_report(values, "reports")
+                txt_report_path = paths["txt"]
+                html_report_path = paths["html"]
+
+                self.record_analysis(
+                    self.analysis_serial,
+                    self.result_snapshot(),
+                    patient_id=patient_data['id'],
+                    patient_name=patient_data['name'],
+                    birth_date=patient_data['birth_date'],
+                    doctor=patient_data['doctor'],
+                    conclusion=patient_data['conclusion'],
+                    report_txt_path=str(txt_report_path),
+                    report_html_path=str(html_report_path),
+                )
+            self.update_timings()
 
             QMessageBox.information(
                 self,
@@ -547,33 +1069,39 @@ class SpermAnalysisApp(QMainWindow):
             return
 
         try:
-            # Create results directory if it doesn't exist
-            results_dir = Path("results")
-            results_dir.mkdir(exist_ok=True)
+            with METRICS.stage("save_results"):
+                # Unique even for saves within one second still on the queue
+                timestamp = new_stem(self.current_image_path, taken=self.queued_stems)
+                summary = (
+                    "=== TAHLIL NATIJALARI ===\n"
+                    f"Sana: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n"
+                    f"Trik spermalar: {self.trik_card.value_label.text()}\n"
+                    f"O'lik spermalar: {self.ulik_card.value_label.text()}\n"
+                    f"Yetilmagan spermalar: {self.yetilmagan_card.value_label.text()}\n"
+                )
+                paths = archive_paths(self.current_image_path, timestamp)
 
-            # Save analyzed image with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            image_path = results_dir / f"analysis_{timestamp}.jpg"
-            
-            # Save results data
-            data_path = results_dir / f"data_{timestamp}.txt"
-            
-            with open(data_path, "w", encoding="utf-8") as f:
-                f.write("=== TAHLIL NATIJALARI ===\n")
-                f.write(f"Sana: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n")
-                f.write(f"Trik spermalar: {self.trik_card.value_label.text()}\n")
-                f.write(f"O'lik spermalar: {self.ulik_card.value_label.text()}\n")
-                f.write(f"Yetilmagan spermalar: {self.yetilmagan_card.value_label.text()}\n")
-
-            # Copy the analyzed image
-            import shutil
-            shutil.copy2(self.current_image_path, image_path)
-
-            QMessageBox.information(
-                self,
-                "Muvaffaqiyat",
-                f"Natijalar saqlandi:\nRasm: {image_path}\nMa'lumotlar: {data_path}"
-            )
+                # Everything else happens on the writer thread; the database
+                # row is only recorded once the files are written
+                result = self.result_snapshot()
+                self.results_writer.submit({
+                    "source": self.current_image_path,
+                    "stem": timestamp,
+                    "serial": self.analysis_serial,
+                    "metrics_token": self.metrics_token,
+                    "summary": summary,
+                    "paths": paths,
+                    "result": result,
+                    "image": self.current_image if result is not None else None,
+                    "visible": self.visible_classes(),
+                    "labels": self.labels_toggle.isChecked(),
+                })
+                self.pending_saves += 1
+                self.queued_stems.add(timestamp)
+                self.saves_by_serial[self.analysis_serial] = \
+                    self.saves_by_serial.get(self.analysis_serial, 0) + 1
+            self.update_timings()
+            self.status_label.setText(f"Natijalar saqlanmoqda ({self.pending_saves} ta navbatda)...")
 
         except Exception as e:
             QMessageBox.critical(
@@ -582,6 +1110,42 @@ class SpermAnalysisApp(QMainWindow):
                 f"Natijalarni saqlashda xatolik: {str(e)}"
             )
 
+    def finish_save(self, job):
+        self.pending_saves -= 1
+        self.queued_stems.discard(job["stem"])
+        serial = job["serial"]
+        self.saves_by_serial[serial] -= 1
+        if not self.saves_by_serial[serial]:
+            del self.saves_by_serial[serial]
+        self.prune_analysis_rows()
+
+    def prune_analysis_rows(self):
+        # Rows of earlier images are only needed until their last save lands
+        for serial in list(self.analysis_rows):
+            if serial != self.analysis_serial and serial not in self.saves_by_serial:
+                self.store_detections(serial)
+
+    def on_results_saved(self, job):
+        try:
+            self.record_analysis(job["serial"], job["result"], image_path=str(job["paths"]["image"]),
+                                 data_path=str(job["paths"]["data"]))
+        except Exception as e:
+            self.on_results_failed(job, str(e))
+            return
+        self.finish_save(job)
+        self.update_timings()
+        note = " (bu rasm avval saqlangan, nusxa olinmadi)" if job["duplicate"] else ""
+        self.status_label.setText(f"Natijalar saqlandi: {job['paths']['image']}{note}")
+
+    def on_results_failed(self, job, message):
+        self.finish_save(job)
+        self.status_label.setText("Natijalarni saqlashda xatolik")
+        QMessageBox.critical(
+            self,
+            "Xatolik",
+            f"Natijalarni saqlashda xatolik ({job['paths']['data'].name}): {message}"
+        )
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
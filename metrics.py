@@ -0,0 +1,221 @@
+"""Lightweight per-stage timing for the analysis hot path.
+
+    from metrics import METRICS
+
+    with METRICS.stage("save_report"):
+        ...
+    METRICS.record("inference", seconds)     # time measured elsewhere
+
+Each stage keeps cumulative Prometheus-style histogram buckets plus a rolling
+window of recent samples for p50/p95. ``last`` holds the breakdown of the
+current image: ``begin()`` clears it (except ``SESSION_STAGES``, which happen
+once per run) and returns a token. Work done on behalf of an image passes
+that token, so a cancelled or superseded job still feeds the histograms but
+not the breakdown of the image that replaced it:
+
+    token = METRICS.begin()
+    with METRICS.stage("decode", token):
+        ...
+
+Instrumentation is on unless ``SPERMAI_METRICS=0``. When it is off,
+``stage()`` returns one shared no-op context manager and ``record()``
+returns immediately, so the cost is a single attribute check.
+
+Export:
+    METRICS.write("results/metrics.prom")    # Prometheus text format
+    METRICS.write("results/metrics.json")    # JSON snapshot
+    METRICS.serve(9109)                      # http://127.0.0.1:9109/metrics
+"""
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+# Upper bounds in seconds; +Inf is implicit
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_WINDOW = 512
+METRIC_NAME = "spermai_stage_seconds"
+# Kept in ``last`` across images
+SESSION_STAGES = ("startup", "model_load")
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "token", "start")
+
+    def __init__(self, metrics, name, token):
+        self.metrics = metrics
+        self.name = name
+        self.token = token
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start, self.token)
+        return False
+
+
+class StageHistogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=DEFAULT_WINDOW):
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS, window=DEFAULT_WINDOW):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.window = window
+        self.last = {}
+        self._token = 0
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def stage(self, name, token=None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, token)
+
+    def record(self, name, seconds, token=None):
+        """Add a sample; it joins ``last`` unless ``token`` is from an earlier ``begin()``."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = StageHistogram(self.buckets, self.window)
+            histogram.add(seconds)
+            if token is None or token == self._token:
+                self.last[name] = seconds
+
+    def begin(self):
+        """Start the breakdown of a new image; return its token."""
+        with self._lock:
+            self._token += 1
+            self.last = {name: v for name, v in self.last.items() if name in SESSION_STAGES}
+            return self._token
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "last": self.last.get(name),
+                    "buckets": dict(zip([*map(str, h.bounds), "+Inf"], h.counts)),
+                }
+                for name, h in self._stages.items()
+            }
+
+    def prometheus(self):
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent per analysis stage.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        recent = []
+        with self._lock:
+            for name, h in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip([*map(repr, h.bounds), "+Inf"], h.counts):
+                    cumulative += count
+                    lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_sum{{stage="{name}"}} {h.sum!r}')
+                lines.append(f'{METRIC_NAME}_count{{stage="{name}"}} {h.count}')
+                for q in (0.5, 0.95):
+                    recent.append(f'{METRIC_NAME}_recent{{stage="{name}",quantile="{q}"}} '
+                                  f'{h.quantile(q)!r}')
+        if recent:
+            lines += [
+                f"# HELP {METRIC_NAME}_recent Quantiles over the last {self.window} samples.",
+                f"# TYPE {METRIC_NAME}_recent summary",
+                *recent,
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write ``.json`` as a snapshot, anything else in Prometheus text format."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".json":
+            text = json.dumps(self.snapshot(), indent=2)
+        else:
+            text = self.prometheus()
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        return path
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve ``/metrics`` on a daemon thread; returns the server."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+METRICS = Metrics(enabled=os.environ.get("SPERMAI_METRICS", "1") != "0")
@@ -0,0 +1,309 @@
+"""Streaming video / time-lapse motility analysis.
+
+Usage:
+    python motility.py sample.mp4 --um-per-px 0.5
+    python motility.py frames_dir/ --fps 25
+
+Frames are pulled one batch at a time from ``cv2.VideoCapture`` (or a folder
+of images), run through the detector and linked into tracks by a vectorized
+nearest-neighbour tracker. Only the current batch of frames and a fixed-size
+record per track are held in memory, never the whole clip.
+
+Per track the curvilinear velocity (path length / time, VCL) and the
+straight-line velocity (displacement / time, VSL) are reported; a track is
+motile when its VCL reaches ``--min-speed``.
+"""
+import argparse
+import csv
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from analysis import DEFAULT_MODEL_PATH, SpermAnalyzer, percentage
+from backends import BACKENDS, DEFAULT_BACKEND
+from batch_analyze import IMAGE_EXTENSIONS, find_images
+
+TRACK_FIELDS = ["track_id", "class", "frames", "duration_s", "path_length",
+                "vcl", "vsl", "motile"]
+
+
+def iter_frames(source, fps=None):
+    """Yield ``(timestamp_s, frame)`` from a video file or an image folder."""
+    import cv2
+
+    source = Path(source)
+    if source.is_dir():
+        fps = fps or 25.0
+        for index, path in enumerate(find_images(source)):
+            frame = cv2.imread(str(path))
+            if frame is not None:
+                yield index / fps, frame
+        return
+
+    capture = cv2.VideoCapture(str(source))
+    if not capture.isOpened():
+        raise ValueError(f"Videoni ochib bo'lmadi: {source}")
+    fps = fps or capture.get(cv2.CAP_PROP_FPS) or 25.0
+    index = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield index / fps, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def prefetch(items, depth):
+    """Produce ``items`` on a background thread through a bounded queue.
+
+    Frame decoding releases the GIL, so reading the next frames overlaps
+    with inference on the current batch while at most ``depth`` frames wait.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                buffer.put(item)
+        except Exception as e:
+            buffer.put(e)
+        finally:
+            buffer.put(done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock the producer if it is waiting on a full queue
+        while thread.is_alive():
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def iter_batches(frames, batch_size):
+    batch = []
+    for item in frames:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def box_centers(boxes):
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+
+
+def mutual_nearest(cost, max_cost):
+    """Match rows to columns that are each other's nearest neighbour.
+
+    Returns ``(rows, cols)`` index arrays. Cheap, fully vectorized and, for
+    well separated cells between consecutive frames, the same as an optimal
+    assignment.
+    """
+    if cost.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    best_col = cost.argmin(axis=1)
+    best_row = cost.argmin(axis=0)
+    rows = np.flatnonzero(best_row[best_col] == np.arange(cost.shape[0]))
+    cols = best_col[rows]
+    ok = cost[rows, cols] <= max_cost
+    return rows[ok], cols[ok]
+
+
+class CentroidTracker:
+    """Links detections across frames into tracks.
+
+    Track state lives in preallocated NumPy columns that grow by doubling, so
+    memory is proportional to the number of tracks, not frames.
+    """
+
+    # Column name -> (per-track shape, dtype)
+    _COLUMNS = {
+        "first_pos": ((2,), np.float32),
+        "last_pos": ((2,), np.float32),
+        "first_time": ((), np.float64),
+        "last_time": ((), np.float64),
+        "last_frame": ((), np.int64),
+        "path_length": ((), np.float64),
+        "frames": ((), np.int64),
+        "class_votes": ((3,), np.int64),
+    }
+
+    def __init__(self, max_distance=20.0, max_age=3, rounds=3):
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.rounds = rounds
+        self.count = 0
+        self._allocate(256)
+
+    def _allocate(self, capacity):
+        for name, (shape, dtype) in self._COLUMNS.items():
+            column = np.zeros((capacity, *shape), dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                column[:len(old)] = old
+            setattr(self, name, column)
+
+    def _new_tracks(self, centers, classes, frame_index, timestamp):
+        n = len(centers)
+        if self.count + n > len(self.frames):
+            self._allocate(max(2 * len(self.frames), self.count + n))
+        ids = np.arange(self.count, self.count + n)
+        self.first_pos[ids] = centers
+        self.last_pos[ids] = centers
+        self.first_time[ids] = timestamp
+        self.last_time[ids] = timestamp
+        self.last_frame[ids] = frame_index
+        self.frames[ids] = 1
+        np.add.at(self.class_votes, (ids, classes), 1)
+        self.count += n
+
+    def update(self, centers, classes, frame_index, timestamp):
+        centers = np.asarray(centers, dtype=np.float32).reshape(-1, 2)
+        classes = np.asarray(classes, dtype=np.int64)
+        active = np.flatnonzero(frame_index - self.last_frame[:self.count] <= self.max_age)
+        unmatched = np.arange(len(centers))
+
+        for _ in range(self.rounds):
+            if not len(active) or not len(unmatched):
+                break
+            diff = self.last_pos[active][:, None, :] - centers[unmatched][None, :, :]
+            cost = np.sqrt((diff ** 2).sum(axis=2))
+            rows, cols = mutual_nearest(cost, self.max_distance)
+            if not len(rows):
+                break
+            tracks, dets = active[rows], unmatched[cols]
+            self.path_length[tracks] += cost[rows, cols]
+            self.last_pos[tracks] = centers[dets]
+            self.last_time[tracks] = timestamp
+            self.last_frame[tracks] = frame_index
+            self.frames[tracks] += 1
+            np.add.at(self.class_votes, (tracks, classes[dets]), 1)
+            active = np.delete(active, rows)
+            unmatched = np.delete(unmatched, cols)
+
+        if len(unmatched):
+            self._new_tracks(centers[unmatched], classes[unmatched], frame_index, timestamp)
+
+    def summary(self, min_frames=3, min_speed=5.0, scale=1.0):
+        """Per-track velocities; ``scale`` converts pixels to output units."""
+        n = self.count
+        keep = self.frames[:n] >= min_frames
+        duration = self.last_time[:n] - self.first_time[:n]
+        safe_duration = np.where(duration > 0, duration, np.inf)
+        displacement = np.sqrt(((self.last_pos[:n] - self.first_pos[:n]) ** 2).sum(axis=1))
+        vcl = self.path_length[:n] * scale / safe_duration
+        vsl = displacement * scale / safe_duration
+        return {
+            "track_id": np.flatnonzero(keep),
+            "class": self.class_votes[:n].argmax(axis=1)[keep],
+            "frames": self.frames[:n][keep],
+            "duration_s": duration[keep],
+            "path_length": self.path_length[:n][keep] * scale,
+            "vcl": vcl[keep],
+            "vsl": vsl[keep],
+            "motile": vcl[keep] >= min_speed,
+        }
+
+
+def analyze_stream(analyzer, frames, tracker, batch_size=8):
+    """Feed frames through the detector and tracker; return frames processed."""
+    processed = 0
+    for batch in iter_batches(prefetch(frames, 2 * batch_size), batch_size):
+        results = analyzer.analyze_batch([frame for _, frame in batch])
+        for (timestamp, _), result in zip(batch, results):
+            tracker.update(box_centers(result.boxes), result.classes, processed, timestamp)
+            processed += 1
+    return processed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Video bo'yicha harakatchanlik tahlili")
+    parser.add_argument("source", help="Video fayl yoki kadrlar papkasi")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=sorted(BACKENDS))
+    parser.add_argument("--imgsz", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--fps", type=float, default=None,
+                        help="Kadr tezligi (video metadata'si yo'q bo'lsa yoki papka uchun)")
+    parser.add_argument("--um-per-px", type=float, default=1.0,
+                        help="Piksel o'lchami mikrometrda (standart 1 = piksel birligida)")
+    parser.add_argument("--max-distance", type=float, default=20.0,
+                        help="Kadrlar orasida ruxsat etilgan siljish (piksel)")
+    parser.add_argument("--max-age", type=int, default=3,
+                        help="Trek yo'qolgan deb hisoblanguncha o'tkazib yuboriladigan kadrlar")
+    parser.add_argument("--min-frames", type=int, default=5)
+    parser.add_argument("--min-speed", type=float, default=5.0,
+                        help="Harakatchan deb hisoblash uchun minimal VCL (um/s)")
+    parser.add_argument("--output", default=None, help="CSV fayl (standart: results/motility_<vaqt>.csv)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    source = Path(args.source)
+    if not source.exists():
+        print(f"Manba topilmadi: {source}", file=sys.stderr)
+        return 1
+    if source.is_file() and source.suffix.lower() in IMAGE_EXTENSIONS:
+        print("Bitta rasm uchun main.py yoki batch_analyze.py dan foydalaning", file=sys.stderr)
+        return 1
+
+    if args.output:
+        output_path = Path(args.output)
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = Path("results") / f"motility_{timestamp}.csv"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    predict_kwargs = {"imgsz": args.imgsz} if args.imgsz else {}
+    analyzer = SpermAnalyzer(args.model, backend=args.backend, **predict_kwargs).load()
+    tracker = CentroidTracker(args.max_distance, args.max_age)
+
+    start = time.perf_counter()
+    processed = analyze_stream(analyzer, iter_frames(source, args.fps), tracker, args.batch_size)
+    elapsed = time.perf_counter() - start
+
+    tracks = tracker.summary(args.min_frames, args.min_speed, args.um_per_px)
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(TRACK_FIELDS)
+        writer.writerows(zip(*(tracks[name].tolist() for name in TRACK_FIELDS)))
+
+    n_tracks = len(tracks["track_id"])
+    n_motile = int(tracks["motile"].sum())
+    print(f"Kadrlar: {processed}  |  vaqt: {elapsed:.2f} s  |  "
+          f"{processed / elapsed if elapsed else 0:.1f} kadr/s")
+    print(f"Treklar: {n_tracks}  |  harakatchan: {n_motile} ({percentage(n_motile, n_tracks)}%)")
+    if n_tracks:
+        print(f"O'rtacha VCL: {tracks['vcl'].mean():.1f}  |  O'rtacha VSL: {tracks['vsl'].mean():.1f}")
+    print(f"Natijalar: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
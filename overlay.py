@@ -0,0 +1,150 @@
+"""Detection overlay: class-coloured boxes and optional confidence labels.
+
+Boxes are drawn without a Python loop: every box outline is turned into flat
+pixel indices with one ``np.repeat``/``arange`` pass per edge, and each class
+is painted with a single fancy-indexed assignment. Only the confidence
+labels, when enabled, go through ``cv2.putText`` one by one.
+
+``OverlayCache`` keeps, for one displayed image, the outline indices per
+class at the current thresholds plus the last few composed frames, so
+toggling a class or the labels re-composes from cached indices (or returns a
+cached frame) instead of drawing from scratch.
+"""
+from collections import OrderedDict
+
+from analysis import CLASS_DEAD, CLASS_IMMATURE, CLASS_LIVE
+
+# BGR, matching the stats card accents (#34D399, #EF4444, #FBBF24)
+CLASS_COLORS = {
+    CLASS_LIVE: (153, 211, 52),
+    CLASS_DEAD: (68, 68, 239),
+    CLASS_IMMATURE: (36, 191, 251),
+}
+ALL_CLASSES = tuple(CLASS_COLORS)
+
+
+def line_thickness(shape):
+    """Outline width that stays visible at any resolution."""
+    return max(1, round(max(shape[:2]) / 1500))
+
+
+def _runs(starts, stops):
+    """Concatenated ``arange(start, stop + 1)`` for every pair, vectorized."""
+    import numpy as np
+
+    lengths = np.maximum(stops - starts + 1, 0)
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total)
+
+
+def outline_pixels(boxes, shape, thickness=1):
+    """Flat pixel indices of the outlines of ``boxes`` (x1, y1, x2, y2) in an image of ``shape``."""
+    import numpy as np
+
+    height, width = shape[:2]
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if not len(boxes):
+        return np.zeros(0, dtype=np.int64)
+    x1 = np.clip(np.floor(boxes[:, 0]), 0, width - 1).astype(np.int64)
+    y1 = np.clip(np.floor(boxes[:, 1]), 0, height - 1).astype(np.int64)
+    x2 = np.clip(np.ceil(boxes[:, 2]), 0, width - 1).astype(np.int64)
+    y2 = np.clip(np.ceil(boxes[:, 3]), 0, height - 1).astype(np.int64)
+
+    parts = []
+    for k in range(thickness):
+        # Top and bottom rows, then left and right columns, k pixels inwards
+        for row in (np.minimum(y1 + k, y2), np.maximum(y2 - k, y1)):
+            counts = x2 - x1 + 1
+            parts.append(np.repeat(row * width, counts) + _runs(x1, x2))
+        for col in (np.minimum(x1 + k, x2), np.maximum(x2 - k, x1)):
+            counts = y2 - y1 + 1
+            parts.append(_runs(y1, y2) * width + np.repeat(col, counts))
+    return np.concatenate(parts)
+
+
+def class_outlines(boxes, classes, shape, thickness=1):
+    """``{class id: flat outline indices}`` for every class present."""
+    import numpy as np
+
+    classes = np.asarray(classes)
+    return {cls: outline_pixels(boxes[classes == cls], shape, thickness)
+            for cls in ALL_CLASSES if (classes == cls).any()}
+
+
+def draw_labels(image, boxes, classes, confidences, visible=ALL_CLASSES, scale=None):
+    import cv2
+
+    scale = scale or max(0.35, max(image.shape[:2]) / 2500)
+    thickness = max(1, round(scale * 2))
+    for box, cls, conf in zip(boxes, classes, confidences):
+        if cls not in visible:
+            continue
+        origin = (int(box[0]), max(int(box[1]) - 3, int(12 * scale)))
+        cv2.putText(image, f"{conf:.2f}", origin, cv2.FONT_HERSHEY_SIMPLEX, scale,
+                    CLASS_COLORS[int(cls)], thickness, cv2.LINE_AA)
+
+
+def compose(base, outlines, visible=ALL_CLASSES):
+    """Copy of ``base`` with the cached outlines of ``visible`` classes painted in."""
+    import numpy as np
+
+    frame = np.array(base, copy=True, order="C")
+    flat = frame.reshape(-1, frame.shape[2])
+    for cls in ALL_CLASSES:
+        if cls in visible and cls in outlines:
+            flat[outlines[cls]] = CLASS_COLORS[cls]
+    return frame
+
+
+def annotate(image, boxes, classes, confidences, visible=ALL_CLASSES, labels=False):
+    """Full-resolution annotated copy of ``image`` for saving."""
+    thickness = line_thickness(image.shape)
+    frame = compose(image, class_outlines(boxes, classes, image.shape, thickness), visible)
+    if labels:
+        draw_labels(frame, boxes, classes, confidences, visible)
+    return frame
+
+
+class OverlayCache:
+    """Annotated display-resolution frames for one preview image."""
+
+    def __init__(self, preview, image_shape, max_frames=8):
+        self.preview = preview
+        height, width = preview.shape[:2]
+        self.scale_x = width / image_shape[1]
+        self.scale_y = height / image_shape[0]
+        self.max_frames = max_frames
+        self._key = None
+        self._outlines = {}
+        self._boxes = None
+        self._frames = OrderedDict()
+
+    def _geometry(self, result):
+        import numpy as np
+
+        key = (id(result.detections), result.conf_threshold, result.iou_threshold, result.exact)
+        if key != self._key:
+            boxes = result.boxes * np.array([self.scale_x, self.scale_y] * 2, dtype=np.float32)
+            self._outlines = class_outlines(boxes, result.classes, self.preview.shape)
+            self._boxes = boxes
+            self._frames.clear()
+            self._key = key
+        return self._key
+
+    def render(self, result, visible=ALL_CLASSES, labels=False):
+        visible = tuple(sorted(visible))
+        key = (self._geometry(result), visible, labels)
+        frame = self._frames.get(key)
+        if frame is not None:
+            self._frames.move_to_end(key)
+            return frame
+        frame = compose(self.preview, self._outlines, visible)
+        if labels:
+            draw_labels(frame, self._boxes, result.classes, result.confidences, visible)
+        self._frames[key] = frame
+        if len(self._frames) > self.max_frames:
+            self._frames.popitem(last=False)
+        return frame
@@ -0,0 +1,283 @@
+"""INT8 static quantization of the detector, calibrated on the lab's own images.
+
+Usage:
+    python quantize.py                                   # calibrate on images/train, validate on images/val
+    python quantize.py --calibration images/train --val images/val --tolerance 2
+    python quantize.py --force --method percentile       # re-calibrate
+
+The ONNX export (see ``backends``) is quantized with ONNX Runtime: weights
+per-channel INT8, activations UINT8 with ranges collected on the
+calibration images. The box/score decoding at the end of the detection head
+stays in FP32, since its outputs mix pixel coordinates and probabilities in
+one tensor. The result is cached next to the other exports as backend
+``onnx-int8``.
+
+Validation runs FP32 PyTorch and the INT8 model over ``--val`` and compares
+per-class counts and live/dead/immature percentages image by image. The
+report is written to ``results/quantization_<timestamp>.json`` and next to
+the artifact; the app and the CLIs only use ``onnx-int8`` once a report
+within ``--tolerance`` percentage points has been recorded for it.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from analysis import CLASS_NAMES, DEFAULT_CONF, DEFAULT_MODEL_PATH, SpermAnalyzer
+from backends import DEFAULT_IMGSZ, QUANTIZED, artifact_path, cached_export, export_dir
+
+CALIBRATION_DIR = Path(os.environ.get("SPERMAI_CALIBRATION_DIR", "images/train"))
+CALIBRATION_METHODS = ("minmax", "percentile", "entropy")
+DEFAULT_TOLERANCE = 2.0       # percentage points per class
+VALIDATION_NAME = "validation.json"
+CALIBRATION_NAME = "calibration.json"
+
+
+def letterbox(image, imgsz):
+    """Resize keeping the aspect ratio and pad to ``imgsz`` square, as the predictor does."""
+    import cv2
+    import numpy as np
+
+    height, width = image.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_w, new_h = round(width * ratio), round(height * ratio)
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_h) // 2, (imgsz - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    # BGR HWC uint8 -> RGB NCHW float32 in [0, 1]
+    return np.ascontiguousarray(canvas[None, :, :, ::-1].transpose(0, 3, 1, 2), np.float32) / 255
+
+
+def head_decode_nodes(model):
+    """Names of the detection head's decode nodes (everything but its convolutions)."""
+    names = [node.name for node in model.graph.node]
+    layers = [int(m.group(1)) for m in map(re.compile(r"/model\.(\d+)/").match, names) if m]
+    if not layers:
+        return []
+    prefix = f"/model.{max(layers)}/"
+    return [name for name in names if name.startswith(prefix) and "/cv" not in name]
+
+
+def quantize_onnx(source, target, image_paths, imgsz, method="minmax"):
+    """Write a QDQ INT8 copy of the ONNX model ``source`` to ``target``."""
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod,
+                                          QuantFormat, QuantType, quantize_static)
+
+    from analysis import read_image
+
+    class Reader(CalibrationDataReader):
+        def __init__(self, input_name):
+            self.input_name = input_name
+            self.paths = iter(image_paths)
+
+        def get_next(self):
+            path = next(self.paths, None)
+            if path is None:
+                return None
+            return {self.input_name: letterbox(read_image(path), imgsz)}
+
+    model = onnx.load(str(source))
+    metadata = {prop.key: prop.value for prop in model.metadata_props}
+    # Shape inference + graph optimization first, as ONNX Runtime recommends
+    prepared = Path(target).with_name("prepared.onnx")
+    try:
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+        quant_pre_process(str(source), str(prepared))
+    except Exception:
+        shutil.copy2(source, prepared)
+    quantize_static(
+        str(prepared), str(target), Reader(model.graph.input[0].name),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method={"minmax": CalibrationMethod.MinMax,
+                          "percentile": CalibrationMethod.Percentile,
+                          "entropy": CalibrationMethod.Entropy}[method],
+        nodes_to_exclude=head_decode_nodes(model),
+    )
+    # Ultralytics reads class names, stride and imgsz from the ONNX metadata
+    quantized = onnx.load(str(target))
+    del quantized.metadata_props[:]
+    for key, value in metadata.items():
+        quantized.metadata_props.add(key=key, value=value)
+    onnx.save(quantized, str(target))
+    prepared.unlink()
+
+
+def quantized_export(weights_path, backend="onnx-int8", imgsz=DEFAULT_IMGSZ, cache_dir=None,
+                     calibration_dir=None, method="minmax", force=False):
+    """Return the cached quantized artifact, calibrating it first if needed."""
+    from batch_analyze import find_images
+
+    target = export_dir(weights_path, backend, imgsz, cache_dir)
+    artifact = artifact_path(weights_path, backend, imgsz, cache_dir)
+    if artifact.exists() and not force:
+        return artifact
+
+    calibration_dir = Path(calibration_dir or CALIBRATION_DIR)
+    image_paths = find_images(calibration_dir) if calibration_dir.is_dir() else []
+    if not image_paths:
+        raise RuntimeError(f"Kalibrlash uchun rasm topilmadi: {calibration_dir}")
+    source = cached_export(weights_path, QUANTIZED[backend], imgsz, cache_dir)
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Same scratch-and-rename scheme as backends.cached_export
+    scratch = Path(tempfile.mkdtemp(prefix=f".{backend}_", dir=target.parent))
+    try:
+        start = time.perf_counter()
+        quantize_onnx(source, scratch / artifact.name, image_paths, imgsz, method)
+        (scratch / CALIBRATION_NAME).write_text(json.dumps({
+            "calibration_dir": str(calibration_dir),
+            "images": [p.name for p in image_paths],
+            "method": method,
+            "imgsz": imgsz,
+            "seconds": round(time.perf_counter() - start, 1),
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }, indent=2), encoding="utf-8")
+        if force and target.exists():
+            shutil.rmtree(target)
+        os.replace(scratch, target)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return artifact
+
+
+def is_accepted(artifact):
+    """True if a passing validation report was recorded for ``artifact``."""
+    report_path = Path(artifact).parent / VALIDATION_NAME
+    try:
+        return bool(json.loads(report_path.read_text(encoding="utf-8"))["passed"])
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def timed_results(analyzer, image_paths):
+    results = []
+    start = time.perf_counter()
+    for path in image_paths:
+        results.append(analyzer.analyze(str(path)))
+    return results, time.perf_counter() - start
+
+
+def validate(model_path, backend, image_paths, tolerance=DEFAULT_TOLERANCE, conf=DEFAULT_CONF,
+             **predict_kwargs):
+    """Compare ``backend`` against FP32 PyTorch on ``image_paths``; return the report dict."""
+    reference = SpermAnalyzer(model_path, conf=conf, **predict_kwargs).load()
+    candidate = SpermAnalyzer(model_path, backend=backend, conf=conf, **predict_kwargs)
+    # Load the artifact directly: the acceptance gate in load_model is what we are deciding
+    from ultralytics import YOLO
+
+    imgsz = predict_kwargs.get("imgsz") or DEFAULT_IMGSZ
+    candidate.model = YOLO(str(artifact_path(model_path, backend, imgsz)), task="detect")
+    candidate.backend = backend
+
+    reference.analyze(str(image_paths[0]))
+    candidate.analyze(str(image_paths[0]))
+    ref_results, ref_time = timed_results(reference, image_paths)
+    cand_results, cand_time = timed_results(candidate, image_paths)
+
+    images = []
+    for path, ref, cand in zip(image_paths, ref_results, cand_results):
+        count_delta = [c - r for r, c in zip(ref.counts, cand.counts)]
+        pct_delta = [c - r for r, c in zip(ref.percentages, cand.percentages)]
+        images.append({
+            "image": path.name,
+            "fp32": list(ref.counts),
+            "int8": list(cand.counts),
+            "count_delta": count_delta,
+            "pct_delta": pct_delta,
+            "ok": max(map(abs, pct_delta)) <= tolerance,
+        })
+
+    classes = {}
+    for i, name in CLASS_NAMES.items():
+        counts = [abs(row["count_delta"][i]) for row in images]
+        pcts = [abs(row["pct_delta"][i]) for row in images]
+        classes[name] = {
+            "mean_abs_count_delta": round(sum(counts) / len(counts), 2),
+            "max_abs_count_delta": max(counts),
+            "max_abs_pct_delta": max(pcts),
+        }
+    n = len(image_paths)
+    return {
+        "backend": backend,
+        "model": str(model_path),
+        "conf": conf,
+        "tolerance_pct": tolerance,
+        "fp32_images_per_sec": round(n / ref_time, 2),
+        "int8_images_per_sec": round(n / cand_time, 2),
+        "speedup": round(ref_time / cand_time, 2),
+        "classes": classes,
+        "images": images,
+        "passed": all(row["ok"] for row in images),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Modelni INT8 ga kvantlash va FP32 bilan solishtirish")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", default="onnx-int8", choices=sorted(QUANTIZED))
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--calibration", default=str(CALIBRATION_DIR), help="Kalibrlash rasmlari")
+    parser.add_argument("--val", default="images/val", help="Tekshiruv rasmlari")
+    parser.add_argument("--method", default="minmax", choices=CALIBRATION_METHODS)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Har bir sinf foizi uchun ruxsat etilgan farq (foiz punkti)")
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF,
+                        help="Solishtirishdagi ishonch chegarasi")
+    parser.add_argument("--force", action="store_true", help="Keshdagi modelni qayta kalibrlash")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from batch_analyze import find_images
+
+    args = parse_args(argv)
+    val_paths = find_images(args.val)
+    if not val_paths:
+        print(f"Papkada rasm topilmadi: {args.val}", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    artifact = quantized_export(args.model, args.backend, args.imgsz, None, args.calibration,
+                                args.method, args.force)
+    print(f"Kvantlangan model: {artifact} ({time.perf_counter() - start:.1f} s)")
+
+    report = validate(args.model, args.backend, val_paths, args.tolerance, args.conf,
+                      imgsz=args.imgsz)
+    for row in report["images"]:
+        status = "OK" if row["ok"] else "FARQ"
+        print(f"{status:4}  {row['image']}  fp32={tuple(row['fp32'])}  int8={tuple(row['int8'])}  "
+              f"foiz farqi={tuple(row['pct_delta'])}")
+    for name, stats in report["classes"].items():
+        print(f"{name:11} o'rtacha farq {stats['mean_abs_count_delta']} dona, "
+              f"eng ko'p {stats['max_abs_count_delta']} dona / {stats['max_abs_pct_delta']} p.p.")
+    print(f"fp32: {report['fp32_images_per_sec']} rasm/s  |  int8: {report['int8_images_per_sec']} "
+          f"rasm/s  (x{report['speedup']})")
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    results_dir = Path("results")
+    results_dir.mkdir(exist_ok=True)
+    report_path = results_dir / f"quantization_{datetime.now():%Y%m%d_%H%M%S}.json"
+    report_path.write_text(text, encoding="utf-8")
+    # The copy next to the artifact is what load_model checks before using it
+    (artifact.parent / VALIDATION_NAME).write_text(text, encoding="utf-8")
+    print(f"Hisobot: {report_path}")
+    if not report["passed"]:
+        print(f"Farq {args.tolerance} p.p. dan katta: {args.backend} ishlatilmaydi", file=sys.stderr)
+        return 1
+    print(f"Qabul qilindi: SPERMAI_BACKEND={args.backend} python main.py")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
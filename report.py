@@ -0,0 +1,170 @@
+"""Report rendering from compiled templates, single and batch.
+
+Templates live in ``templates/`` and use ``{{ name }}`` placeholders. Each
+template is parsed once into literal/placeholder segments and cached (the
+cache is keyed on the file's mtime, so editing a template is picked up
+without a restart). Rendered reports are written to ``reports/``; the
+templates themselves are never modified.
+
+Usage:
+    python report.py --all                    # every analysis in the results DB
+    python report.py --patient SP-2024/124 --workers 8
+"""
+import argparse
+import functools
+import html
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from results_db import DEFAULT_DB_PATH, TIMESTAMP_FORMAT, ResultsDB
+
+TEMPLATE_DIR = Path(__file__).resolve().parent / "templates"
+HTML_TEMPLATE = "report.html"
+TXT_TEMPLATE = "report.txt"
+
+_PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+class ReportTemplate:
+    def __init__(self, text, escape=None):
+        # Even indexes are literal text, odd indexes are placeholder names
+        self._segments = _PLACEHOLDER_RE.split(text)
+        self.placeholders = frozenset(self._segments[1::2])
+        self.escape = escape
+
+    @classmethod
+    def from_file(cls, path, escape=None):
+        return cls(Path(path).read_text(encoding="utf-8"), escape)
+
+    def render(self, values):
+        missing = self.placeholders - values.keys()
+        if missing:
+            raise KeyError(f"Shablon qiymatlari yetishmaydi: {', '.join(sorted(missing))}")
+        escape = self.escape or str
+        parts = self._segments[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = escape(str(values[parts[i]]))
+        return "".join(parts)
+
+
+@functools.lru_cache(maxsize=16)
+def _load_template(path, mtime_ns):
+    escape = html.escape if path.endswith(".html") else None
+    return ReportTemplate.from_file(path, escape)
+
+
+def get_template(name, template_dir=TEMPLATE_DIR):
+    path = os.path.join(template_dir, name)
+    return _load_template(path, os.stat(path).st_mtime_ns)
+
+
+def report_values(patient, counts, percentages, created_at=None):
+    """Placeholder values from patient data and ``(live, dead, immature)``."""
+    created_at = created_at or datetime.now()
+    live, dead, immature = counts
+    live_pct, dead_pct, immature_pct = percentages
+    return {
+        "name": patient.get("name", ""),
+        "birth_date": patient.get("birth_date", ""),
+        "patient_id": patient.get("id", ""),
+        "conclusion": patient.get("conclusion", ""),
+        "doctor": patient.get("doctor", ""),
+        "date": created_at.strftime("%d.%m.%Y"),
+        "time": created_at.strftime("%H:%M"),
+        "live_count": live,
+        "dead_count": dead,
+        "immature_count": immature,
+        "total": live + dead + immature,
+        "live_pct": live_pct,
+        "dead_pct": dead_pct,
+        "immature_pct": immature_pct,
+    }
+
+
+def values_from_record(record):
+    """Placeholder values from a ``results_db`` row."""
+    def number(key):
+        return record.get(key) if record.get(key) is not None else ""
+
+    patient = {
+        "name": record.get("patient_name") or "",
+        "birth_date": record.get("birth_date") or "",
+        "id": record.get("patient_id") or "",
+        "conclusion": record.get("conclusion") or "",
+        "doctor": record.get("doctor") or "",
+    }
+    values = report_values(
+        patient,
+        (0, 0, 0),
+        (number("live_pct"), number("dead_pct"), number("immature_pct")),
+        datetime.strptime(record["created_at"], TIMESTAMP_FORMAT),
+    )
+    values.update(
+        live_count=number("live_count"),
+        dead_count=number("dead_count"),
+        immature_count=number("immature_count"),
+        total=number("total"),
+    )
+    return values
+
+
+def write_report(values, reports_dir="reports", stem=None, formats=("html", "txt")):
+    """Render and write one report; return ``{format: path}``."""
+    reports_dir = Path(reports_dir)
+    reports_dir.mkdir(parents=True, exist_ok=True)
+    stem = stem or f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    templates = {"html": HTML_TEMPLATE, "txt": TXT_TEMPLATE}
+    paths = {}
+    for fmt in formats:
+        path = reports_dir / f"{stem}.{fmt}"
+        path.write_text(get_template(templates[fmt]).render(values), encoding="utf-8")
+        paths[fmt] = path
+    return paths
+
+
+def render_batch(records, reports_dir="reports", workers=None, formats=("html", "txt")):
+    """Render one report per results DB row in parallel; return the count."""
+    # Parse the templates once up front instead of racing in the workers
+    for name in (HTML_TEMPLATE, TXT_TEMPLATE):
+        get_template(name)
+
+    def render(record):
+        write_report(values_from_record(record), reports_dir,
+                     f"report_{record['id']:06d}", formats)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(1 for _ in pool.map(render, records))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Saqlangan natijalardan hisobotlar yaratish")
+    parser.add_argument("--db", default=str(DEFAULT_DB_PATH))
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--all", action="store_true", help="Bazadagi barcha tahlillar")
+    selection.add_argument("--patient", help="Faqat shu bemor ID si")
+    parser.add_argument("--output", default=os.path.join("reports", "batch"))
+    parser.add_argument("--format", choices=["html", "txt", "both"], default="both")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    with ResultsDB(args.db) as db:
+        if args.patient:
+            records = db.by_patient(args.patient)
+        else:
+            records = db.all()
+    formats = ("html", "txt") if args.format == "both" else (args.format,)
+
+    start = time.perf_counter()
+    written = render_batch(records, args.output, args.workers, formats)
+    elapsed = time.perf_counter() - start
+    print(f"Hisobotlar: {written}  |  vaqt: {elapsed:.2f} s  |  papka: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
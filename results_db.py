@@ -0,0 +1,333 @@
+"""Embedded SQLite store for saved analyses.
+
+Every saved analysis becomes one row with its per-class counts, the patient
+details from ``PatientInfoDialog`` and references to the files written next
+to it. Lookups by patient ID and by date go through indexes, so "all
+analyses for patient X" stays a millisecond query with years of history.
+
+Aggregates for the Statistika page are kept up to date by triggers
+installed from ``stats_engine``.
+
+Usage:
+    python results_db.py import              # one-shot import of results/ and reports/
+    python results_db.py patient SP-2024/124
+"""
+import argparse
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import stats_engine
+
+DEFAULT_DB_PATH = Path("results") / "spermai.db"
+
+COLUMNS = [
+    "created_at", "patient_id", "patient_name", "birth_date", "doctor", "conclusion",
+    "total", "live_count", "dead_count", "immature_count",
+    "live_pct", "dead_pct", "immature_pct",
+    "image_path", "data_path", "report_txt_path", "report_html_path",
+    "source", "source_file",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    patient_id TEXT,
+    patient_name TEXT,
+    birth_date TEXT,
+    doctor TEXT,
+    conclusion TEXT,
+    total INTEGER,
+    live_count INTEGER,
+    dead_count INTEGER,
+    immature_count INTEGER,
+    live_pct INTEGER,
+    dead_pct INTEGER,
+    immature_pct INTEGER,
+    image_path TEXT,
+    data_path TEXT,
+    report_txt_path TEXT,
+    report_html_path TEXT,
+    source TEXT NOT NULL DEFAULT 'app',
+    source_file TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_patient ON analyses(patient_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses(created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_analyses_source_file
+    ON analyses(source_file) WHERE source_file IS NOT NULL;
+"""
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def now():
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+class ResultsDB:
+    """Thin wrapper around one SQLite connection, safe to share between threads."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        stats_engine.install(self._conn)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _row(record, created_at):
+        defaults = {"created_at": created_at, "source": "app"}
+        return tuple(record.get(column, defaults.get(column)) for column in COLUMNS)
+
+    def add(self, record):
+        """Insert one analysis (a dict keyed by ``COLUMNS``); return its id."""
+        placeholders = ", ".join("?" * len(COLUMNS))
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"INSERT INTO analyses ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                self._row(record, now()),
+            )
+            return cursor.lastrowid
+
+    def add_many(self, records):
+        """Bulk insert in one transaction; rows already imported are skipped."""
+        placeholders = ", ".join("?" * len(COLUMNS))
+        with self._lock, self._conn:
+            created_at = now()
+            # rowcount, unlike total_changes, leaves out the stats trigger writes
+            cursor = self._conn.executemany(
+                f"INSERT OR IGNORE INTO analyses ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                (self._row(record, created_at) for record in records),
+            )
+            return max(cursor.rowcount, 0)
+
+    def add_batch(self, records):
+        """Like ``add_many``, but return each record's new id (``None`` if skipped)."""
+        sql = (f"INSERT OR IGNORE INTO analyses ({', '.join(COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(COLUMNS))})")
+        ids = []
+        with self._lock, self._conn:
+            created_at = now()
+            for record in records:
+                cursor = self._conn.execute(sql, self._row(record, created_at))
+                ids.append(cursor.lastrowid if cursor.rowcount else None)
+        return ids
+
+    def update(self, analysis_id, **fields):
+        """Fill in file references or patient details on an existing row."""
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Noma'lum ustunlar: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE analyses SET {assignments} WHERE id = ?",
+                               (*fields.values(), analysis_id))
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def get(self, analysis_id):
+        rows = self._query("SELECT * FROM analyses WHERE id = ?", (analysis_id,))
+        return rows[0] if rows else None
+
+    def by_patient(self, patient_id):
+        return self._query(
+            "SELECT * FROM analyses WHERE patient_id = ? ORDER BY created_at DESC",
+            (patient_id,),
+        )
+
+    def between(self, start, end):
+        """Analyses with ``start <= created_at < end`` (datetimes or ISO strings)."""
+        if isinstance(start, datetime):
+            start = start.strftime(TIMESTAMP_FORMAT)
+        if isinstance(end, datetime):
+            end = end.strftime(TIMESTAMP_FORMAT)
+        return self._query(
+            "SELECT * FROM analyses WHERE created_at >= ? AND created_at < ? "
+            "ORDER BY created_at DESC",
+            (start, end),
+        )
+
+    def all(self):
+        return self._query("SELECT * FROM analyses ORDER BY created_at DESC")
+
+    def page(self, before=None, limit=200):
+        """Newest-first slice of history for lazy browsing.
+
+        ``before`` is ``(created_at, id)`` of the last row already shown;
+        the seek goes through the created_at index, so page 500 costs the
+        same as page 1.
+        """
+        if before is None:
+            return self._query(
+                "SELECT * FROM analyses ORDER BY created_at DESC, id DESC LIMIT ?", (limit,))
+        return self._query(
+            "SELECT * FROM analyses WHERE (created_at, id) < (?, ?) "
+            "ORDER BY created_at DESC, id DESC LIMIT ?", (*before, limit))
+
+    def known_sources(self, source_files):
+        """The subset of ``source_files`` that already has a row."""
+        source_files = [str(f) for f in source_files]
+        known = set()
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(source_files), 500):
+                chunk = source_files[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                known.update(row[0] for row in self._conn.execute(
+                    f"SELECT source_file FROM analyses WHERE source_file IN ({placeholders})",
+                    chunk))
+        return known
+
+    def stats_totals(self, scope, limit=None):
+        """Aggregate rows of one scope: newest days first, busiest doctors first."""
+        order = "key DESC" if scope == "day" else "analyses DESC, key"
+        return self._query(
+            f"SELECT * FROM stats_totals WHERE scope = ? AND analyses > 0 ORDER BY {order} "
+            "LIMIT ?", (scope, -1 if limit is None else limit))
+
+    def stats_histograms(self, scope, keys):
+        """``{key: {class: {pct: n}}}`` for the given keys of one scope."""
+        histograms = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            for row in self._query(
+                    f"SELECT key, class, pct, n FROM stats_pct WHERE scope = ? AND n > 0 "
+                    f"AND key IN ({placeholders})", (scope, *chunk)):
+                histograms.setdefault(row["key"], {}).setdefault(row["class"], {})[row["pct"]] = row["n"]
+        return histograms
+
+    def rebuild_stats(self):
+        with self._lock:
+            stats_engine.rebuild(self._conn)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+
+# --- Import of the legacy text files ----------------------------------------
+
+_PERCENT_FIELDS = {
+    "Trik spermalar": "live_pct",
+    "O'lik spermalar": "dead_pct",
+    "Yetilmagan spermalar": "immature_pct",
+}
+_REPORT_FIELDS = {
+    "Bemor": "patient_name",
+    "Tug'ilgan sana": "birth_date",
+    "ID": "patient_id",
+    "Shifokor": "doctor",
+}
+# data_<ts>.txt, with _2, _3... for saves within the same second
+_TIMESTAMP_RE = re.compile(r"_(\d{8}_\d{6})(?:_\d+)?$")
+
+
+def _parse_file_timestamp(path):
+    match = _TIMESTAMP_RE.search(path.stem)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").strftime(TIMESTAMP_FORMAT)
+
+
+def parse_text_file(path):
+    """Parse a ``data_*.txt`` or ``report_*.txt`` file into a record dict."""
+    path = Path(path)
+    record = {"source": "import", "source_file": str(path)}
+    lines = path.read_text(encoding="utf-8").splitlines()
+    conclusion = None
+    for line in lines:
+        if conclusion is not None:
+            if line.startswith("Shifokor:"):
+                record["conclusion"] = "\n".join(conclusion).strip()
+                conclusion = None
+            else:
+                conclusion.append(line)
+                continue
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        key, value = key.strip(), value.strip()
+        if key in _PERCENT_FIELDS:
+            record[_PERCENT_FIELDS[key]] = int(value.rstrip("%") or 0)
+        elif key in _REPORT_FIELDS:
+            record[_REPORT_FIELDS[key]] = value
+        elif key == "XULOSA":
+            conclusion = []
+        elif key == "Sana" and "created_at" not in record:
+            try:
+                record["created_at"] = datetime.strptime(value, "%d.%m.%Y %H:%M").strftime(TIMESTAMP_FORMAT)
+            except ValueError:
+                pass
+    if conclusion is not None:
+        record["conclusion"] = "\n".join(conclusion).strip()
+
+    record.setdefault("created_at", _parse_file_timestamp(path) or now())
+    stamp = _TIMESTAMP_RE.search(path.stem)
+    if path.name.startswith("data_"):
+        record["data_path"] = str(path)
+        if stamp:
+            image = path.with_name(f"analysis_{path.stem[len('data_'):]}.jpg")
+            if image.exists():
+                record["image_path"] = str(image)
+    else:
+        record["report_txt_path"] = str(path)
+        html = path.with_suffix(".html")
+        if html.exists():
+            record["report_html_path"] = str(html)
+    return record
+
+
+def import_text_results(db, results_dir="results", reports_dir="reports"):
+    """Import every legacy text file once; return the number of new rows."""
+    paths = sorted(Path(results_dir).glob("data_*.txt")) + sorted(Path(reports_dir).glob("report_*.txt"))
+    return db.add_many(parse_text_file(path) for path in paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SpermAI natijalar bazasi")
+    parser.add_argument("--db", default=str(DEFAULT_DB_PATH))
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_cmd = commands.add_parser("import", help="results/ va reports/ matn fayllarini import qilish")
+    import_cmd.add_argument("--results-dir", default="results")
+    import_cmd.add_argument("--reports-dir", default="reports")
+    patient_cmd = commands.add_parser("patient", help="Bemorning barcha tahlillari")
+    patient_cmd.add_argument("patient_id")
+    args = parser.parse_args(argv)
+
+    with ResultsDB(args.db) as db:
+        if args.command == "import":
+            added = import_text_results(db, args.results_dir, args.reports_dir)
+            print(f"Import qilindi: {added} ta yozuv (jami {db.count()})")
+        elif args.command == "patient":
+            for row in db.by_patient(args.patient_id):
+                print(f"{row['created_at']}  trik {row['live_pct']}%  o'lik {row['dead_pct']}%  "
+                      f"yetilmagan {row['immature_pct']}%  {row['report_html_path'] or row['data_path'] or ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
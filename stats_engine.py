@@ -0,0 +1,255 @@
+"""Running aggregates over every saved analysis.
+
+Two small tables in the results database hold the statistics:
+
+    stats_totals   per scope/key: analyses, detections, live/dead/immature sums
+    stats_pct      per scope/key/class: how many analyses had each percentage
+
+Scopes are ``all`` (one row), ``day`` (``YYYY-MM-DD``) and ``doctor``.
+SQLite triggers on ``analyses`` add a new row's contribution on INSERT,
+swap old for new on UPDATE and subtract it on DELETE, inside the same
+transaction. No writer has to know about them, and reading the dashboard
+never rescans history. Percentages are whole numbers, so each histogram has
+at most 101 buckets, and percentiles computed from it are exact.
+
+Usage:
+    python stats_engine.py                     # overview, recent days, doctors
+    python stats_engine.py --rebuild           # recompute from the analyses table
+    python stats_engine.py --bench 100000      # dashboard timing on a synthetic database
+"""
+import argparse
+import math
+import sys
+import time
+
+CLASSES = ("live", "dead", "immature")
+CLASS_LABELS = {"live": "Trik", "dead": "O'lik", "immature": "Yetilmagan"}
+# Scope -> SQL expression of the key for a row alias
+SCOPES = {
+    "all": "''",
+    "day": "substr({row}.created_at, 1, 10)",
+    "doctor": "COALESCE(TRIM({row}.doctor), '')",
+}
+# Bump when the aggregate definitions change; the tables are then rebuilt once
+STATS_VERSION = 1
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+def _apply(row, sign):
+    """Statements adding (``sign`` 1) or removing (-1) the row alias ``row``."""
+    statements = []
+    for scope, key in SCOPES.items():
+        key = key.format(row=row)
+        statements.append(f"""
+    INSERT INTO stats_totals (scope, key, analyses, total, live, dead, immature)
+    VALUES ('{scope}', {key}, {sign}, {sign} * COALESCE({row}.total, 0),
+            {sign} * COALESCE({row}.live_count, 0), {sign} * COALESCE({row}.dead_count, 0),
+            {sign} * COALESCE({row}.immature_count, 0))
+    ON CONFLICT (scope, key) DO UPDATE SET
+        analyses = analyses + excluded.analyses, total = total + excluded.total,
+        live = live + excluded.live, dead = dead + excluded.dead,
+        immature = immature + excluded.immature;""")
+        for cls in CLASSES:
+            # Percentages of an image with no detections say nothing; skip them
+            statements.append(f"""
+    INSERT INTO stats_pct (scope, key, class, pct, n)
+    SELECT '{scope}', {key}, '{cls}', {row}.{cls}_pct, {sign}
+    WHERE {row}.{cls}_pct IS NOT NULL AND COALESCE({row}.total, 1) > 0
+    ON CONFLICT (scope, key, class, pct) DO UPDATE SET n = n + excluded.n;""")
+    return "".join(statements)
+
+
+_WATCHED = ("created_at, doctor, total, live_count, dead_count, immature_count, "
+            "live_pct, dead_pct, immature_pct")
+
+STATS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS stats_totals (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    analyses INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    live INTEGER NOT NULL,
+    dead INTEGER NOT NULL,
+    immature INTEGER NOT NULL,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats_pct (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    class TEXT NOT NULL,
+    pct INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (scope, key, class, pct)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS stats_insert AFTER INSERT ON analyses BEGIN{_apply("NEW", 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS stats_delete AFTER DELETE ON analyses BEGIN{_apply("OLD", -1)}
+END;
+CREATE TRIGGER IF NOT EXISTS stats_update AFTER UPDATE OF {_WATCHED} ON analyses BEGIN{_apply("OLD", -1)}{_apply("NEW", 1)}
+END;
+"""
+
+
+def rebuild(conn):
+    """Recompute both tables from ``analyses`` in one transaction."""
+    with conn:
+        conn.execute("DELETE FROM stats_totals")
+        conn.execute("DELETE FROM stats_pct")
+        for scope, key in SCOPES.items():
+            key = key.format(row="analyses")
+            conn.execute(f"""
+                INSERT INTO stats_totals
+                SELECT '{scope}', {key}, COUNT(*), SUM(COALESCE(total, 0)),
+                       SUM(COALESCE(live_count, 0)), SUM(COALESCE(dead_count, 0)),
+                       SUM(COALESCE(immature_count, 0))
+                FROM analyses GROUP BY 2""")
+            for cls in CLASSES:
+                conn.execute(f"""
+                    INSERT INTO stats_pct
+                    SELECT '{scope}', {key}, '{cls}', {cls}_pct, COUNT(*) FROM analyses
+                    WHERE {cls}_pct IS NOT NULL AND COALESCE(total, 1) > 0
+                    GROUP BY 2, 4""")
+        conn.execute(f"PRAGMA user_version = {STATS_VERSION}")
+
+
+def install(conn):
+    """Create the tables and triggers; backfill them for an existing database."""
+    conn.executescript(STATS_SCHEMA)
+    if conn.execute("PRAGMA user_version").fetchone()[0] < STATS_VERSION:
+        rebuild(conn)
+
+
+def percentiles(histogram, quantiles=QUANTILES):
+    """Nearest-rank quantiles and the mean of a ``{pct: n}`` histogram."""
+    n = sum(histogram.values())
+    if n <= 0:
+        return None
+    values = sorted(histogram.items())
+    summary = {"n": n, "mean": round(sum(pct * count for pct, count in values) / n, 1)}
+    for q in quantiles:
+        rank = max(1, math.ceil(q * n))
+        seen = 0
+        for pct, count in values:
+            seen += count
+            if seen >= rank:
+                summary[f"p{round(q * 100)}"] = pct
+                break
+    return summary
+
+
+def summarize(totals, histograms):
+    """One dashboard row: counts, class distribution and per-class percentiles."""
+    total = totals["total"]
+    return {
+        "key": totals["key"],
+        "analyses": totals["analyses"],
+        "total": total,
+        "counts": {cls: totals[cls] for cls in CLASSES},
+        # Share of all detected sperm, not a mean of per-image percentages
+        "distribution": {cls: round(totals[cls] / total * 100, 1) if total else 0.0
+                         for cls in CLASSES},
+        "percentiles": {cls: percentiles(histograms.get(cls, {})) for cls in CLASSES},
+    }
+
+
+def dashboard(db, days=30, doctors=50):
+    """Everything the Statistika page shows, from the aggregate tables only."""
+    sections = {}
+    for scope, limit in (("all", 1), ("day", days), ("doctor", doctors)):
+        rows = db.stats_totals(scope, limit)
+        histograms = db.stats_histograms(scope, [row["key"] for row in rows])
+        sections[scope] = [summarize(row, histograms.get(row["key"], {})) for row in rows]
+    return {
+        "overview": sections["all"][0] if sections["all"] else None,
+        "days": sections["day"],
+        "doctors": sections["doctor"],
+    }
+
+
+def _format_row(row):
+    parts = [f"{row['analyses']:>7} tahlil", f"{row['total']:>8} dona"]
+    for cls in CLASSES:
+        p = row["percentiles"][cls]
+        spread = f"{p['p50']}% ({p['p10']}-{p['p90']})" if p else "-"
+        parts.append(f"{CLASS_LABELS[cls]} {row['distribution'][cls]}% / {spread}")
+    return "  ".join(parts)
+
+
+def bench(rows, days):
+    """Fill a scratch database with ``rows`` analyses and time the dashboard."""
+    import random
+    import tempfile
+    from datetime import datetime, timedelta
+    from pathlib import Path
+
+    from results_db import TIMESTAMP_FORMAT, ResultsDB
+
+    rng = random.Random(0)
+    start_day = datetime.now() - timedelta(days=days)
+    doctors = [f"Shifokor {i}" for i in range(20)] + [""]
+    records = []
+    for i in range(rows):
+        live, dead, immature = (rng.randint(0, 60) for _ in range(3))
+        total = live + dead + immature
+        pct = [round(c / total * 100) if total else 0 for c in (live, dead, immature)]
+        records.append({
+            "created_at": (start_day + timedelta(seconds=i * days * 86400 // rows)).strftime(TIMESTAMP_FORMAT),
+            "doctor": rng.choice(doctors), "total": total, "live_count": live,
+            "dead_count": dead, "immature_count": immature,
+            "live_pct": pct[0], "dead_pct": pct[1], "immature_pct": pct[2],
+        })
+    with tempfile.TemporaryDirectory(prefix="spermai_stats_") as scratch:
+        with ResultsDB(Path(scratch) / "bench.db") as db:
+            t = time.perf_counter()
+            db.add_many(records)
+            insert_seconds = time.perf_counter() - t
+            t = time.perf_counter()
+            db.add({"doctor": "Shifokor 1", "total": 10, "live_count": 5, "dead_count": 3,
+                    "immature_count": 2, "live_pct": 50, "dead_pct": 30, "immature_pct": 20})
+            single_ms = (time.perf_counter() - t) * 1000
+            t = time.perf_counter()
+            data = dashboard(db)
+            dashboard_ms = (time.perf_counter() - t) * 1000
+            t = time.perf_counter()
+            db.rebuild_stats()
+            rebuild_ms = (time.perf_counter() - t) * 1000
+    print(f"{rows} ta tahlil: bulk insert {insert_seconds:.2f} s "
+          f"({insert_seconds / rows * 1e6:.0f} us/qator), bitta insert {single_ms:.2f} ms")
+    print(f"Dashboard: {dashboard_ms:.1f} ms  |  to'liq qayta hisoblash: {rebuild_ms:.0f} ms")
+    print("Jami:", _format_row(data["overview"]))
+
+
+def main(argv=None):
+    from results_db import DEFAULT_DB_PATH, ResultsDB
+
+    parser = argparse.ArgumentParser(description="Tahlillar bo'yicha umumiy statistika")
+    parser.add_argument("--db", default=str(DEFAULT_DB_PATH))
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--rebuild", action="store_true", help="Statistikani qaytadan hisoblash")
+    parser.add_argument("--bench", type=int, default=0, metavar="N",
+                        help="N ta sun'iy tahlil bilan tezlikni o'lchash")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        bench(args.bench, 365)
+        return 0
+    with ResultsDB(args.db) as db:
+        if args.rebuild:
+            db.rebuild_stats()
+        data = dashboard(db, args.days)
+    if data["overview"] is None:
+        print("Bazada tahlillar yo'q")
+        return 0
+    print("Jami:      ", _format_row(data["overview"]))
+    print("\nKunlar bo'yicha:")
+    for row in data["days"]:
+        print(f"  {row['key']}  {_format_row(row)}")
+    print("\nShifokorlar bo'yicha:")
+    for row in data["doctors"]:
+        doctor = row["key"] or "Noma'lum"
+        print(f"  {doctor:<20} {_format_row(row)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
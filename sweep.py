@@ -0,0 +1,232 @@
+"""Speed/accuracy sweep over inference settings.
+
+Usage:
+    python sweep.py                                          # images/val, default grid
+    python sweep.py images/val --imgsz 480 640 --backends pytorch onnx onnx-int8 \\
+        --threads 1 2 4 --batch-size 1 4 8 --repeat 3
+    python sweep.py --dry-run                                # do not write the config file
+
+Every combination of ``--imgsz``, ``--backends``, ``--threads`` and
+``--batch-size`` runs in a fresh process, so peak RSS and thread settings
+are its own. Latency (per model call and per image), throughput and peak
+RSS are recorded, and the counts are compared image by image with a
+reference run (PyTorch, 640 px, one image per call, all threads).
+
+The Pareto frontier over throughput and count deviation is printed, and the
+fastest configuration whose live/dead/immature percentages stay within
+``--tolerance`` percentage points of the reference is written to
+``spermai_config.json`` (see ``app_config``), which the desktop app and
+``batch_analyze.py`` load at startup. The full sweep is saved to
+``results/sweep_<timestamp>.json``.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from analysis import DEFAULT_CONF, DEFAULT_MODEL_PATH
+from app_config import CONFIG_PATH, save_config
+from backends import BACKENDS, DEFAULT_BACKEND, DEFAULT_IMGSZ
+
+DEFAULT_TOLERANCE = 2.0       # percentage points per class, as in quantize.py
+
+
+def run_config(config):
+    """Time one configuration; meant to run in its own process."""
+    from inference_pool import pin_threads
+
+    pin_threads(config["threads"])
+    import numpy as np
+
+    from analysis import SpermAnalyzer, read_image
+    from image_buffer import peak_rss_mb
+
+    analyzer = SpermAnalyzer(config["model"], backend=config["backend"], conf=config["conf"],
+                             imgsz=config["imgsz"]).load()
+    if analyzer.backend != config["backend"]:
+        return {"skipped": f"{config['backend']} yuklanmadi ({analyzer.backend} ishlatilardi)"}
+
+    images = [read_image(path) for path in config["paths"]]
+    batch_size = config["batch_size"]
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+    analyzer.analyze_batch(batches[0])        # warm-up, not timed
+
+    calls = []
+    counts = []
+    start = time.perf_counter()
+    for repeat in range(config["repeat"]):
+        for batch in batches:
+            t = time.perf_counter()
+            results = analyzer.analyze_batch(batch)
+            calls.append((time.perf_counter() - t, len(batch)))
+            if repeat == 0:
+                counts += [result.counts for result in results]
+    elapsed = time.perf_counter() - start
+
+    call_ms = np.array([seconds for seconds, _ in calls]) * 1000
+    image_ms = np.array([seconds / n for seconds, n in calls]) * 1000
+    return {
+        "images_per_sec": round(sum(n for _, n in calls) / elapsed, 3),
+        "call_p50_ms": round(float(np.percentile(call_ms, 50)), 2),
+        "call_p95_ms": round(float(np.percentile(call_ms, 95)), 2),
+        "image_ms": round(float(image_ms.mean()), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "counts": [list(c) for c in counts],
+    }
+
+
+def agreement(counts, reference):
+    """Count agreement of one run with the reference run, image by image."""
+    from analysis import percentage
+
+    exact = 0
+    count_deltas = []
+    pct_deltas = []
+    for ours, ref in zip(counts, reference):
+        exact += list(ours) == list(ref)
+        count_deltas += [abs(a - b) for a, b in zip(ours, ref)]
+        ours_pct = [percentage(c, sum(ours)) for c in ours]
+        ref_pct = [percentage(c, sum(ref)) for c in ref]
+        pct_deltas += [abs(a - b) for a, b in zip(ours_pct, ref_pct)]
+    return {
+        "exact_match": round(exact / len(reference), 3),
+        "mean_abs_count_delta": round(sum(count_deltas) / len(count_deltas), 3),
+        "max_pct_delta": max(pct_deltas),
+    }
+
+
+def pareto_front(rows):
+    """Rows no other row beats on both throughput (higher) and deviation (lower)."""
+    front = []
+    for row in rows:
+        dominated = any(
+            other["images_per_sec"] >= row["images_per_sec"]
+            and other["max_pct_delta"] <= row["max_pct_delta"]
+            and (other["images_per_sec"] > row["images_per_sec"]
+                 or other["max_pct_delta"] < row["max_pct_delta"])
+            for other in rows
+        )
+        if not dominated:
+            front.append(row)
+    return sorted(front, key=lambda row: -row["images_per_sec"])
+
+
+def recommend(rows, tolerance):
+    """Fastest row within ``tolerance``; less memory breaks ties."""
+    accepted = [row for row in rows if row["max_pct_delta"] <= tolerance]
+    if not accepted:
+        return None
+    return max(accepted, key=lambda row: (row["images_per_sec"], -row["peak_rss_mb"]))
+
+
+def describe(row):
+    return (f"{row['backend']:<11} {row['imgsz']:>5} {row['threads']:>6} {row['batch_size']:>6} "
+            f"{row['images_per_sec']:>8} {row['image_ms']:>9} {row['call_p95_ms']:>9} "
+            f"{row['peak_rss_mb']:>7} {row['exact_match']:>6} {row['max_pct_delta']:>5}")
+
+
+def parse_args(argv=None):
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Inference sozlamalari bo'yicha tezlik/aniqlik o'lchovi")
+    parser.add_argument("directory", nargs="?", default="images/val")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[480, 640, 800])
+    parser.add_argument("--backends", nargs="+", default=[DEFAULT_BACKEND, "onnx"],
+                        choices=sorted(BACKENDS))
+    parser.add_argument("--threads", type=int, nargs="+",
+                        default=sorted({1, max(1, cpus // 2), cpus}))
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3, help="Papka necha marta o'tiladi")
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONF)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Etalondan ruxsat etilgan foiz farqi (foiz punkti)")
+    parser.add_argument("--config", default=str(CONFIG_PATH), help="Tavsiya etilgan sozlamalar fayli")
+    parser.add_argument("--dry-run", action="store_true", help="Sozlamalar faylini yozmaslik")
+    parser.add_argument("--output", default=None, help="JSON fayl (standart: results/sweep_<vaqt>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from batch_analyze import find_images
+
+    args = parse_args(argv)
+    paths = [str(p) for p in find_images(args.directory)] if Path(args.directory).is_dir() else []
+    if not paths:
+        print(f"Papkada rasm topilmadi: {args.directory}", file=sys.stderr)
+        return 1
+
+    base = {"model": args.model, "paths": paths, "conf": args.conf, "repeat": args.repeat}
+    reference_config = {**base, "backend": DEFAULT_BACKEND, "imgsz": DEFAULT_IMGSZ,
+                        "threads": os.cpu_count() or 1, "batch_size": 1}
+    context = multiprocessing.get_context("spawn")
+
+    def run(config):
+        with context.Pool(1) as pool:
+            return pool.apply(run_config, (config,))
+
+    print(f"Etalon: {DEFAULT_BACKEND}, {DEFAULT_IMGSZ} px, 1 rasm/chaqiruv  |  rasmlar: {len(paths)}")
+    reference = run(reference_config)["counts"]
+
+    rows = []
+    skipped = []
+    print(f"{'backend':<11} {'imgsz':>5} {'oqim':>6} {'batch':>6} {'rasm/s':>8} {'ms/rasm':>9} "
+          f"{'p95 ms':>9} {'RSS MB':>7} {'mos':>6} {'p.p.':>5}")
+    for backend, imgsz, threads, batch_size in itertools.product(
+            args.backends, args.imgsz, args.threads, args.batch_size):
+        settings = {"backend": backend, "imgsz": imgsz, "threads": threads,
+                    "batch_size": batch_size}
+        stats = run({**base, **settings})
+        if "skipped" in stats:
+            skipped.append({**settings, "reason": stats["skipped"]})
+            print(f"{backend:<11} {imgsz:>5} {threads:>6} {batch_size:>6}  o'tkazildi: {stats['skipped']}")
+            continue
+        row = {**settings, **{k: v for k, v in stats.items() if k != "counts"},
+               **agreement(stats["counts"], reference)}
+        rows.append(row)
+        print(describe(row))
+    if not rows:
+        print("Hech bir sozlama ishlamadi", file=sys.stderr)
+        return 1
+
+    front = pareto_front(rows)
+    print("\nPareto chegarasi (tezlik / aniqlik):")
+    for row in front:
+        print(describe(row))
+
+    best = recommend(rows, args.tolerance)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_path = Path(args.output) if args.output else Path("results") / f"sweep_{timestamp}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps({
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "directory": args.directory,
+        "tolerance_pct": args.tolerance,
+        "reference": {k: v for k, v in reference_config.items() if k != "paths"},
+        "rows": rows,
+        "skipped": skipped,
+        "pareto": front,
+        "recommended": best,
+    }, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nNatijalar: {output_path}")
+
+    if best is None:
+        print(f"Hech bir sozlama {args.tolerance} p.p. ichida emas; sozlamalar fayli yozilmadi",
+              file=sys.stderr)
+        return 1
+    print(f"Tavsiya: {best['backend']}, {best['imgsz']} px, {best['threads']} oqim, "
+          f"batch {best['batch_size']}  ({best['images_per_sec']} rasm/s)")
+    if not args.dry_run:
+        path = save_config(best, args.config, images_per_sec=best["images_per_sec"],
+                           max_pct_delta=best["max_pct_delta"], source=str(output_path),
+                           created=datetime.now().isoformat(timespec="seconds"))
+        print(f"Sozlamalar yozildi: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import archive
+from detections import pack
+
+WHEN = datetime(2025, 4, 10, 18, 8, 0)
+
+
+def make_result():
+    detections = pack([[0, 0, 10, 10], [20, 20, 30, 30]], [0, 2], [0.9, 0.4])
+    return SimpleNamespace(detections=detections, image_shape=(480, 640),
+                           conf_threshold=0.25, iou_threshold=0.7)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "capture.jpg"
+    path.write_bytes(b"\xff\xd8 not really a jpeg")
+    return path
+
+
+def test_data_file_is_written_last(tmp_path, source, monkeypatch):
+    written = []
+    atomic_write = archive.atomic_write
+
+    def recording_write(path, write, mode="wb"):
+        written.append(path.name)
+        return atomic_write(path, write, mode)
+
+    monkeypatch.setattr(archive, "atomic_write", recording_write)
+    results = tmp_path / "results"
+    assert archive.save_analysis(source, "20250410_180800", "summary", make_result(), results) is False
+    assert written == ["analysis_20250410_180800.npz", "data_20250410_180800.txt"]
+    paths = archive.archive_paths(source, "20250410_180800", results)
+    assert paths["image"].read_bytes() == source.read_bytes()
+
+    detections, image_shape, conf, iou = archive.load_detections(paths["detections"])
+    np.testing.assert_array_equal(detections, make_result().detections)
+    assert (image_shape, conf, iou) == ((480, 640), 0.25, pytest.approx(0.7))
+
+
+def test_failed_save_leaves_no_data_file(tmp_path, source, monkeypatch):
+    def failing_save(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(archive, "save_detections", failing_save)
+    results = tmp_path / "results"
+    with pytest.raises(OSError):
+        archive.save_analysis(source, "20250410_180800", "summary", make_result(), results)
+    # Without its data file the analysis is not listed anywhere
+    assert not list(results.glob("data_*"))
+
+
+def test_duplicate_image_is_stored_once(tmp_path, source):
+    results = tmp_path / "results"
+    assert archive.save_analysis(source, "20250410_180800", "a", results_dir=results) is False
+    assert archive.save_analysis(source, "20250410_180801", "b", results_dir=results) is True
+    assert len(list((results / archive.OBJECTS_DIR_NAME).rglob("*.jpg"))) == 1
+
+
+def test_new_stem_skips_saved_and_queued_stems(tmp_path, source):
+    results = tmp_path / "results"
+    assert archive.new_stem(source, results, when=WHEN) == "20250410_180800"
+    archive.save_analysis(source, "20250410_180800", "a", results_dir=results)
+    assert archive.new_stem(source, results, when=WHEN) == "20250410_180800_2"
+    assert archive.new_stem(source, results, taken={"20250410_180800_2"},
+                            when=WHEN) == "20250410_180800_3"
@@ -0,0 +1,89 @@
+import numpy as np
+
+from detection_store import COLUMNS, DetectionStore, _row_bytes
+
+
+def boxes(n, start=0.0):
+    return np.arange(start, start + 4 * n, dtype=np.float32).reshape(n, 4)
+
+
+def fill(store):
+    store.append(1, boxes(3), [0, 1, 2], [0.9, 0.8, 0.7])
+    store.append(2, boxes(2, 100), [0, 0], [0.6, 0.5])
+    # Images without detections or without a database id add nothing
+    assert store.append(3, boxes(0), [], []) == 0
+    assert store.append(None, boxes(1), [1], [0.4]) == 0
+
+
+def test_append_and_memmap_reads(tmp_path):
+    with DetectionStore(tmp_path / "store") as store:
+        fill(store)
+        segment, = store.segments()
+        assert isinstance(segment["conf"], np.memmap) and not segment["conf"].flags.writeable
+        assert store.count() == 5
+        assert store.count(cls=0, image_ids=[2]) == 2
+        assert store.class_counts().tolist() == [3, 1, 1]
+        rows = store.read(image_ids=[1])
+        assert rows["cls"].tolist() == [0, 1, 2]
+        np.testing.assert_array_equal(rows["box"], boxes(3))
+        assert store.image_ids().tolist() == [1, 2]
+        counts, _ = store.histogram(bins=10)
+        assert counts.sum() == 5
+
+
+def test_columns_cut_short_by_a_crash_are_read_to_the_shortest(tmp_path):
+    with DetectionStore(tmp_path / "store") as store:
+        fill(store)
+    segment_dir, = (tmp_path / "store").iterdir()
+    # A crash between column writes: conf and a partial box row got through
+    with open(segment_dir / "conf.bin", "ab") as f:
+        f.write(np.float32([0.3, 0.2]).tobytes())
+    with open(segment_dir / "box.bin", "ab") as f:
+        f.write(b"\0" * 7)
+
+    store = DetectionStore(tmp_path / "store")
+    assert store.count() == 5
+    assert len(store.read()) == 5
+
+
+class FailingFile:
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, data):
+        self._f.write(data[:3])
+        raise OSError("disk full")
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+def test_failed_append_leaves_the_columns_aligned(tmp_path):
+    with DetectionStore(tmp_path / "store") as store:
+        fill(store)
+        store._files["box"] = FailingFile(store._files["box"])
+        try:
+            store.append(4, boxes(2), [1, 1], [0.9, 0.9])
+        except OSError:
+            pass
+        else:
+            raise AssertionError("append should have failed")
+        store._files["box"] = store._files["box"]._f
+        store.append(5, boxes(1), [2], [0.3])
+    segment_dir, = (tmp_path / "store").iterdir()
+    rows = {(segment_dir / f"{name}.bin").stat().st_size // _row_bytes(name) for name in COLUMNS}
+    assert rows == {6}
+    assert DetectionStore(tmp_path / "store").image_ids().tolist() == [1, 2, 5]
+
+
+def test_compact_keeps_only_the_given_images(tmp_path):
+    with DetectionStore(tmp_path / "store") as store:
+        fill(store)
+    # A second writer adds its own segment
+    with DetectionStore(tmp_path / "store") as store:
+        store.append(7, boxes(1), [1], [0.9])
+        assert len(list(store.segments())) == 2
+        assert store.compact(keep_ids=[1, 7]) == 4
+        assert len(list(store.segments())) == 1
+        assert store.image_ids().tolist() == [1, 7]
+        assert store.class_counts().tolist() == [1, 2, 1]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from detections import greedy_nms, nms_mask, pack, pairwise_iou, threshold_mask
+
+pytest.importorskip("torchvision")
+
+
+def reference_nms(detections, conf, iou, max_det):
+    """Textbook class-aware greedy NMS, one box at a time."""
+    order = [i for i in np.argsort(-detections["conf"], kind="stable")
+             if detections["conf"][i] > conf]
+    kept = []
+    for i in order:
+        if all(detections["cls"][i] != detections["cls"][j]
+               or pairwise_iou(detections["box"][i:i + 1], detections["box"][j:j + 1])[0, 0] <= iou
+               for j in kept):
+            kept.append(i)
+    mask = np.zeros(len(detections), dtype=bool)
+    mask[kept[:max_det]] = True
+    return mask
+
+
+def random_detections(rng, n):
+    # Clustered boxes, so plenty of them overlap
+    centers = rng.uniform(0, 600, (n // 4 + 1, 2))[rng.integers(0, n // 4 + 1, n)]
+    centers += rng.normal(0, 6, (n, 2))
+    sizes = rng.uniform(10, 40, (n, 2))
+    boxes = np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1)
+    return pack(boxes, rng.integers(0, 3, n), rng.uniform(0.05, 1.0, n))
+
+
+@pytest.mark.parametrize("conf,iou", [(0.25, 0.7), (0.1, 0.3), (0.5, 0.9), (0.05, 0.5)])
+def test_nms_mask_matches_greedy_nms(conf, iou):
+    rng = np.random.default_rng(int(conf * 100 + iou * 10))
+    for _ in range(5):
+        detections = random_detections(rng, 200)
+        np.testing.assert_array_equal(nms_mask(detections, conf, iou),
+                                      reference_nms(detections, conf, iou, 300))
+
+
+def test_max_det_keeps_the_most_confident():
+    rng = np.random.default_rng(0)
+    detections = random_detections(rng, 200)
+    mask = nms_mask(detections, 0.05, 0.7, max_det=10)
+    np.testing.assert_array_equal(mask, reference_nms(detections, 0.05, 0.7, 10))
+    assert mask.sum() == 10
+
+
+def test_boxes_of_other_classes_do_not_suppress_each_other():
+    detections = pack([[0, 0, 10, 10], [0, 0, 10, 10], [0, 0, 10, 10]], [0, 1, 0], [0.9, 0.8, 0.7])
+    assert nms_mask(detections, 0.25, 0.7).tolist() == [True, True, False]
+    assert greedy_nms(detections["box"], detections["cls"], detections["conf"], 0.95, 0.7).size == 0
+
+
+def test_fast_nms_keeps_a_subset_of_greedy_nms():
+    # Fast NMS also lets already suppressed boxes suppress others
+    rng = np.random.default_rng(1)
+    detections = random_detections(rng, 200)
+    fast = threshold_mask(detections, 0.25, 0.7)
+    exact = nms_mask(detections, 0.25, 0.7)
+    assert not (fast & ~exact).any()
+    assert detections["suppress_iou"][np.argmax(detections["conf"])] == 0
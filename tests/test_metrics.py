@@ -0,0 +1,36 @@
+from metrics import Metrics
+
+
+def test_superseded_token_stays_out_of_the_breakdown():
+    metrics = Metrics()
+    first = metrics.begin()
+    metrics.record("decode", 0.1, first)
+    second = metrics.begin()
+    # A cancelled worker of the first image finishing late
+    with metrics.stage("inference", first):
+        pass
+    metrics.record("decode", 0.2, second)
+
+    assert metrics.last == {"decode": 0.2}
+    snapshot = metrics.snapshot()
+    assert snapshot["inference"]["count"] == 1
+    assert snapshot["decode"]["count"] == 2
+
+
+def test_begin_keeps_session_stages():
+    metrics = Metrics()
+    metrics.record("startup", 1.0)
+    metrics.record("model_load", 2.0)
+    token = metrics.begin()
+    metrics.record("overlay", 0.3)
+    metrics.begin()
+    assert metrics.last == {"startup": 1.0, "model_load": 2.0}
+    assert token != metrics.begin()
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+    with metrics.stage("decode", metrics.begin()):
+        pass
+    metrics.record("inference", 1.0)
+    assert metrics.snapshot() == {} and metrics.last == {}
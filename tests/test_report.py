@@ -0,0 +1,34 @@
+from datetime import datetime
+import html
+
+import pytest
+
+from report import ReportTemplate, report_values, write_report
+
+
+def test_render_fills_every_placeholder():
+    template = ReportTemplate("{{name}}: {{ total }} ({{name}})")
+    assert template.placeholders == {"name", "total"}
+    assert template.render({"name": "Bemor", "total": 12, "unused": 1}) == "Bemor: 12 (Bemor)"
+
+
+def test_missing_value_raises():
+    with pytest.raises(KeyError, match="total"):
+        ReportTemplate("{{name}} {{total}}").render({"name": "Bemor"})
+
+
+def test_escape_applies_to_values_only():
+    template = ReportTemplate("<p>{{name}}</p>", escape=html.escape)
+    assert template.render({"name": "<b>A & B</b>"}) == "<p>&lt;b&gt;A &amp; B&lt;/b&gt;</p>"
+
+
+def test_html_report_is_escaped_and_text_report_is_not(tmp_path):
+    patient = {"name": "<script>x</script>", "doctor": "Dr. O'Neil"}
+    values = report_values(patient, (5, 3, 2), (50, 30, 20), datetime(2025, 4, 10, 18, 8))
+    paths = write_report(values, tmp_path, stem="report_test")
+    page = paths["html"].read_text(encoding="utf-8")
+    assert "<script>x</script>" not in page
+    assert "&lt;script&gt;x&lt;/script&gt;" in page
+    text = paths["txt"].read_text(encoding="utf-8")
+    assert "<script>x</script>" in text
+    assert "10.04.2025" in text
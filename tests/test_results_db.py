@@ -0,0 +1,26 @@
+from results_db import ResultsDB, import_text_results
+
+DATA_FILE = """=== TAHLIL NATIJALARI ===
+Sana: 10.04.2025 18:08
+
+Trik spermalar: {live}%
+O'lik spermalar: {dead}%
+Yetilmagan spermalar: {immature}%
+"""
+
+
+def write_data_files(directory, n):
+    directory.mkdir()
+    for i in range(n):
+        (directory / f"data_20250410_18{i:04d}.txt").write_text(
+            DATA_FILE.format(live=50 + i, dead=30, immature=20 - i), encoding="utf-8")
+
+
+def test_import_counts_each_row_once(tmp_path):
+    write_data_files(tmp_path / "results", 5)
+    with ResultsDB(tmp_path / "spermai.db") as db:
+        assert import_text_results(db, tmp_path / "results", tmp_path / "reports") == 5
+        assert db.count() == 5
+        # Already imported files are skipped
+        assert import_text_results(db, tmp_path / "results", tmp_path / "reports") == 0
+        assert db.count() == 5
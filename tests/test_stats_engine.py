@@ -0,0 +1,49 @@
+import random
+
+import stats_engine
+from results_db import ResultsDB
+
+
+def snapshot(conn):
+    return (
+        sorted(tuple(r) for r in conn.execute("SELECT * FROM stats_totals WHERE analyses != 0")),
+        sorted(tuple(r) for r in conn.execute("SELECT * FROM stats_pct WHERE n != 0")),
+    )
+
+
+def random_record(rng):
+    live, dead, immature = (rng.randint(0, 30) for _ in range(3))
+    total = live + dead + immature
+    pct = [round(c / total * 100) if total else 0 for c in (live, dead, immature)]
+    return {
+        "created_at": f"2025-04-{rng.randint(1, 5):02d} 10:00:00",
+        "doctor": rng.choice(["Dr. A", "Dr. B", " Dr. A ", None]),
+        "total": total, "live_count": live, "dead_count": dead, "immature_count": immature,
+        "live_pct": pct[0], "dead_pct": pct[1], "immature_pct": pct[2],
+    }
+
+
+def test_triggers_match_rebuild_after_mixed_writes(tmp_path):
+    rng = random.Random(7)
+    with ResultsDB(tmp_path / "spermai.db") as db:
+        ids = [db.add(random_record(rng)) for _ in range(40)]
+        ids += [i for i in db.add_batch([random_record(rng) for _ in range(10)]) if i]
+        for analysis_id in rng.sample(ids, 15):
+            record = random_record(rng)
+            db.update(analysis_id, **{k: record[k] for k in ("doctor", "live_count", "live_pct",
+                                                             "total", "created_at")})
+        # Patient details are not aggregated; the update trigger must ignore them
+        db.update(ids[0], patient_name="Bemor")
+        with db._conn:
+            for analysis_id in rng.sample(ids, 10):
+                db._conn.execute("DELETE FROM analyses WHERE id = ?", (analysis_id,))
+
+        incremental = snapshot(db._conn)
+        stats_engine.rebuild(db._conn)
+        assert snapshot(db._conn) == incremental
+
+
+def test_percentiles_are_nearest_rank():
+    summary = stats_engine.percentiles({10: 1, 20: 2, 90: 1})
+    assert summary == {"n": 4, "mean": 35.0, "p10": 10, "p50": 20, "p90": 90}
+    assert stats_engine.percentiles({}) is None
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from tiling import cross_tile_suppress, tile_grid, tiled_detections
+
+torch = pytest.importorskip("torch")
+
+
+class FakeBoxes:
+    def __init__(self, rows):
+        self.xyxy = torch.from_numpy(rows[:, :4].copy())
+        self.conf = torch.from_numpy(rows[:, 4].copy())
+        self.cls = torch.from_numpy(rows[:, 5].copy())
+
+    def cpu(self):
+        return self
+
+    def __len__(self):
+        return len(self.conf)
+
+
+def predictor(per_tile):
+    """``predict`` returning ``per_tile[i]`` (frame-less tile coordinates) for tile ``i``."""
+    calls = iter(per_tile)
+
+    def predict(tiles):
+        return [SimpleNamespace(boxes=FakeBoxes(np.asarray(next(calls), dtype=np.float32)
+                                                .reshape(-1, 6)))
+                for _ in tiles]
+    return predict
+
+
+IMAGE = np.zeros((1000, 1000, 3), dtype=np.uint8)
+
+
+def test_grid_of_a_1000px_frame():
+    assert tile_grid(1000, 1000, 640, 0.2).tolist() == [[0, 0], [0, 360], [360, 0], [360, 360]]
+
+
+def test_sperm_on_a_seam_is_counted_once():
+    # At x 400-440 the sperm is in tile 0 and, cut off, in tile 1 (x from 360)
+    per_tile = [
+        [[400, 100, 440, 140, 0.9, 0]],
+        [[40, 100, 70, 140, 0.6, 0]],
+        [],
+        [],
+    ]
+    boxes, classes, scores = tiled_detections(predictor(per_tile), IMAGE, 640, 0.2)
+    assert boxes.tolist() == [[400, 100, 440, 140]]
+    assert scores.tolist() == [pytest.approx(0.9)]
+
+
+def test_neighbours_within_one_tile_are_kept():
+    # Already suppressed by the tile's own NMS; the seam dedup must not merge them
+    per_tile = [
+        [[400, 100, 440, 140, 0.9, 0], [405, 105, 440, 140, 0.8, 1]],
+        [],
+        [],
+        [],
+    ]
+    boxes, classes, _ = tiled_detections(predictor(per_tile), IMAGE, 640, 0.2)
+    assert sorted(classes.tolist()) == [0, 1]
+
+
+def test_raw_candidates_go_through_per_tile_nms():
+    per_tile = [
+        [[10, 10, 50, 50, 0.9, 0], [11, 11, 50, 50, 0.8, 0], [10, 10, 50, 50, 0.1, 2]],
+        [],
+        [],
+        [],
+    ]
+    _, classes, scores = tiled_detections(predictor(per_tile), IMAGE, 640, 0.2, conf=0.25, iou=0.7)
+    assert classes.tolist() == [0]
+    assert scores.tolist() == [pytest.approx(0.9)]
+
+
+def test_cross_tile_suppress_prefers_the_higher_score():
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 9], [0, 0, 10, 10]], dtype=np.float32)
+    scores = np.array([0.5, 0.9, 0.7], dtype=np.float32)
+    classes = np.zeros(3, dtype=np.int64)
+    tile_ids = np.array([0, 1, 1])
+    # Box 2 is in the same tile as the winner, box 0 is not
+    assert cross_tile_suppress(boxes, scores, classes, tile_ids, 0.6, chunk_size=1).tolist() == [1, 2]
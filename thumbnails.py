@@ -0,0 +1,82 @@
+"""Persistent, size-capped cache of small JPEG thumbnails.
+
+Thumbnails are keyed by the image's absolute path, size and mtime, so an
+overwritten file gets a new thumbnail without hashing its contents. The
+size-bounded LRU bookkeeping is ``detection_cache.FileCache``, shared with
+the detection cache; only the entry format differs.
+
+JPEGs are decoded at 1/2, 1/4 or 1/8 scale directly by libjpeg
+(``IMREAD_REDUCED_COLOR_*``), so a thumbnail of a 12 MP capture never
+materializes the full-resolution frame. Other formats go through
+``image_buffer`` (memory-mapped for large BMP/TIFF) and are subsampled.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from backends import CACHE_DIR
+from detection_cache import FileCache
+
+THUMBNAIL_SIZE = 128
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+JPEG_QUALITY = 85
+
+
+def thumbnail_key(path, size=THUMBNAIL_SIZE):
+    stat = os.stat(path)
+    payload = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{size}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def render_thumbnail(path, size=THUMBNAIL_SIZE):
+    """BGR array of ``path`` fitting in ``size`` x ``size``."""
+    import cv2
+
+    from image_buffer import decode_image, downscale
+
+    image = None
+    if Path(path).suffix.lower() in (".jpg", ".jpeg"):
+        # Largest libjpeg reduction that still leaves at least ``size`` pixels
+        for flag in (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_COLOR_4,
+                     cv2.IMREAD_REDUCED_COLOR_2):
+            image = cv2.imread(str(path), flag)
+            if image is None or max(image.shape[:2]) >= size:
+                break
+    if image is None or max(image.shape[:2]) < size:
+        image = decode_image(path)
+    return downscale(image, size, size)
+
+
+class ThumbnailCache(FileCache):
+    SUFFIX = ".jpg"
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, size=THUMBNAIL_SIZE):
+        self.size = size
+        super().__init__(directory or CACHE_DIR.parent / "thumbnails", max_bytes)
+
+    def get(self, path):
+        """JPEG bytes of the thumbnail, rendering and storing it on a miss."""
+        key = thumbnail_key(path, self.size)
+        cached = self._lookup(key)
+        if cached is not None:
+            try:
+                data = cached.read_bytes()
+                self._hit(cached)
+                return data
+            except OSError:
+                self._lost(key)
+        data = self.encode(render_thumbnail(path, self.size))
+        self.put(key, data)
+        return data
+
+    @staticmethod
+    def encode(image):
+        import cv2
+
+        ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not ok:
+            raise ValueError("Thumbnail kodlanmadi")
+        return buffer.tobytes()
+
+    def put(self, key, data):
+        self._store(key, lambda f: f.write(data))
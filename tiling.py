@@ -0,0 +1,171 @@
+"""Tiled (sliced) inference for frames much larger than the model input.
+
+The frame is cut into overlapping ``tile_size`` squares, the tiles are run
+through the model in batches and the detections are shifted back into frame
+coordinates. The model runs without NMS (``analysis.RAW_IOU``), so each
+tile's candidates first go through the same greedy NMS as ``model(tile)``.
+A sperm lying on a seam is then found by two or more tiles, often cut off
+in one of them, so duplicates are removed with a vectorized cross-tile
+suppression that compares intersection over the *smaller* box rather than
+IoU.
+
+Unlike a single pass, a tiled result is settled at the thresholds it was
+made at: lowering them later cannot bring back boxes the per-tile NMS or
+the seam dedup already dropped.
+
+Tiles are views into the decoded frame and at most ``batch_size`` of them
+are materialized at a time, so extra memory is bounded by the batch rather
+than by the frame size.
+"""
+import numpy as np
+
+DEFAULT_TILE_SIZE = 640
+DEFAULT_OVERLAP = 0.2
+DEFAULT_MATCH_THRESHOLD = 0.6
+
+
+def tile_starts(length, tile_size, overlap_px):
+    """Start offsets along one axis; the last tile is aligned to the edge."""
+    if length <= tile_size:
+        return np.zeros(1, dtype=np.int64)
+    stride = max(tile_size - overlap_px, 1)
+    starts = np.arange(0, length - tile_size, stride, dtype=np.int64)
+    return np.append(starts, length - tile_size)
+
+
+def tile_grid(height, width, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP):
+    """Return an ``(N, 2)`` array of ``(y, x)`` tile origins."""
+    overlap_px = int(round(tile_size * overlap))
+    ys = tile_starts(height, tile_size, overlap_px)
+    xs = tile_starts(width, tile_size, overlap_px)
+    yy, xx = np.meshgrid(ys, xs, indexing="ij")
+    return np.stack([yy.ravel(), xx.ravel()], axis=1)
+
+
+def iter_tile_batches(image, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP,
+                      batch_size=16):
+    """Yield ``(tiles, origins)`` with at most ``batch_size`` tiles each."""
+    height, width = image.shape[:2]
+    origins = tile_grid(height, width, tile_size, overlap)
+    for start in range(0, len(origins), batch_size):
+        batch = origins[start:start + batch_size]
+        tiles = [np.ascontiguousarray(image[y:y + tile_size, x:x + tile_size])
+                 for y, x in batch]
+        yield tiles, batch
+
+
+def pairwise_ios(a, b):
+    """Intersection over the smaller box for every pair in ``a`` x ``b``."""
+    # Per-component min/max keeps the temporaries at len(a) x len(b)
+    ix = np.clip(np.minimum(a[:, None, 2], b[None, :, 2])
+                 - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    iy = np.clip(np.minimum(a[:, None, 3], b[None, :, 3])
+                 - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = ix * iy
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    smaller = np.minimum(area_a[:, None], area_b[None, :])
+    return inter / np.maximum(smaller, 1e-9)
+
+
+def cross_tile_suppress(boxes, scores, classes, tile_ids,
+                        threshold=DEFAULT_MATCH_THRESHOLD, class_agnostic=True,
+                        chunk_size=512):
+    """Return indices of the detections kept after cross-tile dedup.
+
+    Detections from the same tile were already suppressed by the per-tile
+    NMS, so only pairs from different tiles are compared. A detection is dropped if
+    any higher-scoring detection from another tile covers it by at least
+    ``threshold``. Rows are processed in chunks so the pairwise matrix never
+    exceeds ``chunk_size`` x N.
+    """
+    n = len(boxes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    order = np.argsort(-scores, kind="stable")
+    boxes = boxes[order]
+    classes = classes[order]
+    tile_ids = tile_ids[order]
+
+    suppressed = np.zeros(n, dtype=bool)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        # Row i may only be suppressed by columns j < i (higher score)
+        ios = pairwise_ios(boxes[start:stop], boxes[:stop])
+        match = ios >= threshold
+        match &= tile_ids[start:stop, None] != tile_ids[None, :stop]
+        if not class_agnostic:
+            match &= classes[start:stop, None] == classes[None, :stop]
+        match &= np.arange(start, stop)[:, None] > np.arange(stop)[None, :]
+        suppressed[start:stop] = match.any(axis=1)
+
+    return np.sort(order[~suppressed])
+
+
+def seam_candidates(boxes, tile_ids, origins, tile_size):
+    """Mask of detections that also overlap a tile other than their own.
+
+    Only these can have a duplicate, so everything else skips the pairwise
+    comparison entirely.
+    """
+    tile_boxes = np.concatenate([origins[:, ::-1], origins[:, ::-1] + tile_size], axis=1)
+    overlaps = ((boxes[:, None, 0] < tile_boxes[None, :, 2])
+                & (boxes[:, None, 2] > tile_boxes[None, :, 0])
+                & (boxes[:, None, 1] < tile_boxes[None, :, 3])
+                & (boxes[:, None, 3] > tile_boxes[None, :, 1]))
+    overlaps[np.arange(len(boxes)), tile_ids] = False
+    return overlaps.any(axis=1)
+
+
+def tiled_detections(predict, image, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP,
+                     batch_size=16, threshold=DEFAULT_MATCH_THRESHOLD, conf=None, iou=None,
+                     max_det=300):
+    """Run ``predict`` over the tiles of ``image`` and merge the detections.
+
+    ``predict`` takes a list of tiles and returns ultralytics results in the
+    same order. With ``conf``/``iou`` each tile's raw candidates go through
+    ``detections.greedy_nms`` first; without them the results are taken as
+    already suppressed. Returns ``(boxes, classes, confidences)`` in frame
+    coordinates.
+    """
+    from detections import greedy_nms
+
+    all_boxes, all_classes, all_scores, all_tiles, all_origins = [], [], [], [], []
+    tile_index = 0
+    for tiles, origins in iter_tile_batches(image, tile_size, overlap, batch_size):
+        all_origins.append(origins)
+        for result, (y, x) in zip(predict(tiles), origins):
+            det = result.boxes.cpu()
+            boxes = det.xyxy.numpy()
+            classes = det.cls.numpy().astype(np.int64)
+            scores = det.conf.numpy()
+            if conf is not None and len(det):
+                keep = np.sort(greedy_nms(boxes, classes, scores, conf, iou, max_det))
+                boxes, classes, scores = boxes[keep], classes[keep], scores[keep]
+            if len(boxes):
+                all_boxes.append(boxes + np.array([x, y, x, y], dtype=np.float32))
+                all_classes.append(classes)
+                all_scores.append(scores)
+                all_tiles.append(np.full(len(boxes), tile_index, dtype=np.int64))
+            tile_index += 1
+
+    if not all_boxes:
+        return (np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.float32))
+
+    boxes = np.concatenate(all_boxes)
+    classes = np.concatenate(all_classes)
+    scores = np.concatenate(all_scores)
+    tile_ids = np.concatenate(all_tiles)
+
+    keep = np.ones(len(boxes), dtype=bool)
+    candidates = np.flatnonzero(
+        seam_candidates(boxes, tile_ids, np.concatenate(all_origins), tile_size)
+    )
+    if len(candidates):
+        kept = cross_tile_suppress(boxes[candidates], scores[candidates],
+                                   classes[candidates], tile_ids[candidates], threshold)
+        keep[candidates] = False
+        keep[candidates[kept]] = True
+    return boxes[keep], classes[keep], scores[keep]
@@ -0,0 +1,296 @@
+"""Watch-folder ingestion: analyze images as the capture software writes them.
+
+Usage:
+    python watch_folder.py /srv/microscope/incoming
+    python watch_folder.py incoming/ --workers 4 --db results/spermai.db
+    python watch_folder.py incoming/ --once          # process what is there and exit
+
+New files are noticed through inotify (Linux) or, elsewhere and on network
+shares that do not deliver inotify events, by polling the directory. A file
+is analyzed once it is complete: inotify reports the writer closing it, or
+its size and mtime have not changed for ``--settle`` seconds.
+
+Every analyzed file becomes a row in the results database keyed by its
+absolute path (``source_file``). That row is the done-ledger: on restart,
+files that already have one are skipped, and rows are written with
+``INSERT OR IGNORE``, so re-processing after a crash cannot duplicate them.
+The counted detections of each new row go to the ``detection_store``.
+
+Only file metadata is kept for pending files; images are decoded
+``--batch-size`` at a time, so bursts of hundreds of files do not grow
+memory beyond one batch.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from analysis import DEFAULT_MODEL_PATH, SpermAnalyzer
+from backends import BACKENDS, DEFAULT_BACKEND
+from batch_analyze import IMAGE_EXTENSIONS, db_record, make_row
+from detection_store import DetectionStore, store_dir
+from results_db import DEFAULT_DB_PATH, ResultsDB
+
+# inotify(7) event bits
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+_EVENT = struct.Struct("iIII")
+
+
+def is_image(path):
+    return path.suffix.lower() in IMAGE_EXTENSIONS and not path.name.startswith(".")
+
+
+class InotifyWatcher:
+    """Yields ``(path, complete)`` for files created or written in a directory."""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.directory = Path(directory)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, os.fsencode(self.directory), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch")
+        self.overflowed = False
+
+    def poll(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; the caller rescans the directory
+                self.overflowed = True
+            elif name:
+                yield self.directory / os.fsdecode(name), bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Portable fallback: compares directory listings every ``interval`` seconds."""
+
+    def __init__(self, directory, interval=1.0):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.overflowed = False
+        # Files already present are the initial scan's job, not changes
+        self._seen = self._listing()
+
+    def _listing(self):
+        listing = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    listing[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return listing
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        current = self._listing()
+        changed = [path for path, stat in current.items() if self._seen.get(path) != stat]
+        self._seen = current
+        for path in changed:
+            yield Path(path), False
+
+    def close(self):
+        pass
+
+
+def make_watcher(directory, poll=False, interval=1.0):
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directory, interval)
+
+
+class FolderIngest:
+    """Tracks pending files until they are complete, then analyzes them in batches."""
+
+    def __init__(self, analyzer, db, directory, batch_size=8, settle=2.0, store=None):
+        self.analyzer = analyzer
+        self.db = db
+        # Counted detections of every recorded file, keyed by its row id
+        self.store = store if store is not None else DetectionStore(store_dir(db.path))
+        self.directory = Path(directory).resolve()
+        self.batch_size = batch_size
+        self.settle = settle
+        # path -> (size, mtime_ns, time the stat last changed, writer closed it)
+        self.pending = OrderedDict()
+        self.processed = 0
+        self.failed = set()
+
+    def scan(self):
+        """Queue every image in the directory that is not in the ledger yet."""
+        paths = sorted(p for p in self.directory.iterdir() if p.is_file() and is_image(p))
+        for start in range(0, len(paths), 1000):
+            chunk = paths[start:start + 1000]
+            known = self.db.known_sources(chunk)
+            for path in chunk:
+                if str(path) not in known:
+                    self.notice(path)
+
+    def notice(self, path, complete=False):
+        path = Path(path)
+        if not is_image(path) or path in self.failed:
+            return
+        previous = self.pending.get(path)
+        self.pending[path] = (None, None, time.monotonic(),
+                              complete or bool(previous and previous[3]))
+
+    def ready(self):
+        """Pending files that are complete, oldest first."""
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime, changed_at, closed) in list(self.pending.items()):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                self.pending[path] = (stat.st_size, stat.st_mtime_ns, now, closed)
+                if not closed:
+                    continue
+            if stat.st_size and (closed or now - changed_at >= self.settle):
+                ready.append(path)
+        return ready
+
+    def process(self, paths):
+        """Analyze ``paths`` batch by batch and record them; returns rows written."""
+        written = 0
+        for start in range(0, len(paths), self.batch_size):
+            batch = paths[start:start + self.batch_size]
+            known = self.db.known_sources(batch)
+            batch = [p for p in batch if str(p) not in known]
+            for path in paths[start:start + self.batch_size]:
+                self.pending.pop(path, None)
+            if not batch:
+                continue
+            try:
+                results = self.analyzer.analyze_batch([str(p) for p in batch])
+            except Exception:
+                # Analyze one by one so a single bad file does not block the rest
+                results = []
+                for path in batch:
+                    try:
+                        results.append(self.analyzer.analyze_batch([str(path)])[0])
+                    except Exception as e:
+                        print(f"Xatolik: {path.name}: {e}", file=sys.stderr)
+                        self.failed.add(path)
+                        results.append(None)
+            records = []
+            analyzed = []
+            for path, result in zip(batch, results):
+                if result is None:
+                    continue
+                analyzed.append(result)
+                row = make_row(path.name, *result.counts)
+                records.append({**db_record(path, row), "source": "watch",
+                                "source_file": str(path)})
+                print(f"{path.name}: trik {row['trik_pct']}%  o'lik {row['olik_pct']}%  "
+                      f"yetilmagan {row['yetilmagan_pct']}%  (jami {row['total']})")
+            ids = self.db.add_batch(records)
+            self.store.append_results(zip(ids, analyzed))
+            written += sum(analysis_id is not None for analysis_id in ids)
+        self.processed += written
+        return written
+
+    def step(self):
+        return self.process(self.ready())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Papkani kuzatib, yangi rasmlarni avtomatik tahlil qilish")
+    parser.add_argument("directory", help="Mikroskop rasmlari tushadigan papka")
+    parser.add_argument("--db", default=str(DEFAULT_DB_PATH), help="Natijalar bazasi (bajarilganlar ro'yxati ham)")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=sorted(BACKENDS))
+    parser.add_argument("--imgsz", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=0, help="Parallel inference jarayonlari (0 = bitta)")
+    parser.add_argument("--server", default=None, help="inference_server.py manzili, masalan http://127.0.0.1:8765")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="Fayl tugallangan deb hisoblanishi uchun o'zgarmasdan turishi kerak bo'lgan soniyalar")
+    parser.add_argument("--poll", action="store_true", help="inotify o'rniga so'rov (polling) rejimi")
+    parser.add_argument("--interval", type=float, default=1.0, help="Polling oralig'i (soniya)")
+    parser.add_argument("--once", action="store_true", help="Mavjud fayllarni tahlil qilib chiqish")
+    return parser.parse_args(argv)
+
+
+def make_analyzer(args):
+    predict_kwargs = {"imgsz": args.imgsz} if args.imgsz else {}
+    if args.server:
+        from inference_server import RemoteAnalyzer
+        return RemoteAnalyzer(args.server).load()
+    if args.workers:
+        from inference_pool import InferencePool
+        return InferencePool(args.model, args.backend, args.workers, **predict_kwargs).load()
+    return SpermAnalyzer(args.model, backend=args.backend, **predict_kwargs).load()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        print(f"Papka topilmadi: {directory}", file=sys.stderr)
+        return 1
+
+    analyzer = make_analyzer(args)
+    watcher = ingest = None
+    try:
+        with ResultsDB(args.db) as db, DetectionStore(store_dir(args.db)) as store:
+            ingest = FolderIngest(analyzer, db, directory, args.batch_size, args.settle, store)
+            ingest.scan()
+            if args.once:
+                ingest.process(list(ingest.pending))
+                print(f"Tahlil qilindi: {ingest.processed} ta rasm")
+                return 0
+
+            watcher = make_watcher(ingest.directory, args.poll, args.interval)
+            print(f"Kuzatilmoqda: {ingest.directory} ({type(watcher).__name__}), "
+                  f"navbatda {len(ingest.pending)} ta fayl")
+            while True:
+                for path, complete in watcher.poll(timeout=0.5):
+                    ingest.notice(path, complete)
+                if watcher.overflowed:
+                    watcher.overflowed = False
+                    ingest.scan()
+                ingest.step()
+    except KeyboardInterrupt:
+        print(f"\nTo'xtatildi. Tahlil qilindi: {ingest.processed if ingest else 0} ta rasm")
+        return 0
+    finally:
+        if watcher is not None:
+            watcher.close()
+        close = getattr(analyzer, "close", None)
+        if close is not None:
+            close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())